@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+BLE UART 服务器负载生成器
+使用进程内模拟的 BLE 后端运行 bless_uart_server，多个模拟客户端按设定速率写入 RX 特征，
+输出写入速率、写入回调耗时分位数、处理吞吐量和错误数，不需要蓝牙硬件。
+
+用法:
+    python3 ble_uart_loadgen.py --clients 8 --rate 100 --size 20 --duration 5 [服务器参数...]
+未识别的参数原样传给服务器，例如 --mode binary、--executor thread、--client-rate 50。
+指定 --transfer-size 时改为由一个模拟客户端通过批量传输发送一个随机文件，测量传输吞吐量并核对接收的文件：
+    python3 ble_uart_loadgen.py --transfer-size 1048576 [--transfer-dir DIR] [服务器参数...]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import bless_uart_server as srv
+from bluetooth_toolkit.fakeble import LoadGenerator
+from bluetooth_toolkit.protocol import Protocol
+from bluetooth_toolkit.transfer import DEFAULT_CHUNK_SIZE, TransferError, TransferSender
+
+def parse_args(argv=None):
+    """解析负载参数，返回 (负载参数, 服务器参数)"""
+    parser = argparse.ArgumentParser(description='BLE UART 服务器负载生成器（模拟后端）')
+    parser.add_argument('--clients', type=int, default=4, help='模拟客户端数')
+    parser.add_argument('--rate', type=float, default=100, help='每个客户端每秒写入次数，0表示尽可能快')
+    parser.add_argument('--size', type=int, default=20, help='每次写入的字节数')
+    parser.add_argument('--duration', type=float, default=5.0, help='写入持续时间（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='写入间隔的随机抖动比例（0-1）')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--drain-timeout', type=float, default=10.0, help='写入结束后等待服务器处理完的最长时间（秒）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+    parser.add_argument('--transfer-size', type=int, default=0,
+                        help='批量传输的文件长度（字节），指定时测量批量传输（隐含 --mode binary）而不是逐条写入')
+    parser.add_argument('--transfer-chunk', type=int, default=DEFAULT_CHUNK_SIZE, help='批量传输的数据块长度（字节）')
+    args, server_argv = parser.parse_known_args(argv)
+    if not any(arg.startswith('--log-level') for arg in server_argv):
+        server_argv = server_argv + ['--log-level', 'ERROR']  # 默认不让服务器日志干扰测量
+    if args.transfer_size:
+        server_argv = server_argv + ['--mode', 'binary']
+        if not any(arg.startswith('--transfer-dir') for arg in server_argv):
+            server_argv = server_argv + ['--transfer-dir', tempfile.mkdtemp(prefix='ble_uart_transfer_')]
+    server_args = srv.parse_args(server_argv + ['--backend', 'fake'])
+    return args, server_args
+
+def make_payload(args, server_args):
+    """按服务器的消息格式生成写入数据的函数"""
+    if server_args.mode == 'binary':
+        protocol = Protocol("ble_uart", checksum=server_args.checksum)
+        data_size = max(args.size - protocol.min_packet_size, 0)
+        return lambda client, seq: protocol.encode_packet(srv.CMD_ECHO, (b"%d:%d " % (client, seq) + b"x" * data_size)[:data_size])
+    return lambda client, seq: (b"%d:%d " % (client, seq) + b"x" * args.size)[:max(args.size, 1)]
+
+def print_report(result):
+    """输出测量结果"""
+    load, latency, status = result["load"], result["load"]["latency"], result["server"]
+    print(f"客户端: {load['clients']}, 写入: {load['sent']} 次 / {load['elapsed']:.2f} 秒 "
+          f"= {load['writes_per_second']:,.0f} 次/秒")
+    print(f"接受: {load['accepted']}, 拒绝: {load['rejected']}, 异常: {load['errors']}")
+    print(f"写入回调耗时 p50: {latency['p50'] * 1e6:.1f} us, p90: {latency['p90'] * 1e6:.1f} us, "
+          f"p99: {latency['p99'] * 1e6:.1f} us, 最大: {latency['max'] * 1e6:.1f} us")
+    print(f"处理完成: {result['processed']} 条 / {result['processing_time']:.2f} 秒 "
+          f"= {result['processed_per_second']:,.0f} 条/秒，未处理: {result['unprocessed']}")
+    print(f"通知: {result['backend']['notifications']} 次, {result['backend']['notify_bytes']} 字节")
+    errors = ", ".join(f"{reason}={count}" for reason, count in sorted(status["errors"].items())) or "无"
+    print(f"服务器错误: {errors}")
+
+def print_transfer_report(result):
+    """输出批量传输的测量结果"""
+    transfer, sender = result["transfer"], result["transfer"]["sender"]
+    print(f"批量传输: {transfer['size']} 字节 / {transfer['elapsed']:.2f} 秒 "
+          f"= {transfer['bytes_per_second'] / 1024:,.1f} KiB/秒，结果: {transfer['status']}")
+    print(f"数据块: {sender['chunks_sent']} 个，等待信用: {sender['credit_stalls']} 次，"
+          f"重发: {sender['resent']} 字节，写入被拒绝: {transfer['rejected']} 次")
+    print(f"接收文件: {transfer['path']}，内容一致: {'是' if transfer['verified'] else '否'}")
+    print(f"通知: {result['backend']['notifications']} 次, {result['backend']['notify_bytes']} 字节")
+
+async def run_transfer(server, args, server_args):
+    """一个模拟客户端通过批量传输发送一个随机文件，返回吞吐量和核对结果"""
+    address = "SIM:XFER"
+    protocol = Protocol("ble_uart", checksum=server_args.checksum)
+    decoder = protocol.create_stream_decoder()
+    rejected = 0
+
+    async def write(frame):
+        nonlocal rejected
+        if await server.write(srv.NUS_RX_CHARACTERISTIC_UUID, frame, address) is False:
+            rejected += 1
+
+    def on_notify(data):
+        for command_id, payload in decoder.feed(data):
+            sender.feed_frame(command_id, payload)
+
+    sender = TransferSender(protocol, write, chunk_size=args.transfer_chunk)
+    server.subscribe(on_notify)
+    data = random.Random(args.seed).randbytes(args.transfer_size)
+    name = f"loadgen-{args.seed}.bin"
+    path = os.path.join(server_args.transfer_dir, name)
+    await server.connect(address)
+    start = time.perf_counter()
+    try:
+        await sender.send(data, name)
+        status = "ok"
+    except TransferError as e:
+        status = str(e)
+    elapsed = time.perf_counter() - start
+    await server.disconnect(address)
+    verified = os.path.exists(path) and open(path, "rb").read() == data
+    return {"size": len(data), "elapsed": elapsed, "bytes_per_second": len(data) / elapsed, "status": status,
+            "rejected": rejected, "path": path, "verified": verified, "sender": sender.get_stats()}
+
+async def run(args, server_args):
+    """运行服务器和负载，返回测量结果"""
+    result = {}
+
+    async def on_started(server):
+        try:
+            if args.transfer_size:
+                result["transfer"] = await run_transfer(server, args, server_args)
+                return
+            load = LoadGenerator(server, srv.NUS_RX_CHARACTERISTIC_UUID, clients=args.clients, rate=args.rate,
+                                 duration=args.duration, payload=make_payload(args, server_args), size=args.size,
+                                 jitter=args.jitter, seed=args.seed, disconnect=False)
+            start = time.perf_counter()
+            result["load"] = await load.run()
+            result["unprocessed"] = await srv.connection_manager.drain(args.drain_timeout)
+            result["processing_time"] = time.perf_counter() - start
+            result["processed"] = sum(session.processed for session in srv.connection_manager.sessions.values())
+            result["processed_per_second"] = result["processed"] / result["processing_time"]
+            await load.close()
+        finally:
+            srv.request_shutdown()
+
+    await srv.main(server_args, on_started)
+    result["server"] = srv.server_status.get_stats()
+    result["backend"] = srv.server.get_stats()
+    result["tx"] = srv.tx_queue.get_stats()
+    return result
+
+def main(argv=None):
+    """主函数"""
+    args, server_args = parse_args(argv)
+    srv.log_pipeline = srv.setup_logging(server_args)
+    try:
+        result = asyncio.run(run(args, server_args))
+    finally:
+        srv.log_pipeline.stop()
+    if "load" not in result and "transfer" not in result:
+        print("服务器未能启动")
+        return 1
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif "transfer" in result:
+        print_transfer_report(result)
+    else:
+        print_report(result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,26 +4,49 @@
 实现 Nordic UART Service (NUS)
 """
 
+import argparse
 import asyncio
+import fcntl
 import logging
+import os
 import signal
+import socket
+import struct
 import sys
 import time
 import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Dict, Any
-from bless import BlessServer, BlessGATTCharacteristic, BlessGATTService, GATTCharacteristicProperties, GATTAttributePermissions
-from bless.exceptions import BlessError
-
-# 设置日志
-logging.basicConfig(
-    level=logging.DEBUG,  # 生产环境使用 INFO，调试时改为 DEBUG
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('ble_uart.log')  # 添加文件日志
-    ]
-)
+try:
+    from bless import BlessServer, BlessGATTCharacteristic, GATTCharacteristicProperties, GATTAttributePermissions
+except ImportError:  # 未安装 bless 时只能使用 --backend fake
+    BlessServer = None
+    from bluetooth_toolkit.fakeble import FakeCharacteristic as BlessGATTCharacteristic
+    from bluetooth_toolkit.fakeble import GATTAttributePermissions, GATTCharacteristicProperties
+
+from bluetooth_toolkit.capture import DIRECTION_RX, DIRECTION_TX
+from bluetooth_toolkit.channel import DATA_HEADER_SIZE as CHANNEL_DATA_HEADER_SIZE
+from bluetooth_toolkit.channel import DEFAULT_WINDOW as DEFAULT_CHANNEL_WINDOW
+from bluetooth_toolkit.channel import ChannelClosedError, ChannelMux
+from bluetooth_toolkit.checksum import CHECKSUMS
+from bluetooth_toolkit.exporter import DEFAULT_HOST, MetricsExporter
+from bluetooth_toolkit.fakeble import FakeBlessServer
+from bluetooth_toolkit.logqueue import DEFAULT_DATEFMT, DEFAULT_FORMAT, QueueLogging, TrafficLog
+from bluetooth_toolkit.metrics import LatencyHistogram, RateCounter, histogram_samples
+from bluetooth_toolkit.notify import (DEFAULT_MAX_BATCH, DEFAULT_MAX_SIZE, POLICIES, POLICY_BLOCK,
+                                      NotificationQueue)
+from bluetooth_toolkit.pipeline import Pipeline, StageRejected
+from bluetooth_toolkit.protocol import (DISPATCH_HEADER, MAX_DATA_LENGTH, OFFLOAD_CPU, OFFLOAD_IO, Protocol,
+                                        ProtocolHandler)
+from bluetooth_toolkit.ratelimit import TokenBucket
+from bluetooth_toolkit.schema import Schema
+from bluetooth_toolkit.segment import ATT_HEADER_SIZE, DEFAULT_MTU, SEGMENT_HEADER_SIZE, Reassembler, Segmenter
+from bluetooth_toolkit.transfer import DEFAULT_MAX_SIZE as DEFAULT_TRANSFER_MAX_SIZE
+from bluetooth_toolkit.transfer import DEFAULT_WINDOW as DEFAULT_TRANSFER_WINDOW
+from bluetooth_toolkit.transfer import MAX_WINDOW as MAX_TRANSFER_WINDOW
+from bluetooth_toolkit.transfer import TransferReceiver
+
 logger = logging.getLogger(__name__)
 
 # 定义 Nordic UART Service (NUS) UUIDs
@@ -33,47 +56,336 @@ NUS_TX_CHARACTERISTIC_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"  # 用于服
 
 # 全局变量
 server = None
-running = True
+running = True  # 是否接受新的写入，请求关闭后为 False
+shutdown_event = None  # 请求关闭时设置，在 main 中创建
 connection_manager = None # Make connection_manager global or pass it
 server_status = None # Make server_status global or pass it
+tx_queue = None  # TX 通知发送队列
+pipeline = None  # 消息处理流水线（文本模式）
+protocol_handler = None  # 帧协议处理器（二进制模式）
+log_pipeline = None  # 非阻塞日志管线
+traffic_log = None  # 二进制流量日志，None表示不记录
+transfer_args = None  # 批量传输接收参数（binary 模式且指定 --transfer-dir 时）
+channel_args = None  # 逻辑通道复用器参数（binary 模式且指定 --channels 时）
+segmenter = None  # 回复分段器（binary 模式且指定 --segments 时），写入按会话重组
+max_write = 512  # 单次写入的最大字节数
+
+DEFAULT_CLIENT = "default"  # 写入请求未携带客户端地址时使用的会话
+REJECT_THROTTLED = "throttled"  # 超出客户端速率限制
+REJECT_BUFFER_FULL = "client_buffer_full"  # 客户端接收缓冲已满
+REJECT_SHUTTING_DOWN = "shutting_down"  # 服务器正在关闭
+
+# 二进制模式的命令ID
+CMD_ECHO = 0x01  # 原样返回数据负载
+CMD_STATUS = 0x02  # 查询服务器状态
+STATUS_SCHEMA = Schema("ServerStatusReply", [
+    ("uptime", "u32"), ("requests", "u32"), ("messages", "u32"), ("errors", "u32"), ("clients", "u16"),
+])
+
+def get_client_address(kwargs):
+    """从写入回调的参数中取出客户端地址，取不到时返回 DEFAULT_CLIENT"""
+    options = kwargs.get("options") or {}
+    device = options.get("device") or kwargs.get("device") or kwargs.get("client_address")
+    return str(device) if device else DEFAULT_CLIENT
+
+def get_client_mtu(kwargs):
+    """从写入回调的参数中取出协商的 ATT MTU（BlueZ 在写入选项中提供），取不到时返回 None"""
+    options = kwargs.get("options") or {}
+    mtu = options.get("mtu") or kwargs.get("mtu")
+    return int(mtu) if mtu else None
+
+class ClientSession:
+    """单个客户端的会话：接收缓冲、令牌桶和统计"""
+    def __init__(self, address, rate=0, burst=None, max_pending=64):
+        self.address = address
+        self.connected_at = time.time()
+        self.pending = deque()  # 待处理的消息
+        self.max_pending = max_pending
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None  # None表示不限速
+        self.message_rate = RateCounter()
+        self.byte_rate = RateCounter()
+        self.scheduled = False  # 是否在调度队列中
+        self.closed = False
+        self.channel = 0  # 流量日志中的通道号
+        self.decoder = None  # 二进制模式的流式解码器，首条消息时创建
+        self.transfers = None  # 批量传输接收端，启用时与解码器一同创建
+        self.channels = None  # 逻辑通道复用器，启用时与解码器一同创建
+        self.channel_task = None  # 接受客户端打开的通道的任务
+        self.reassembler = None  # 分段重组器（--segments 时），首条消息时创建
+
+        # 统计计数
+        self.messages = 0  # 接收的消息数
+        self.bytes = 0  # 接收的字节数
+        self.processed = 0  # 已处理的消息数
+        self.throttled = 0  # 超出速率限制被拒绝的消息数
+        self.overflows = 0  # 接收缓冲已满被拒绝的消息数
+
+    def get_stats(self):
+        return {
+            "connected_for": time.time() - self.connected_at,
+            "pending": len(self.pending),
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "processed": self.processed,
+            "throttled": self.throttled,
+            "overflows": self.overflows,
+            "messages_per_second": self.message_rate.rate(),
+            "bytes_per_second": self.byte_rate.rate(),
+            "tokens": self.bucket.get_stats()["tokens"] if self.bucket else None,
+            "decoder": {
+                "pending": self.decoder.pending,
+                "frames": self.decoder.frames_decoded,
+                "bytes_discarded": self.decoder.bytes_discarded,
+                "checksum_errors": self.decoder.checksum_errors,
+            } if self.decoder is not None else None,
+            "transfers": self.transfers.get_stats() if self.transfers is not None else None,
+            "channels": self.channels.get_stats() if self.channels is not None else None,
+        }
+
+    async def close_services(self):
+        """关闭批量传输和逻辑通道，清理出错只记录日志"""
+        if self.transfers is not None:
+            try:
+                await self.transfers.close()  # 记录续传偏移，重新连接后可继续
+            except Exception as e:
+                logger.error(f"关闭客户端 {self.address} 的批量传输时出错: {e}")
+        if self.channels is not None:
+            try:
+                await self.channels.close()  # 通知客户端各通道已关闭，接受通道的任务随之结束
+            except Exception as e:
+                logger.error(f"关闭客户端 {self.address} 的逻辑通道时出错: {e}")
 
 class ConnectionManager:
-    """连接管理器"""
-    def __init__(self):
-        self.connected_clients = set()
-        self._lock = asyncio.Lock()
+    """
+    连接管理器
+
+    每个客户端一个会话。消息先进入各自会话的接收缓冲，由调度任务按客户端轮询处理，
+    每轮每个客户端处理一条，发送频繁的客户端不会让其他客户端排在它的积压之后。
+    不同客户端的消息最多 max_inflight 条同时处理，同一客户端同一时刻只处理一条，保证顺序。
+    只在事件循环线程中访问，不需要加锁。
+    """
+    def __init__(self, process=None, rate=0, burst=None, max_pending=64, max_inflight=1):
+        """
+        参数:
+            process: 处理一条消息的协程函数 process(session, value)
+            rate: 每个客户端每秒允许的消息数，0表示不限速
+            burst: 允许的突发消息数，None表示等于 rate
+            max_pending: 每个客户端接收缓冲的最大消息数
+            max_inflight: 同时处理的最大消息数（来自不同客户端）
+        """
+        self.sessions = {}  # 客户端地址 -> ClientSession
+        self.process = process
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self._ready = deque()  # 有待处理消息的会话，轮询处理
+        self._wakeup = None  # 首次提交时在事件循环中创建
+        self._idle = None  # drain 等待时创建，每条消息处理完后设置
+        self._task = None
+        self._inflight = set()  # 正在处理消息的任务
+        self._channels = 0  # 最近分配的流量日志通道号
+
+    @property
+    def connected_clients(self):
+        return set(self.sessions)
+
+    def _session(self, client_address):
+        """获取客户端会话，不存在时创建"""
+        session = self.sessions.get(client_address)
+        if session is None:
+            session = ClientSession(client_address, self.rate, self.burst, self.max_pending)
+            self._channels = self._channels % 255 + 1
+            session.channel = self._channels
+            self.sessions[client_address] = session
+        return session
 
     async def add_client(self, client_address):
-        async with self._lock:
-            self.connected_clients.add(client_address)
-            logger.info(f"客户端已连接: {client_address}, 当前连接数: {len(self.connected_clients)}")
+        self._session(client_address)
+        logger.info(f"客户端已连接: {client_address}, 当前连接数: {len(self.sessions)}")
 
     async def remove_client(self, client_address):
-        async with self._lock:
-            self.connected_clients.discard(client_address)
-            logger.info(f"客户端已断开: {client_address}, 当前连接数: {len(self.connected_clients)}")
+        session = self.sessions.pop(client_address, None)
+        if session is not None:
+            session.closed = True
+            if session.pending:
+                logger.warning(f"客户端 {client_address} 断开时丢弃 {len(session.pending)} 条未处理消息")
+                session.pending.clear()
+            await session.close_services()
+        logger.info(f"客户端已断开: {client_address}, 当前连接数: {len(self.sessions)}")
 
     def is_connected(self, client_address):
-        return client_address in self.connected_clients
+        return client_address in self.sessions
+
+    def submit(self, client_address, value):
+        """
+        将消息放入客户端的接收缓冲，等待调度处理
+
+        返回:
+            None表示已接受，否则为拒绝原因 REJECT_THROTTLED 或 REJECT_BUFFER_FULL
+        """
+        session = self._session(client_address)
+        if session.bucket is not None and not session.bucket.consume():
+            session.throttled += 1
+            return REJECT_THROTTLED
+        if len(session.pending) >= session.max_pending:
+            session.overflows += 1
+            return REJECT_BUFFER_FULL
+        session.pending.append(bytes(value))
+        session.messages += 1
+        session.bytes += len(value)
+        now = time.monotonic()
+        session.message_rate.record(1, now)
+        session.byte_rate.record(len(value), now)
+        if not session.scheduled:
+            session.scheduled = True
+            self._ready.append(session)
+            self._wake()
+        return None
+
+    def _wake(self):
+        """唤醒调度任务，必要时启动"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        """调度任务：按客户端轮询，每轮每个客户端取出一条消息交给处理任务"""
+        while True:
+            if not self._ready or len(self._inflight) >= self.max_inflight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            session = self._ready.popleft()
+            if session.closed or not session.pending:
+                session.scheduled = False
+                if self._idle is not None:
+                    self._idle.set()
+                continue
+            self._inflight.add(asyncio.ensure_future(self._process_one(session, session.pending.popleft())))
+
+    async def _process_one(self, session, value):
+        """处理一条消息，完成后该客户端的下一条消息才重新参与轮询"""
+        try:
+            await self.process(session, value)
+        except Exception as e:
+            logger.error("处理客户端 %s 的消息时出错: %s", session.address, e)
+        finally:
+            self._inflight.discard(asyncio.current_task())
+            session.processed += 1
+            if session.pending and not session.closed:
+                self._ready.append(session)
+            else:
+                session.scheduled = False
+            self._wakeup.set()
+            if self._idle is not None:
+                self._idle.set()
+
+    @property
+    def pending(self):
+        """所有客户端接收缓冲中待处理的消息数"""
+        return sum(len(session.pending) for session in self.sessions.values())
+
+    async def drain(self, timeout=None):
+        """
+        等待已接受的消息处理完
+
+        参数:
+            timeout: 最长等待时间（秒），None表示不限
+
+        返回:
+            超时时仍未处理完的消息数（含正在处理的）
+        """
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._ready or self._inflight:
+            self._idle.clear()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._idle.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self.pending + len(self._inflight)
+
+    async def stop(self):
+        """停止调度任务，等待正在处理的消息完成，未处理的消息被丢弃"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def get_stats(self):
+        return {address: session.get_stats() for address, session in self.sessions.items()}
+
+    def to_prometheus(self, prefix="ble_uart"):
+        """按客户端导出Prometheus文本格式"""
+        lines = []
+        for name, kind, help_text, value in (
+            ("client_messages_total", "counter", "客户端接收的消息数", lambda s: s.messages),
+            ("client_bytes_total", "counter", "客户端接收的字节数", lambda s: s.bytes),
+            ("client_processed_total", "counter", "客户端已处理的消息数", lambda s: s.processed),
+            ("client_throttled_total", "counter", "客户端超出速率限制被拒绝的消息数", lambda s: s.throttled),
+            ("client_overflows_total", "counter", "客户端接收缓冲已满被拒绝的消息数", lambda s: s.overflows),
+            ("client_pending", "gauge", "客户端待处理的消息数", lambda s: len(s.pending)),
+            ("client_messages_per_second", "gauge", "客户端滑动窗口内的消息速率", lambda s: s.message_rate.rate()),
+            ("client_transfer_bytes_total", "counter", "客户端批量传输写入的字节数",
+             lambda s: s.transfers.bytes_received if s.transfers is not None else 0),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for address, session in self.sessions.items():
+                lines.append(f'{prefix}_{name}{{client="{address}"}} {value(session)}')
+        return "\n".join(lines) + "\n"
 
 class ServerStatus:
-    """服务器状态监控"""
-    def __init__(self):
+    """
+    服务器状态监控
+
+    只在事件循环线程中更新，计数器为普通整数，不加锁；
+    速率按滑动窗口统计，处理耗时记录在直方图中。
+    """
+    def __init__(self, rate_window=10):
         self.start_time = None
-        self.total_messages = 0
+        self.total_requests = 0  # 写入请求数（含被拒绝的）
+        self.total_messages = 0  # 通过校验的消息数
+        self.total_bytes = 0  # 通过校验的消息字节数
         self.error_count = 0
-        self._lock = asyncio.Lock()
+        self.errors = {}  # 错误原因 -> 次数
+        self.message_rate = RateCounter(rate_window)
+        self.byte_rate = RateCounter(rate_window)
+        self.latency = LatencyHistogram()  # 写入请求处理耗时
+        self.startup = {}  # 启动阶段 -> 耗时（秒），total 为从进入 main 到开始广播
 
-    async def start(self):
+    def start(self):
         self.start_time = time.time()
 
-    async def record_message(self):
-        async with self._lock:
-            self.total_messages += 1
+    def record_request(self, seconds):
+        """记录一次写入请求及其处理耗时（秒）"""
+        self.total_requests += 1
+        self.latency.record(seconds)
 
-    async def record_error(self):
-        async with self._lock:
-            self.error_count += 1
+    def record_message(self, size):
+        """记录一条通过校验的消息"""
+        self.total_messages += 1
+        self.total_bytes += size
+        now = time.monotonic()
+        self.message_rate.record(1, now)
+        self.byte_rate.record(size, now)
+
+    def record_error(self, reason="other"):
+        """按原因记录一次错误"""
+        self.error_count += 1
+        self.errors[reason] = self.errors.get(reason, 0) + 1
 
     def get_uptime(self):
         if self.start_time:
@@ -83,253 +395,676 @@ class ServerStatus:
     def get_stats(self):
         return {
             "uptime": self.get_uptime(),
+            "total_requests": self.total_requests,
             "total_messages": self.total_messages,
-            "error_rate": self.error_count / self.total_messages if self.total_messages > 0 else 0
+            "total_bytes": self.total_bytes,
+            "messages_per_second": self.message_rate.rate(),
+            "bytes_per_second": self.byte_rate.rate(),
+            "errors": dict(self.errors),
+            # 出错的写入请求占全部写入请求的比例
+            "error_ratio": self.error_count / self.total_requests if self.total_requests > 0 else 0,
+            "latency": self.latency.snapshot(),
+            "startup": dict(self.startup),
         }
 
-async def check_prerequisites():
-    """检查运行前提条件"""
+    def to_prometheus(self, prefix="ble_uart"):
+        """导出为Prometheus文本格式"""
+        lines = [
+            f"# HELP {prefix}_uptime_seconds 服务器运行时间（秒）",
+            f"# TYPE {prefix}_uptime_seconds gauge",
+            f"{prefix}_uptime_seconds {self.get_uptime()}",
+            f"# HELP {prefix}_requests_total 写入请求数",
+            f"# TYPE {prefix}_requests_total counter",
+            f"{prefix}_requests_total {self.total_requests}",
+            f"# HELP {prefix}_messages_total 通过校验的消息数",
+            f"# TYPE {prefix}_messages_total counter",
+            f"{prefix}_messages_total {self.total_messages}",
+            f"# HELP {prefix}_received_bytes_total 通过校验的消息字节数",
+            f"# TYPE {prefix}_received_bytes_total counter",
+            f"{prefix}_received_bytes_total {self.total_bytes}",
+            f"# HELP {prefix}_messages_per_second 滑动窗口内的消息速率",
+            f"# TYPE {prefix}_messages_per_second gauge",
+            f"{prefix}_messages_per_second {self.message_rate.rate()}",
+            f"# HELP {prefix}_bytes_per_second 滑动窗口内的字节速率",
+            f"# TYPE {prefix}_bytes_per_second gauge",
+            f"{prefix}_bytes_per_second {self.byte_rate.rate()}",
+            f"# HELP {prefix}_errors_total 按原因统计的错误数",
+            f"# TYPE {prefix}_errors_total counter",
+        ]
+        lines.extend(f'{prefix}_errors_total{{reason="{reason}"}} {count}' for reason, count in sorted(self.errors.items()))
+        lines.append(f"# HELP {prefix}_startup_seconds 各启动阶段耗时（秒），total 为启动到开始广播")
+        lines.append(f"# TYPE {prefix}_startup_seconds gauge")
+        lines.extend(f'{prefix}_startup_seconds{{phase="{phase}"}} {seconds}' for phase, seconds in self.startup.items())
+        lines.append(f"# HELP {prefix}_request_seconds 写入请求处理耗时（秒）")
+        lines.append(f"# TYPE {prefix}_request_seconds histogram")
+        lines.extend(histogram_samples(f"{prefix}_request_seconds", self.latency))
+        return "\n".join(lines) + "\n"
+
+# HCI ioctl，用于不启动 hciconfig 子进程直接查询控制器状态
+AF_BLUETOOTH = getattr(socket, "AF_BLUETOOTH", 31)
+BTPROTO_HCI = getattr(socket, "BTPROTO_HCI", 1)
+HCIGETDEVINFO = 0x800448D3  # _IOR('H', 211, int)
+HCI_DEV_INFO = struct.Struct("=H8s6sI")  # struct hci_dev_info 的开头：dev_id, name, bdaddr, flags
+HCI_DEV_INFO_SIZE = 92  # struct hci_dev_info 的总长度
+HCI_UP = 1 << 0
+HCI_RUNNING = 1 << 2
+SYSFS_BLUETOOTH = "/sys/class/bluetooth"
+
+def check_prerequisites():
+    """
+    检查运行前提条件：至少有一个蓝牙控制器处于 UP RUNNING 状态
+
+    通过 sysfs 列出控制器，再用 HCIGETDEVINFO ioctl 读取状态标志，
+    不启动 hciconfig 子进程，耗时在毫秒以内
+    """
     try:
-        # 检查蓝牙控制器状态
-        logger.debug("检查蓝牙控制器状态...")
-        result = await asyncio.create_subprocess_shell(
-            "hciconfig",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await result.communicate()
-
-        if result.returncode != 0:
-            logger.error(f"hciconfig 命令失败，返回码: {result.returncode}, 错误: {stderr.decode()}")
-            return False
-
-        if b"UP RUNNING" not in stdout:
-            logger.error("蓝牙控制器未启动或未运行。请使用 'sudo hciconfig hci0 up' 启动。")
-            return False
-
-        logger.debug("蓝牙控制器检查通过。")
-        return True
-    except Exception as e:
-        logger.error(f"前提条件检查失败: {e}")
-        traceback.print_exc()
+        adapters = sorted(name for name in os.listdir(SYSFS_BLUETOOTH) if name.startswith("hci") and name[3:].isdigit())
+    except OSError:
+        adapters = []
+    if not adapters:
+        logger.error("未找到蓝牙控制器")
         return False
+    try:
+        with socket.socket(AF_BLUETOOTH, socket.SOCK_RAW, BTPROTO_HCI) as sock:
+            for name in adapters:
+                request = bytearray(HCI_DEV_INFO_SIZE)
+                HCI_DEV_INFO.pack_into(request, 0, int(name[3:]), b"", b"", 0)
+                fcntl.ioctl(sock.fileno(), HCIGETDEVINFO, request)
+                flags = HCI_DEV_INFO.unpack_from(request)[3]
+                if flags & HCI_UP and flags & HCI_RUNNING:
+                    logger.debug(f"蓝牙控制器检查通过: {name}")
+                    return True
+    except OSError as e:
+        logger.error(f"读取蓝牙控制器状态失败: {e}")
+        return False
+    logger.error(f"蓝牙控制器未启动或未运行。请使用 'sudo hciconfig {adapters[0]} up' 启动。")
+    return False
 
-def signal_handler(sig, frame):
-    """处理信号"""
-    global running, server
-    logger.info("正在关闭服务器...")
+def request_shutdown():
+    """请求关闭服务器：停止接受新的写入并唤醒主协程"""
+    global running
+    if running:
+        logger.info("正在关闭服务器...")
     running = False
+    shutdown_event.set()
 
 # Define the write request handler function, now accepting characteristic as argument
 async def handle_write_request(characteristic: BlessGATTCharacteristic, value: bytearray, **kwargs):
     """处理从客户端接收到的数据"""
-    global server_status # Access global server_status
+    global server_status, tx_queue # Access global server_status
 
-    logger.debug(f"收到写入请求到特征 {characteristic.uuid}: {value}")
+    # 写入处理在事件循环中，日志使用延迟格式化，完整数据见 --traffic-log
+    logger.debug("收到写入请求到特征 %s: %d 字节", characteristic.uuid, len(value))
 
     # Check if the write is for the RX characteristic
     if characteristic.uuid == NUS_RX_CHARACTERISTIC_UUID:
+        start = time.perf_counter()
         try:
+            # 正在关闭时不再接受新的消息
+            if not running:
+                server_status.record_error(REJECT_SHUTTING_DOWN)
+                return False
+
             # 数据验证
             if not value:
                 logger.warning("收到空数据")
-                await server_status.record_error()
+                server_status.record_error("empty")
                 return False
 
-            # 假设最大数据长度为 512 字节
-            if len(value) > 512:
-                logger.warning(f"数据过长: {len(value)} bytes")
-                await server_status.record_error()
+            # 单次写入的最大长度，默认为 ATT 属性值上限 512 字节
+            if len(value) > max_write:
+                logger.warning("数据过长: %d bytes", len(value))
+                server_status.record_error("too_long")
                 return False
 
-            # 记录消息
-            await server_status.record_message()
-
-            message = value.decode('utf-8', errors='ignore')
-            logger.info(f"收到消息: {message}")
-
-            if not message.strip():
-                logger.warning("收到空消息")
-                await server_status.record_error()
+            # 放入该客户端的接收缓冲，由调度任务按客户端轮询处理
+            client_address = get_client_address(kwargs)
+            reason = connection_manager.submit(client_address, value)
+            if traffic_log is not None and segmenter is None:  # 分段的写入在重组后记录
+                traffic_log.record(DIRECTION_RX, value, connection_manager.sessions[client_address].channel)
+            # 通知广播给所有订阅者，合并长度按已报告的最小 MTU 收紧
+            if tx_queue.max_batch:
+                mtu = get_client_mtu(kwargs)
+                if mtu is not None and mtu - ATT_HEADER_SIZE < tx_queue.max_batch:
+                    tx_queue.max_batch = max(mtu - ATT_HEADER_SIZE, 0)
+                    logger.info("客户端 %s 的 MTU 为 %d，TX 合并长度降为 %d", client_address, mtu, tx_queue.max_batch)
+            if reason is not None:
+                logger.warning("拒绝客户端 %s 的消息: %s", client_address, reason)
+                server_status.record_error(reason)
                 return False
 
-            # --- 您可以在这里处理收到的自定义信息 ---
-            # 例如，根据收到的信息执行某些操作
-            # 如果需要发送回复，可以使用 server.update_value 或 server.send_notification
-
-            # 示例：收到数据后，发送一个简单的回复 (通过 TX 特征发送通知)
-            # 获取 TX 特征对象
-            tx_characteristic = server.get_characteristic(NUS_TX_CHARACTERISTIC_UUID)
-            if tx_characteristic:
-                response = f"Echo: {message}".encode('utf-8') # 将回复编码回字节
-                # update_value 会更新特征的本地值，send_notification 会发送通知给已订阅的客户端
-                # 对于通知，通常只需要 update_value，订阅的客户端会自动收到新的值
-                try:
-                     # Use asyncio.timeout for sending notification as well
-                    async with asyncio.timeout(5.0):
-                        await server.update_value(NUS_TX_CHARACTERISTIC_UUID, response)
-                        logger.info(f"已发送回复: {response.decode('utf-8', errors='ignore')}")
-                except asyncio.TimeoutError:
-                    logger.error("发送响应超时")
-                    await server_status.record_error()
-                    return False # Indicate failure to the client if response sending fails
-            else:
-                 logger.warning("TX 特征不可用，无法发送回复")
-                 await server_status.record_error()
-                 return False # Indicate failure to the client if TX characteristic is missing
-
-
+            # 记录消息
+            server_status.record_message(len(value))
             return True # 返回 True 表示写入成功
         except Exception as e:
-            logger.error(f"处理写入数据时出错: {e}")
-            traceback.print_exc()
-            await server_status.record_error()
+            logger.exception("处理写入数据时出错: %s", e)
+            server_status.record_error("exception")
             return False # 返回 False 表示处理失败
+        finally:
+            server_status.record_request(time.perf_counter() - start)
     else:
-        logger.warning(f"收到写入请求到未知特征: {characteristic.uuid}")
-        await server_status.record_error()
+        logger.warning("收到写入请求到未知特征: %s", characteristic.uuid)
+        server_status.record_error("unknown_characteristic")
         return False # Indicate failure for writes to other characteristics
 
+# --- 消息处理流水线的各阶段：decode -> validate -> handle -> respond ---
+# decode/handle 是模块级函数，可以按 --executor 在线程池或进程池中执行；
+# validate/respond 访问服务器状态，在事件循环中执行
 
-async def main():
-    """主函数，设置并运行 BLE 服务器"""
-    global running, server, connection_manager, server_status # Declare global variables
+def decode_message(value):
+    """将收到的字节解码为字符串"""
+    return value.decode('utf-8', errors='ignore')
 
-    # 创建状态管理器
-    connection_manager = ConnectionManager()
-    server_status = ServerStatus()
+def validate_message(message):
+    """校验消息内容"""
+    logger.info("收到消息: %s", message)
+    if not message.strip():
+        logger.warning("收到空消息")
+        raise StageRejected("blank")
+    return message
 
-    # 设置信号处理器
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+def handle_message(message):
+    """
+    业务处理，返回回复内容，返回None表示不回复
 
-    # 检查前提条件
-    if not await check_prerequisites():
-        logger.error("前提条件检查失败，程序退出")
-        return
+    --- 您可以在这里处理收到的自定义信息 ---
+    例如，根据收到的信息执行某些操作；CPU 密集的处理使用 --executor process 在多核上并行
+    """
+    # 示例：收到数据后，发送一个简单的回复 (通过 TX 特征发送通知)
+    return f"Echo: {message}".encode('utf-8') # 将回复编码回字节
 
-    logger.info("正在创建 BLE 服务器...")
+async def respond(response):
+    """将回复交给 TX 发送任务，不等待通知发出"""
+    # 获取 TX 特征对象
+    if not server.get_characteristic(NUS_TX_CHARACTERISTIC_UUID):
+        logger.warning("TX 特征不可用，无法发送回复")
+        raise StageRejected("no_tx")
+    if not await tx_queue.put(response):
+        logger.warning("TX 队列已满，丢弃回复")
+        raise StageRejected("tx_dropped")
+    return None
+
+def build_pipeline(executor, pool_size):
+    """
+    按执行器类型创建消息处理流水线
+
+    参数:
+        executor: decode/handle 阶段的执行方式：none 在事件循环中，thread 在线程池中，process 在进程池中
+        pool_size: 线程池/进程池大小，None表示使用 CPU 核数
+    """
+    offload = {"none": None, "thread": OFFLOAD_IO, "process": OFFLOAD_CPU}[executor]
+    result = Pipeline("ble_uart")
+    result.add_stage("decode", decode_message, offload)
+    result.add_stage("validate", validate_message)
+    result.add_stage("handle", handle_message, offload)
+    result.add_stage("respond", respond)
+    if executor == "thread":
+        result.set_executors(io_executor=ThreadPoolExecutor(pool_size, thread_name_prefix="ble_uart"))
+    elif executor == "process":
+        result.set_executors(cpu_executor=ProcessPoolExecutor(pool_size))
+    return result
+
+async def process_message(session, value):
+    """处理一条客户端消息，由 ConnectionManager 的调度任务调用"""
+    try:
+        await pipeline.run(value)
+    except StageRejected as e:
+        server_status.record_error(e.reason)
+
+# --- 二进制模式：RX 字节流按帧增量解码，按命令ID分发，响应编码为帧后放入 TX 队列 ---
+# 不做逐条消息的字符串解码和日志，帧格式见 bluetooth_toolkit.protocol
 
+def echo_command(data):
+    """CMD_ECHO：原样返回数据负载"""
+    return data
+
+def status_command(data):
+    """CMD_STATUS：返回运行时间、请求数、消息数、错误数和连接数"""
+    return (int(server_status.get_uptime()), server_status.total_requests, server_status.total_messages,
+            server_status.error_count, len(connection_manager.sessions))
+
+def build_protocol_handler(checksum):
+    """
+    创建二进制模式的协议处理器
+
+    参数:
+        checksum: 帧校验和算法名称
+
+    返回:
+        ProtocolHandler: 按包头分发的协议处理器，已注册 ble_uart 协议并启用指标
+    """
+    protocol = Protocol("ble_uart", checksum=checksum)
+    protocol.register_command(CMD_ECHO, "echo", echo_command)
+    protocol.register_command(CMD_STATUS, "status", status_command, response_schema=STATUS_SCHEMA)
+    handler = ProtocolHandler(dispatch=DISPATCH_HEADER)
+    handler.register_protocol(0, protocol, default=True)
+    handler.enable_metrics()
+    return handler
+
+async def process_frames(session, value):
+    """二进制模式下处理一次写入的字节，由 ConnectionManager 的调度任务调用"""
+    if segmenter is not None:
+        # 每次写入是一个分段，重组出完整消息后再解码
+        reassembler = session.reassembler
+        if reassembler is None:
+            reassembler = session.reassembler = Reassembler()
+        dropped = reassembler.dropped
+        value = reassembler.feed(value)
+        if reassembler.dropped != dropped:
+            server_status.record_error("bad_segment")
+        if value is None:
+            return
+        if traffic_log is not None:
+            traffic_log.record(DIRECTION_RX, value, session.channel)
+    decoder = session.decoder
+    if decoder is None:
+        # 客户端的每个帧（含批量传输的数据块）都在一次写入内，数据长度超过单次写入的帧只可能是长度字段损坏；
+        # 分段时帧由重组得到，只受帧格式的长度上限限制
+        if segmenter is not None:
+            max_data_length = MAX_DATA_LENGTH
+        else:
+            max_data_length = max(max_write - protocol_handler.get_protocol().min_packet_size, 0)
+        decoder = session.decoder = protocol_handler.create_stream_decoder(max_data_length)
+        if transfer_args is not None:
+            session.transfers = TransferReceiver(protocol_handler.get_protocol(), send_reply, **transfer_args)
+        if channel_args is not None:
+            session.channels = ChannelMux(protocol_handler.get_protocol(), send_reply, initiator=False, **channel_args)
+            session.channel_task = asyncio.ensure_future(serve_channels(session.channels))
+    discarded = decoder.bytes_discarded
+    frames = decoder.feed(value)
+    if decoder.bytes_discarded != discarded:
+        server_status.record_error("bad_frame")
+    protocols = protocol_handler.protocols
+    transfers = session.transfers
+    channels = session.channels
+    for protocol_id, command_id, payload in frames:
+        # 逻辑通道帧（保留命令ID 0xF0-0xF4）交给会话的通道复用器
+        if channels is not None and channels.feed_frame(command_id, payload):
+            continue
+        # 批量传输帧（保留命令ID）由传输接收端直接写入文件，不逐块回复
+        if transfers is not None and await transfers.handle_frame(command_id, payload):
+            continue
+        response = await protocols[protocol_id].handle_command_async(command_id, payload)
+        if response is not None:
+            await send_reply(response)
+
+async def serve_channels(mux):
+    """接受客户端打开的逻辑通道，每个通道由独立任务处理，复用器关闭后结束"""
+    tasks = set()
     try:
-        # 获取当前运行的事件循环
-        loop = asyncio.get_running_loop()
+        async for channel in mux:
+            task = asyncio.ensure_future(serve_channel(channel))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def serve_channel(channel):
+    """
+    处理一个逻辑通道，通道关闭后返回
+
+    --- 您可以在这里按 channel.name 区分用途（如 "upload"、"telemetry"、"shell"） ---
+    示例：原样回显通道上的每条消息
+    """
+    logger.info(f"客户端打开通道: {channel.name} ({channel.id})")
+    try:
+        async for message in channel:
+            await channel.send(message)
+    except ChannelClosedError:
+        pass
+
+async def send_reply(frame):
+    """把一个回复帧放入 TX 队列（启用分段时按 --mtu 切分后逐段放入），队列按策略丢弃时记录错误"""
+    if segmenter is None:
+        if not await tx_queue.put(frame):
+            server_status.record_error("tx_dropped")
+        return
+    for segment in segmenter.segment(frame):
+        if not await tx_queue.put(segment):
+            server_status.record_error("tx_dropped")
+
 
-        # 创建 BLE 服务器实例
-        # Pass connection and disconnection handlers to the constructor
-        server = BlessServer(
-            name="Rock5C_BLE_UART",
-            loop=loop,
-            handle_connection=connection_manager.add_client, # Pass the coroutine directly
-            handle_disconnection=connection_manager.remove_client # Pass the coroutine directly
-        )
-        logger.debug("BlessServer 实例创建成功")
+def setup_logging(args):
+    """
+    启动非阻塞日志管线，控制台输出和写日志文件都在后台线程中进行
 
-        # Remove the incorrect set_connection_handler and set_disconnection_handler calls
-        # server.set_connection_handler(lambda client_address: asyncio.create_task(connection_manager.add_client(client_address)))
-        # server.set_disconnection_handler(lambda client_address: asyncio.create_task(connection_manager.remove_client(client_address)))
-        # logger.debug("连接和断开连接处理器设置成功") # Removed this log as handlers are set in constructor
+    返回:
+        QueueLogging: 已启动的日志管线，退出前调用 stop 写完剩余日志
+    """
+    formatter = logging.Formatter(DEFAULT_FORMAT, DEFAULT_DATEFMT)
+    handlers = [logging.StreamHandler(), logging.FileHandler(args.log_file)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    result = QueueLogging(handlers, level=getattr(logging, args.log_level), rate=args.log_rate, burst=args.log_burst)
+    result.start()
+    return result
 
+def parse_args(argv=None):
+    """解析命令行参数，argv 为None时使用 sys.argv"""
+    parser = argparse.ArgumentParser(description='BLE UART 服务器')
+    parser.add_argument('--backend', choices=('bless', 'fake'), default='bless',
+                        help='BLE 后端：bless 使用蓝牙控制器，fake 使用进程内模拟（不需要蓝牙硬件，见 ble_uart_loadgen.py）')
+    parser.add_argument('--notify-delay', type=float, default=0.0, help='fake 后端每次通知模拟的发送耗时（秒）')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), default='INFO',
+                        help='日志级别，DEBUG 会记录每次写入和通知')
+    parser.add_argument('--log-file', default='ble_uart.log', help='日志文件路径')
+    parser.add_argument('--log-rate', type=float, default=20,
+                        help='每处日志调用每秒最多记录的条数，超出部分被抑制并计数，0表示不限流')
+    parser.add_argument('--log-burst', type=float, help='每处日志调用允许的突发条数，默认等于 --log-rate')
+    parser.add_argument('--traffic-log', help='二进制流量日志（抓包格式）路径，记录收发的原始数据；'
+                             'binary 模式的记录可用 cli.replay 按通道流式解码回放')
+    parser.add_argument('--shutdown-timeout', type=float, default=2.0,
+                        help='关闭时处理剩余消息和发出剩余回复的最长时间（秒）')
+    parser.add_argument('--mode', choices=('text', 'binary'), default='text',
+                        help='消息格式：text 按 UTF-8 文本逐条处理，binary 按帧解码并分发命令')
+    parser.add_argument('--checksum', choices=sorted(CHECKSUMS), default='sum8', help='binary 模式的帧校验和算法')
+    parser.add_argument('--max-write', type=int, default=512,
+                        help='单次写入的最大字节数，默认为 ATT 属性值上限；后端支持更大的写入时可调大')
+    parser.add_argument('--transfer-dir',
+                        help='binary 模式下启用批量传输（文件/固件），接收的文件保存在该目录，见 bluetooth_toolkit.transfer')
+    parser.add_argument('--transfer-window', type=int, default=DEFAULT_TRANSFER_WINDOW,
+                        help='批量传输的接收窗口（数据块数），应小于 --client-buffer')
+    parser.add_argument('--transfer-max-size', type=int, default=DEFAULT_TRANSFER_MAX_SIZE,
+                        help='批量传输允许的最大文件长度（字节）')
+    parser.add_argument('--segments', action='store_true',
+                        help='binary 模式下每次写入为 bluetooth_toolkit.segment 的一个分段，按客户端重组后解码；'
+                             '回复按 --mtu 分段发送')
+    parser.add_argument('--channels', action='store_true',
+                        help='binary 模式下启用逻辑通道（命令ID 0xF0-0xF4），客户端可在一个连接上打开多个通道，'
+                             '见 bluetooth_toolkit.channel')
+    parser.add_argument('--metrics-host', default=DEFAULT_HOST, help='指标导出监听地址')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='指标导出HTTP端口（GET /metrics 与 /stats），0表示不启用')
+    parser.add_argument('--metrics-socket', help='指标导出Unix套接字路径，指定时忽略端口')
+    parser.add_argument('--tx-queue-size', type=int, default=DEFAULT_MAX_SIZE, help='TX 通知队列容量（条）')
+    parser.add_argument('--tx-policy', choices=POLICIES, default=POLICY_BLOCK,
+                        help='TX 队列满时的策略：block 等待，drop-newest 丢弃新回复，drop-oldest 丢弃最旧的回复')
+    parser.add_argument('--tx-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help='连续回复合并为一次通知的最大字节数，0表示不合并；只在 --mode binary 下有效，'
+                             '不超过 --mtu 减 3 字节')
+    parser.add_argument('--mtu', type=int, default=DEFAULT_MTU,
+                        help='客户端协商的 ATT MTU，默认为 BLE 最小值；限制合并通知的长度（后端报告客户端的 MTU 时取较小者）'
+                             '和逻辑通道的数据块长度')
+    parser.add_argument('--client-rate', type=float, default=0, help='每个客户端每秒允许的消息数，0表示不限速')
+    parser.add_argument('--client-burst', type=float, help='每个客户端允许的突发消息数，默认等于 --client-rate')
+    parser.add_argument('--client-buffer', type=int, default=64, help='每个客户端接收缓冲的最大消息数')
+    parser.add_argument('--executor', choices=('none', 'thread', 'process'), default='none',
+                        help='decode/handle 阶段的执行方式：none 在事件循环中，thread 线程池，process 进程池（多核）')
+    parser.add_argument('--pool-size', type=int, help='线程池/进程池大小，默认为 CPU 核数')
+    parser.add_argument('--max-inflight', type=int,
+                        help='同时处理的最大消息数（来自不同客户端），默认 --executor none 时为1，否则为池大小')
+    args = parser.parse_args(argv)
+    if not 0 < args.transfer_window <= MAX_TRANSFER_WINDOW:
+        parser.error(f"--transfer-window 应在 1 到 {MAX_TRANSFER_WINDOW} 之间")
+    return args
 
-        # 启动状态监控
-        await server_status.start()
+async def send_notification(value):
+    """通过 TX 特征发送一次通知"""
+    # update_value 会更新特征的本地值，订阅的客户端会自动收到新的值
+    await server.update_value(NUS_TX_CHARACTERISTIC_UUID, value)
+    if traffic_log is not None:
+        traffic_log.record(DIRECTION_TX, value)
+    logger.debug("已发送通知: %d 字节", len(value))
 
+def render_prometheus():
+    """汇总服务器状态和 TX 队列的 Prometheus 指标"""
+    text = server_status.to_prometheus() + tx_queue.to_prometheus("ble_uart") + connection_manager.to_prometheus()
+    if pipeline is not None:
+        text += pipeline.to_prometheus("ble_uart")
+    if protocol_handler is not None:
+        text += protocol_handler.to_prometheus("ble_uart_protocol")
+    if log_pipeline is not None:
+        text += log_pipeline.to_prometheus("ble_uart")
+    return text
+
+def render_stats():
+    """汇总服务器状态和 TX 队列的 JSON 统计"""
+    stats = dict(server_status.get_stats(), tx=tx_queue.get_stats(), clients=connection_manager.get_stats())
+    if pipeline is not None:
+        stats["pipeline"] = pipeline.get_stats()
+    if protocol_handler is not None:
+        stats["protocol"] = protocol_handler.metrics_snapshot()
+    if log_pipeline is not None:
+        stats["log"] = log_pipeline.get_stats()
+    if traffic_log is not None:
+        stats["traffic_log"] = traffic_log.get_stats()
+    return stats
+
+async def setup_service():
+    """注册 NUS 服务，RX/TX 两个特征互不依赖，同时注册"""
+    await server.add_new_service(NUS_SERVICE_UUID)
+    logger.info(f"已添加服务: {NUS_SERVICE_UUID}")
+
+    # RX 特征 (客户端写入)
+    rx_properties = GATTCharacteristicProperties.write | GATTCharacteristicProperties.write_without_response
+    rx_permissions = GATTAttributePermissions.writeable
+    # TX 特征 (服务器通知和读取)
+    tx_properties = GATTCharacteristicProperties.notify | GATTCharacteristicProperties.read
+    tx_permissions = GATTAttributePermissions.readable
+    await asyncio.gather(
+        server.add_new_characteristic(NUS_SERVICE_UUID, NUS_RX_CHARACTERISTIC_UUID, rx_properties, bytearray(), rx_permissions),
+        server.add_new_characteristic(NUS_SERVICE_UUID, NUS_TX_CHARACTERISTIC_UUID, tx_properties, bytearray(), tx_permissions),
+    )
+    logger.info(f"已添加 RX 特征: {NUS_RX_CHARACTERISTIC_UUID}, TX 特征: {NUS_TX_CHARACTERISTIC_UUID}")
+
+    # 设置服务器级别的写入请求处理器
+    server.write_request_func = handle_write_request
+
+def install_signal_handlers(loop):
+    """SIGINT/SIGTERM 触发 request_shutdown；不支持 add_signal_handler 的平台退回 signal.signal"""
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            # 添加 Nordic UART Service (NUS)
-            logger.debug(f"尝试添加服务: {NUS_SERVICE_UUID}")
-            await server.add_new_service(NUS_SERVICE_UUID)
-            logger.info(f"已添加服务: {NUS_SERVICE_UUID}")
-
-            # 添加 RX 特征 (客户端写入)
-            rx_properties = GATTCharacteristicProperties.write | GATTCharacteristicProperties.write_without_response
-            rx_permissions = GATTAttributePermissions.writeable # Corrected permission name
-            logger.debug(f"尝试添加 RX 特征: {NUS_RX_CHARACTERISTIC_UUID} with properties {rx_properties} and permissions {rx_permissions}")
-            try:
-                await server.add_new_characteristic(
-                    NUS_SERVICE_UUID,
-                    NUS_RX_CHARACTERISTIC_UUID,
-                    rx_properties,
-                    bytearray(), # 初始值
-                    rx_permissions
-                )
-                logger.info(f"已添加 RX 特征: {NUS_RX_CHARACTERISTIC_UUID}")
-            except Exception as e:
-                logger.error(f"添加 RX 特征时出错: {e}")
-                traceback.print_exc()
-                running = False
-                return
-
-            # 添加 TX 特征 (服务器通知和读取)
-            if running:
-                tx_properties = GATTCharacteristicProperties.notify | GATTCharacteristicProperties.read
-                tx_permissions = GATTAttributePermissions.readable # Corrected permission name
-                logger.debug(f"尝试添加 TX 特特征: {NUS_TX_CHARACTERISTIC_UUID} with properties {tx_properties} and permissions {tx_permissions}")
-                try:
-                    await server.add_new_characteristic(
-                        NUS_SERVICE_UUID,
-                        NUS_TX_CHARACTERISTIC_UUID,
-                        tx_properties,
-                        bytearray(), # 初始值
-                        tx_permissions
-                    )
-                    logger.info(f"已添加 TX 特征: {NUS_TX_CHARACTERISTIC_UUID}")
-                except Exception as e:
-                    logger.error(f"添加 TX 特征时出错: {e}")
-                    traceback.print_exc()
-                    running = False
-                    return
-
-            # 设置服务器级别的写入请求处理器
-            # This handler will be called for all write requests
-            server.write_request_func = handle_write_request
-            logger.info("已设置服务器写入请求处理器")
-
-
-        except BlessError as e:
-             logger.error(f"Bless Error during service/characteristic setup: {e}")
-             traceback.print_exc()
-             running = False
-             return
-        except Exception as e:
-             logger.error(f"Unexpected error during service/characteristic setup: {e}")
-             traceback.print_exc()
-             running = False
-             return
+            loop.add_signal_handler(sig, request_shutdown)
+        except NotImplementedError:
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(request_shutdown))
+
+async def shutdown(exporter, timeout):
+    """
+    按顺序关闭：停止接受写入，处理完已接受的消息，发出 TX 队列中的回复，再停止服务器和指标导出
+
+    参数:
+        exporter: 指标导出服务，未启用时为None
+        timeout: 处理剩余消息和发出剩余回复的总时限（秒）
+    """
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    unprocessed = await connection_manager.drain(timeout)
+    await connection_manager.stop()
+    for session in connection_manager.sessions.values():
+        await session.close_services()
+    if unprocessed:
+        logger.warning(f"关闭时有 {unprocessed} 条消息未处理完")
+    if pipeline is not None:
+        pipeline.shutdown_executors(wait=False)
+    dropped = await tx_queue.stop(drain=True, timeout=max(deadline - time.monotonic(), 0))
+    if dropped:
+        logger.warning(f"关闭时丢弃 {dropped} 条未发出的回复")
+    if traffic_log is not None:
+        await asyncio.get_running_loop().run_in_executor(None, traffic_log.close, 1.0)
+    drained = time.perf_counter() - start
+
+    results = await asyncio.gather(server.stop(), exporter.stop() if exporter else asyncio.sleep(0),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"停止服务时出错: {result}")
+    logger.info(f"BLE UART 服务器已停止，关闭耗时 {time.perf_counter() - start:.3f} 秒"
+                f"（处理剩余消息和回复 {drained:.3f} 秒）")
+
+async def release_resources(exporter):
+    """
+    启动失败或运行出错、未经过 shutdown 时释放已创建的资源，各步骤可重复执行
+
+    参数:
+        exporter: 指标导出服务，未启用时为None
+    """
+    if connection_manager is not None:
+        await connection_manager.stop()
+    if tx_queue is not None:
+        await tx_queue.stop(drain=False)
+    if pipeline is not None:
+        pipeline.shutdown_executors(wait=False)
+    if traffic_log is not None:
+        # 写完已排队的记录，否则守护线程随进程退出时丢弃它们
+        await asyncio.get_running_loop().run_in_executor(None, traffic_log.close, 1.0)
+    stops = [service.stop() for service in (server, exporter) if service is not None]
+    for result in await asyncio.gather(*stops, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.debug(f"释放服务时出错: {result}")
 
+def create_server(args, loop):
+    """按 --backend 创建 BLE 服务器实例"""
+    handlers = dict(handle_connection=connection_manager.add_client,
+                    handle_disconnection=connection_manager.remove_client)
+    if args.backend == 'fake':
+        return FakeBlessServer(name="Rock5C_BLE_UART", loop=loop, notify_delay=args.notify_delay, **handlers)
+    if BlessServer is None:
+        raise RuntimeError("未安装 bless，请执行 pip install -r requirements.txt 或使用 --backend fake")
+    return BlessServer(name="Rock5C_BLE_UART", loop=loop, **handlers)
+
+async def main(args, on_started=None):
+    """
+    主函数，设置并运行 BLE 服务器
+
+    参数:
+        args: parse_args 的结果
+        on_started: 开始广播后调用的协程函数 on_started(server)，例如负载生成器
+    """
+    global running, server, connection_manager, server_status, tx_queue, pipeline, protocol_handler, shutdown_event
+    global traffic_log, transfer_args, channel_args, segmenter, max_write
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    shutdown_event = asyncio.Event()
+    install_signal_handlers(loop)
+
+    # 按消息格式创建处理流水线或帧协议处理器，以及状态管理器
+    pool_size = args.pool_size or os.cpu_count() or 1
+    if args.mode == 'binary':
+        protocol_handler = build_protocol_handler(args.checksum)
+        process = process_frames
+        if args.transfer_dir:
+            if args.transfer_window >= args.client_buffer:
+                logger.warning(f"批量传输窗口 {args.transfer_window} 不小于客户端接收缓冲 {args.client_buffer}，"
+                               f"数据块可能被拒绝")
+            transfer_args = dict(directory=args.transfer_dir, window=args.transfer_window,
+                                 max_size=args.transfer_max_size)
+            logger.info(f"批量传输已启用，接收目录: {args.transfer_dir}")
+        if args.segments:
+            segmenter = Segmenter(args.mtu)
+            logger.info(f"分段已启用，回复按 MTU {args.mtu} 分段")
+        if args.channels:
+            # 数据帧按 --mtu 切分，一个通知装下一个数据块；每个数据块占一个接收缓冲位置，
+            # 所有通道的窗口之和不超过 --client-buffer
+            overhead = ATT_HEADER_SIZE + protocol_handler.get_protocol().min_packet_size + CHANNEL_DATA_HEADER_SIZE
+            if segmenter is not None:
+                overhead += SEGMENT_HEADER_SIZE
+            channel_args = dict(window=DEFAULT_CHANNEL_WINDOW, chunk_size=max(args.mtu - overhead, 1),
+                                max_channels=max(args.client_buffer // DEFAULT_CHANNEL_WINDOW, 1))
+            logger.info(f"逻辑通道已启用，数据块 {channel_args['chunk_size']} 字节，"
+                        f"每个客户端最多 {channel_args['max_channels']} 个通道")
+    else:
+        pipeline = build_pipeline(args.executor, pool_size)
+        process = process_message
+        if args.transfer_dir:
+            logger.warning("--transfer-dir 只在 --mode binary 下有效")
+        if args.channels:
+            logger.warning("--channels 只在 --mode binary 下有效")
+        if args.segments:
+            logger.warning("--segments 只在 --mode binary 下有效")
+    max_write = args.max_write
+    max_inflight = args.max_inflight or (1 if args.executor == 'none' else pool_size)
+    connection_manager = ConnectionManager(process, rate=args.client_rate, burst=args.client_burst,
+                                           max_pending=args.client_buffer, max_inflight=max_inflight)
+    server_status = ServerStatus()
+    # 合并后的通知只能按帧拆开：文本模式的回复和分段都没有边界，不合并
+    tx_batch = args.tx_batch
+    if tx_batch and args.mode != 'binary':
+        logger.warning("--tx-batch 只在 --mode binary 下有效，文本回复不合并")
+        tx_batch = 0
+    elif tx_batch and segmenter is not None:
+        logger.warning("--tx-batch 与 --segments 不能同时使用，分段不合并")
+        tx_batch = 0
+    elif tx_batch > args.mtu - ATT_HEADER_SIZE:
+        logger.warning(f"--tx-batch {tx_batch} 超过 MTU {args.mtu} 允许的通知长度，降为 {args.mtu - ATT_HEADER_SIZE}")
+        tx_batch = max(args.mtu - ATT_HEADER_SIZE, 0)
+    tx_queue = NotificationQueue(send_notification, max_size=args.tx_queue_size, policy=args.tx_policy,
+                                 max_batch=tx_batch)
+    exporter = None
+    if args.traffic_log:
+        traffic_log = TrafficLog(args.traffic_log)
+        logger.info(f"流量日志: {traffic_log.path}")
+
+    logger.info("正在创建 BLE 服务器...")
+
+    server = None
+    stopped = False  # 是否已经过 shutdown 按顺序关闭
+    try:
+        server = create_server(args, loop)
+        server_status.start()
+
+        # 控制器检查（sysfs + ioctl，在线程池中执行）与服务注册互不依赖，同时进行
+        phase = time.perf_counter()
+        if args.backend == 'fake':
+            check = loop.create_future()
+            check.set_result(True)
+        else:
+            check = loop.run_in_executor(None, check_prerequisites)
+        try:
+            await setup_service()
+        except Exception as e:
+            logger.error(f"注册服务和特征时出错: {e}")
+            traceback.print_exc()
+            await asyncio.wait([check])
+            return
+        if not await check:
+            logger.error("前提条件检查失败，程序退出")
+            return
+        server_status.startup["setup"] = time.perf_counter() - phase
 
-        # Start the BLE server and begin advertising
-        if running:
-            logger.debug("尝试启动服务器...")
+        # 开始广播，同时启动指标导出
+        phase = time.perf_counter()
+        if args.metrics_port or args.metrics_socket:
+            exporter = MetricsExporter(render_prometheus, render_stats)
+            await asyncio.gather(server.start(),
+                                 exporter.start(args.metrics_host, args.metrics_port, args.metrics_socket))
+        else:
             await server.start()
-            logger.info(f"BLE UART 服务器已启动，设备名称: {server.name}")
-            logger.info(f"服务 UUID: {NUS_SERVICE_UUID}")
-            logger.info(f"RX 特征 UUID (写入): {NUS_RX_CHARACTERISTIC_UUID}")
-            logger.info(f"TX 特征 UUID (通知/读取): {NUS_TX_CHARACTERISTIC_UUID}")
-            logger.info("等待客户端连接...")
-
-            # Keep the server running until the running flag is set to False by signal handler or setup error
-            while running:
-                await asyncio.sleep(1)
-
-            # Stop the server when the loop exits
-            if server:
-                try:
-                    logger.debug("尝试停止服务器...")
-                    await server.stop()
-                    logger.info("BLE UART 服务器已停止")
-                except Exception as e:
-                    logger.error(f"停止服务器时出错: {e}")
-                    traceback.print_exc()
+        now = time.perf_counter()
+        server_status.startup["advertise"] = now - phase
+        server_status.startup["total"] = now - started
+        logger.info(f"BLE UART 服务器已启动，设备名称: {server.name}，启动耗时 {now - started:.3f} 秒"
+                    f"（注册 {server_status.startup['setup']:.3f} 秒，开始广播 {server_status.startup['advertise']:.3f} 秒）")
+        logger.info(f"服务 UUID: {NUS_SERVICE_UUID}")
+        logger.info(f"RX 特征 UUID (写入): {NUS_RX_CHARACTERISTIC_UUID}")
+        logger.info(f"TX 特征 UUID (通知/读取): {NUS_TX_CHARACTERISTIC_UUID}")
+        logger.info("等待客户端连接...")
 
+        # 等待 SIGINT/SIGTERM，收到后立即开始关闭
+        started_task = asyncio.ensure_future(on_started(server)) if on_started is not None else None
+        await shutdown_event.wait()
+        if started_task is not None and not started_task.done():
+            started_task.cancel()
+        await shutdown(exporter, args.shutdown_timeout)
+        stopped = True
 
     except Exception as e:
         logger.error(f"顶级运行时出错: {e}")
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        # 注册服务或前提条件检查失败提前返回、运行出错时同样关闭流量日志和已启动的服务
+        if not stopped:
+            await release_resources(exporter)
 
 if __name__ == "__main__":
+    args = parse_args()
+    log_pipeline = setup_logging(args)
     try:
-        asyncio.run(main())
+        asyncio.run(main(args))
     except KeyboardInterrupt:
         logger.info("程序通过 Ctrl+C 退出")
         pass
+    finally:
+        log_pipeline.stop()
 
@@ -6,7 +6,10 @@ __version__ = '0.1.0'
 
 from .manager import BluetoothManager
 from .device import BluetoothDevice, BLEDevice
-from .protocol import Protocol, ProtocolHandler
+from .protocol import Protocol, ProtocolHandler, StreamDecoder
+from .packet import Packet, BufferPool
+from .segment import Segmenter, Reassembler
+from .session import Session, SessionResponder
 
 __all__ = [
     'BluetoothManager',
@@ -14,4 +17,11 @@ __all__ = [
     'BLEDevice',
     'Protocol',
     'ProtocolHandler',
+    'StreamDecoder',
+    'Packet',
+    'BufferPool',
+    'Segmenter',
+    'Reassembler',
+    'Session',
+    'SessionResponder',
 ]
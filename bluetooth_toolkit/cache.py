@@ -0,0 +1,185 @@
+"""
+响应缓存模块 - 为纯函数命令缓存已编码的响应数据包
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024  # 默认最大缓存条目数
+DEFAULT_MAX_BYTES = 1 << 20  # 默认缓存的响应数据包总字节数上限
+
+CacheKey = Tuple[int, bytes]
+Generation = Tuple[int, int]  # (全局失效次数, 该命令失效次数)
+
+
+class ResponseCache:
+    """
+    LRU响应缓存
+
+    以 (命令ID, 数据负载) 为键保存已编码的响应数据包，命中时直接返回，不再调用处理函数
+    和重新编码。条目数或总字节数超过上限时淘汰最久未使用的条目，设置TTL时过期条目在
+    下次访问时删除。
+
+    处理函数执行期间缓存可能被 invalidate，调用方应在调用处理函数前取 generation，
+    put 时传入：期间发生过失效的响应是按旧数据计算的，直接丢弃。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: Optional[float] = None):
+        """
+        初始化响应缓存
+
+        参数:
+            max_entries: 最大缓存条目数
+            max_bytes: 缓存的响应数据包总字节数上限
+            ttl: 条目有效期（秒），None表示不过期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._keys_by_command: Dict[int, Set[CacheKey]] = {}  # 命令ID -> 缓存键，用于按命令失效
+        self._global_generation = 0  # 清空全部缓存的次数
+        self._generations: Dict[int, int] = {}  # 命令ID -> 按命令失效的次数
+        self.bytes = 0  # 当前缓存的响应字节数
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 因超出上限被淘汰的条目数
+        self.expirations = 0  # 因过期被删除的条目数
+        self.stale = 0  # 计算期间发生过失效而被丢弃的响应数
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, command_id: int, payload: bytes) -> Optional[bytes]:
+        """
+        查找缓存的响应数据包
+
+        参数:
+            command_id: 命令ID
+            payload: 请求数据负载
+
+        返回:
+            Optional[bytes]: 已编码的响应数据包，未命中或已过期返回None
+        """
+        key = (command_id, payload)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        response, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def generation(self, command_id: int) -> Generation:
+        """
+        获取命令当前的失效代数，在调用处理函数前获取，传给 put
+
+        参数:
+            command_id: 命令ID
+
+        返回:
+            Generation: 失效代数
+        """
+        return self._global_generation, self._generations.get(command_id, 0)
+
+    def put(self, command_id: int, payload: bytes, response: bytes, generation: Optional[Generation] = None) -> None:
+        """
+        缓存响应数据包
+
+        参数:
+            command_id: 命令ID
+            payload: 请求数据负载
+            response: 已编码的响应数据包
+            generation: 计算响应前由 generation() 取得的失效代数，此后发生过失效时丢弃响应；
+                        None表示不检查
+        """
+        if generation is not None and generation != self.generation(command_id):
+            self.stale += 1
+            return
+        if len(response) > self.max_bytes:
+            return
+        key = (command_id, payload)
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (response, expires_at)
+        self._keys_by_command.setdefault(command_id, set()).add(key)
+        self.bytes += len(response)
+
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, command_id: Optional[int] = None, payload: Optional[bytes] = None) -> int:
+        """
+        使缓存条目失效
+
+        参数:
+            command_id: 命令ID，None表示清空全部缓存
+            payload: 请求数据负载，None表示该命令的全部条目
+
+        返回:
+            int: 删除的条目数
+        """
+        if command_id is None:
+            self._global_generation += 1
+            self._generations.clear()
+            count = len(self._entries)
+            self._entries.clear()
+            self._keys_by_command.clear()
+            self.bytes = 0
+            return count
+        self._generations[command_id] = self._generations.get(command_id, 0) + 1
+        if payload is not None:
+            key = (command_id, bytes(payload))
+            if key in self._entries:
+                self._remove(key)
+                return 1
+            return 0
+        keys = self._keys_by_command.pop(command_id, ())
+        for key in keys:
+            response, _ = self._entries.pop(key)
+            self.bytes -= len(response)
+        return len(keys)
+
+    def _remove(self, key: CacheKey) -> None:
+        """删除一个条目"""
+        response, _ = self._entries.pop(key)
+        self.bytes -= len(response)
+        keys = self._keys_by_command.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_command[key[0]]
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        """
+        获取缓存统计
+
+        返回:
+            Dict: 统计信息
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale": self.stale,
+        }
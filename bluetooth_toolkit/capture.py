@@ -0,0 +1,336 @@
+"""
+抓包模块 - 记录协议层收发的数据包并按原始时序回放
+
+抓包文件只追加写入，格式为:
+    文件头: [魔数 "BTCAP\\0"(6字节)] [版本(1字节)] [保留(1字节)] [开始时间(8字节双精度，Unix秒)]
+    记录:   [相对时间(8字节，微秒)] [方向(1字节)] [通道(1字节)] [数据长度(4字节)] [数据]
+多字节字段均为大端序。旁路索引文件（抓包文件名加 .idx）依次保存每条记录在抓包文件中的
+偏移（8字节小端序），回放时内存映射两个文件即可随机访问任意记录；索引缺失或不完整时
+扫描抓包文件重建。
+"""
+
+import asyncio
+import inspect
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b"BTCAP\x00"
+CAPTURE_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+DIRECTION_RX = 0  # 接收（对端 -> 本端）
+DIRECTION_TX = 1  # 发送（本端 -> 对端）
+
+_FILE_HEADER_STRUCT = struct.Struct("!6sBxd")
+_RECORD_STRUCT = struct.Struct("!QBBI")  # 相对时间(微秒) + 方向 + 通道 + 数据长度
+_INDEX_STRUCT = struct.Struct("<Q")
+
+
+class CaptureRecord(NamedTuple):
+    """抓包记录"""
+    timestamp: float  # 相对抓包开始的秒数
+    direction: int  # DIRECTION_RX 或 DIRECTION_TX
+    channel: int  # 通道号，例如协议ID
+    frame: memoryview  # 指向映射内存的数据包视图
+
+
+def _scan_records(buf) -> Tuple[List[int], int]:
+    """
+    扫描抓包数据生成记录偏移列表
+
+    参数:
+        buf: 整个抓包文件的内容（可以是映射内存）
+
+    返回:
+        Tuple[List[int], int]: 完整记录的偏移列表，以及最后一条完整记录的结束位置
+    """
+    offsets = []
+    pos = _FILE_HEADER_STRUCT.size
+    end = len(buf)
+    while pos + _RECORD_STRUCT.size <= end:
+        length = _RECORD_STRUCT.unpack_from(buf, pos)[3]
+        if pos + _RECORD_STRUCT.size + length > end:
+            break
+        offsets.append(pos)
+        pos += _RECORD_STRUCT.size + length
+    return offsets, pos
+
+
+class CaptureWriter:
+    """
+    抓包写入器
+
+    以追加方式写入抓包文件和索引文件，已存在的抓包文件在末尾继续追加。追加前核对索引，
+    索引缺失或与抓包文件不一致时扫描重建，否则之后追加的记录会让不完整的索引看起来有效。
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        """
+        打开抓包文件
+
+        参数:
+            path: 抓包文件路径
+        """
+        self.path = os.fspath(path)
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self._file = open(self.path, "ab")
+        self._index = open(self.path + INDEX_SUFFIX, "ab")
+        if exists:
+            with open(self.path, "rb") as f:
+                magic, version, self.start_time = _FILE_HEADER_STRUCT.unpack(f.read(_FILE_HEADER_STRUCT.size))
+            if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+                self.close()
+                raise ValueError(f"不是有效的抓包文件: {self.path}")
+            self._check_index()
+        else:
+            self.start_time = time.time()
+            self._file.write(_FILE_HEADER_STRUCT.pack(CAPTURE_MAGIC, CAPTURE_VERSION, self.start_time))
+        self._offset = self._file.tell()
+        self._start = time.perf_counter() - (time.time() - self.start_time)  # 与start_time对齐的单调时钟起点
+        self.records = 0  # 本次写入的记录数
+
+    def _check_index(self) -> None:
+        """核对已有记录的索引，不一致时重写索引；截断末尾不完整的记录，使新记录紧接其后"""
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets, end = _scan_records(mm)
+            size = len(mm)
+        index_path = self.path + INDEX_SUFFIX
+        with open(index_path, "rb") as f:
+            index = f.read()
+        expected = len(offsets) * _INDEX_STRUCT.size
+        if (len(index) != expected
+                or (offsets and (_INDEX_STRUCT.unpack_from(index)[0] != offsets[0]
+                                 or _INDEX_STRUCT.unpack_from(index, expected - _INDEX_STRUCT.size)[0] != offsets[-1]))):
+            logger.warning(f"索引文件与抓包文件不一致，重建索引: {index_path}（{len(offsets)} 条记录）")
+            self._index.truncate(0)
+            self._index.write(b"".join(_INDEX_STRUCT.pack(offset) for offset in offsets))
+            self._index.flush()
+        if end != size:
+            logger.warning(f"截断抓包文件末尾不完整的记录: 偏移 {end}")
+            self._file.truncate(end)
+            self._file.seek(end)
+
+    def record(self, direction: int, frame: Union[bytes, bytearray, memoryview], channel: int = 0,
+               timestamp: Optional[float] = None) -> None:
+        """
+        追加一条记录
+
+        参数:
+            direction: DIRECTION_RX 或 DIRECTION_TX
+            frame: 数据包
+            channel: 通道号，例如协议ID
+            timestamp: 相对抓包开始的秒数，None表示当前时间
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter() - self._start
+        header = _RECORD_STRUCT.pack(int(timestamp * 1e6), direction, channel, len(frame))
+        self._file.write(header)
+        self._file.write(frame)
+        self._index.write(_INDEX_STRUCT.pack(self._offset))
+        self._offset += len(header) + len(frame)
+        self.records += 1
+
+    def flush(self) -> None:
+        """将缓冲的记录写入磁盘"""
+        self._file.flush()
+        self._index.flush()
+
+    def close(self) -> None:
+        """关闭抓包文件"""
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CaptureReader:
+    """
+    抓包读取器
+
+    内存映射抓包文件和索引文件，按下标随机访问记录，记录中的数据包为指向映射内存的视图。
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        """
+        打开抓包文件
+
+        参数:
+            path: 抓包文件路径
+
+        异常:
+            ValueError: 文件不是有效的抓包文件
+        """
+        self.path = os.fspath(path)
+        self._offsets: Union[List[int], memoryview] = []
+        self._index_file = None
+        self._index_mmap = None
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _FILE_HEADER_STRUCT.size:
+            self._file.close()
+            raise ValueError(f"不是有效的抓包文件: {self.path}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, self.start_time = _FILE_HEADER_STRUCT.unpack_from(self._view)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            self.close()
+            raise ValueError(f"不是有效的抓包文件: {self.path}")
+        self._offsets = self._load_index()
+
+    def _load_index(self):
+        """内存映射索引文件，索引缺失或与抓包文件不一致时扫描重建"""
+        index_path = self.path + INDEX_SUFFIX
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= _INDEX_STRUCT.size:
+            self._index_file = open(index_path, "rb")
+            self._index_mmap = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            count = len(self._index_mmap) // _INDEX_STRUCT.size
+            if sys.byteorder == "little":
+                # 小端平台上直接把映射内存视为64位整数数组，不复制索引
+                offsets = memoryview(self._index_mmap)[:count * _INDEX_STRUCT.size].cast("Q")
+            else:
+                offsets = [_INDEX_STRUCT.unpack_from(self._index_mmap, i * _INDEX_STRUCT.size)[0]
+                           for i in range(count)]
+            # 首条记录紧接文件头、每条记录至少有记录头、末条记录恰好结束于文件末尾时才使用索引
+            last = offsets[count - 1]
+            if (len(self._index_mmap) == count * _INDEX_STRUCT.size
+                    and offsets[0] == _FILE_HEADER_STRUCT.size
+                    and count * _RECORD_STRUCT.size <= len(self._view) - _FILE_HEADER_STRUCT.size
+                    and last + _RECORD_STRUCT.size <= len(self._view)):
+                length = _RECORD_STRUCT.unpack_from(self._view, last)[3]
+                if last + _RECORD_STRUCT.size + length == len(self._view):
+                    return offsets
+            logger.warning(f"索引文件与抓包文件不一致，重新扫描: {index_path}")
+            if isinstance(offsets, memoryview):
+                offsets.release()
+            self._close_index()
+        return self._scan()
+
+    def _scan(self) -> List[int]:
+        """扫描抓包文件生成记录偏移列表，忽略末尾不完整的记录"""
+        offsets, end = _scan_records(self._view)
+        if end != len(self._view):
+            logger.warning(f"抓包文件末尾有不完整的记录: 偏移 {end}")
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> CaptureRecord:
+        offset = self._offsets[index]
+        timestamp_us, direction, channel, length = _RECORD_STRUCT.unpack_from(self._view, offset)
+        start = offset + _RECORD_STRUCT.size
+        return CaptureRecord(timestamp_us / 1e6, direction, channel, self._view[start:start + length])
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        for index in range(len(self._offsets)):
+            yield self[index]
+
+    def records(self, direction: Optional[int] = DIRECTION_RX) -> Iterator[CaptureRecord]:
+        """
+        按方向筛选记录
+
+        参数:
+            direction: DIRECTION_RX 或 DIRECTION_TX，None表示全部
+
+        返回:
+            Iterator[CaptureRecord]: 记录迭代器
+        """
+        for record in self:
+            if direction is None or record.direction == direction:
+                yield record
+
+    @property
+    def duration(self) -> float:
+        """首尾记录之间的秒数"""
+        if not self._offsets:
+            return 0.0
+        return self[-1].timestamp - self[0].timestamp
+
+    def _close_index(self) -> None:
+        """关闭索引文件映射"""
+        if self._index_mmap is not None:
+            self._index_mmap.close()
+            self._index_mmap = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def close(self) -> None:
+        """关闭抓包文件；仍有数据包视图未释放时映射保留到视图被回收"""
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._offsets = []
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            logger.debug(f"抓包记录视图仍在使用，延后释放映射: {self.path}")
+        self._file.close()
+        self._close_index()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+async def replay(reader: CaptureReader, target: Callable[[bytes], Any], speed: Optional[float] = None,
+                 direction: Optional[int] = DIRECTION_RX, channel: Optional[int] = None,
+                 pass_channel: bool = False) -> Dict[str, float]:
+    """
+    按原始时序、缩放时序或最大速度回放抓包记录
+
+    参数:
+        reader: 抓包读取器
+        target: 接收数据包的函数，如 ProtocolHandler.handle_packet 或 handle_packet_async，
+                可以是普通函数或返回可等待对象的函数；返回值不为None时计为一次响应
+        speed: 回放速度倍数，1.0为原始速度，2.0为两倍速，None或0表示不等待、以最大速度回放
+        direction: 回放的记录方向，None表示全部
+        channel: 只回放指定通道，None表示全部
+        pass_channel: 为True时以 target(数据, 通道号) 调用，用于按通道把分片的写入送入各自的流式解码器
+
+    返回:
+        Dict[str, float]: 回放的帧数、响应数、耗时和每秒帧数
+    """
+    frames = 0
+    responses = 0
+    first = None
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for record in reader.records(direction):
+        if channel is not None and record.channel != channel:
+            continue
+        if speed:
+            if first is None:
+                first = record.timestamp
+            delay = (record.timestamp - first) / speed - (loop.time() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if pass_channel:
+            result = target(bytes(record.frame), record.channel)
+        else:
+            result = target(bytes(record.frame))
+        if inspect.isawaitable(result):
+            result = await result
+        frames += 1
+        if result is not None:
+            responses += 1
+    elapsed = loop.time() - start
+    return {
+        "frames": frames,
+        "responses": responses,
+        "elapsed": elapsed,
+        "frames_per_second": frames / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,575 @@
+"""
+逻辑通道模块 - 在一条链路上复用多个带流控的逻辑数据流
+
+通道层使用协议的保留命令ID传输，数据负载格式为:
+    打开:     [通道号(1字节)] [初始信用(2字节)] [通道名称(UTF-8)]
+    打开确认: [通道号(1字节)] [初始信用(2字节)]
+    数据:     [通道号(1字节)] [标志(1字节)] [数据块]
+    信用:     [通道号(1字节)] [新增信用(2字节)]
+    关闭:     [通道号(1字节)]
+多字节字段均为大端序。每个数据块消耗对端授予的一个信用，接收端在应用读取数据块后
+归还信用，因此每个通道在接收端缓冲的数据块数不超过窗口大小。发送端按轮询每次从一个
+有信用的通道发出一个数据块，大文件传输不会阻塞同一链路上的其他通道。
+
+发起连接的一端（客户端）使用奇数通道号，另一端使用偶数通道号，双方可同时打开通道。
+"""
+
+import asyncio
+import inspect
+import logging
+import struct
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from .protocol import MAX_DATA_LENGTH, Protocol
+
+logger = logging.getLogger(__name__)
+
+# 通道层保留的命令ID
+CMD_CHANNEL_OPEN = 0xF0
+CMD_CHANNEL_OPEN_ACK = 0xF1
+CMD_CHANNEL_DATA = 0xF2
+CMD_CHANNEL_CREDIT = 0xF3
+CMD_CHANNEL_CLOSE = 0xF4
+CHANNEL_COMMANDS = frozenset(range(CMD_CHANNEL_OPEN, CMD_CHANNEL_CLOSE + 1))
+
+FLAG_END = 0x01  # 数据块是消息的最后一块
+
+DEFAULT_WINDOW = 8  # 默认每个通道的接收窗口（数据块数）
+DEFAULT_CHUNK_SIZE = 128  # 默认数据块最大长度（字节）
+DEFAULT_OPEN_TIMEOUT = 5.0  # 默认打开通道的超时（秒）
+MAX_CHANNEL_ID = 0xFF
+
+_CREDIT_STRUCT = struct.Struct("!BH")  # 通道号 + 信用
+_DATA_STRUCT = struct.Struct("!BB")  # 通道号 + 标志
+DATA_HEADER_SIZE = _DATA_STRUCT.size  # 数据帧负载中数据块之前的字节数
+
+
+class ChannelClosedError(Exception):
+    """通道或通道复用器已关闭"""
+
+
+class Channel:
+    """
+    逻辑通道
+
+    由 ChannelMux.open 或 ChannelMux.accept 得到。send 发送一条消息（按数据块大小切分），
+    recv 读取下一个数据块，recv_message 读取一条完整消息；异步迭代通道逐条产出消息，
+    通道关闭且缓冲的数据读完后结束。
+    """
+
+    def __init__(self, mux: "ChannelMux", channel_id: int, name: str, send_credits: int = 0):
+        self.mux = mux
+        self.id = channel_id
+        self.name = name
+        self.send_credits = send_credits  # 对端授予、尚未使用的信用
+        self.closed = False
+        self._outbox: Deque[Tuple[bytes, int, Optional[asyncio.Future]]] = deque()  # (数据块, 标志, 消息发完时完成的Future)
+        self._inbox: Deque[Tuple[bytes, int]] = deque()  # (数据块, 标志)
+        self._readable = asyncio.Event()
+        self._queued = False  # 是否在复用器的待发送轮询队列中
+        self._consumed = 0  # 已读取但尚未归还信用的数据块数
+        self._granted = mux.window  # 已授予对端、尚未收到数据块的信用
+
+        # 统计计数
+        self.bytes_sent = 0  # 发出的数据字节数
+        self.bytes_received = 0  # 收到的数据字节数
+        self.chunks_sent = 0  # 发出的数据块数
+        self.chunks_received = 0  # 收到的数据块数
+        self.credit_stalls = 0  # 有待发数据但信用耗尽的次数
+
+    @property
+    def pending(self) -> int:
+        """尚未发出的数据块数"""
+        return len(self._outbox)
+
+    async def send(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """
+        发送一条消息，等待其所有数据块发出
+
+        参数:
+            data: 消息内容，超过数据块大小时切分为多块，可为空
+
+        异常:
+            ChannelClosedError: 通道已关闭
+        """
+        if self.closed:
+            raise ChannelClosedError(f"通道已关闭: {self.name} ({self.id})")
+        future = asyncio.get_running_loop().create_future()
+        size = self.mux.chunk_size
+        view = memoryview(data)
+        last = max(len(view) - 1, 0) // size * size
+        for start in range(0, last, size):
+            self._outbox.append((bytes(view[start:start + size]), 0, None))
+        self._outbox.append((bytes(view[last:]), FLAG_END, future))
+        self.mux._schedule(self)
+        await future
+
+    async def recv(self) -> bytes:
+        """
+        读取下一个数据块，不保证与消息边界对齐
+
+        返回:
+            bytes: 数据块
+
+        异常:
+            ChannelClosedError: 通道已关闭且缓冲的数据已读完
+        """
+        return (await self._take())[0]
+
+    async def recv_message(self) -> bytes:
+        """
+        读取一条完整消息
+
+        返回:
+            bytes: 消息内容
+
+        异常:
+            ChannelClosedError: 通道已关闭且缓冲的数据已读完
+        """
+        chunk, flags = await self._take()
+        if flags & FLAG_END:
+            return chunk
+        parts = [chunk]
+        while not flags & FLAG_END:
+            chunk, flags = await self._take()
+            parts.append(chunk)
+        return b"".join(parts)
+
+    async def _take(self) -> Tuple[bytes, int]:
+        """取出一个数据块并在累计读取达到半个窗口时归还信用"""
+        while not self._inbox:
+            if self.closed:
+                raise ChannelClosedError(f"通道已关闭: {self.name} ({self.id})")
+            self._readable.clear()
+            await self._readable.wait()
+        item = self._inbox.popleft()
+        if not self.closed:
+            self._consumed += 1
+            if self._consumed >= self.mux.credit_threshold:
+                self.mux._send_control(CMD_CHANNEL_CREDIT, _CREDIT_STRUCT.pack(self.id, self._consumed))
+                self._granted += self._consumed
+                self._consumed = 0
+        return item
+
+    def __aiter__(self) -> "Channel":
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self.recv_message()
+        except ChannelClosedError:
+            raise StopAsyncIteration
+
+    async def close(self) -> None:
+        """等待已提交的消息发出后关闭通道并通知对端"""
+        if self.closed:
+            return
+        if self._outbox:
+            try:
+                await asyncio.shield(self._outbox[-1][2])
+            except ChannelClosedError:
+                return
+        if self.closed:
+            return
+        self.mux._send_control(CMD_CHANNEL_CLOSE, bytes((self.id,)))
+        self.mux._release(self)
+        self._on_closed()
+
+    def _on_data(self, chunk: bytes, flags: int) -> None:
+        """收到数据块"""
+        if self._granted <= 0:
+            self.mux.overflows += 1
+            logger.warning(f"通道 {self.name} ({self.id}) 收到超出信用的数据块，丢弃")
+            return
+        self._granted -= 1
+        self._inbox.append((chunk, flags))
+        self.chunks_received += 1
+        self.bytes_received += len(chunk)
+        self._readable.set()
+
+    def _on_closed(self, error: Optional[BaseException] = None) -> None:
+        """标记通道关闭，唤醒读取方并使未发出的消息失败"""
+        self.closed = True
+        self._readable.set()
+        while self._outbox:
+            future = self._outbox.popleft()[2]
+            if future is not None and not future.done():
+                future.set_exception(error or ChannelClosedError(f"通道已关闭: {self.name} ({self.id})"))
+
+    def get_stats(self) -> Dict[str, Union[int, str]]:
+        """
+        获取通道统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "send_credits": self.send_credits,
+            "pending": len(self._outbox),
+            "buffered": len(self._inbox),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "chunks_sent": self.chunks_sent,
+            "chunks_received": self.chunks_received,
+            "credit_stalls": self.credit_stalls,
+        }
+
+
+class ChannelMux:
+    """
+    通道复用器
+
+    两端对称使用：任一端都可以 open 打开通道、accept 接受对端打开的通道。
+    接收到的数据通过 feed/feed_packet/feed_frame 输入，非通道层命令原样忽略，
+    可与其他命令共用同一个协议和链路。发送由复用器内部的任务串行完成，
+    控制帧（打开、信用、关闭）优先于数据块发送。
+    """
+
+    def __init__(self, protocol: Protocol, send: Callable[[bytes], Any], initiator: bool = True,
+                 window: int = DEFAULT_WINDOW, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_channels: int = 64):
+        """
+        初始化通道复用器
+
+        参数:
+            protocol: 编解码使用的协议对象
+            send: 发送编码后数据包的函数，可以是普通函数或返回可等待对象的函数
+            initiator: 是否为发起连接的一端（客户端），决定本端分配奇数还是偶数通道号
+            window: 每个通道的接收窗口（数据块数），即授予对端的初始信用
+            chunk_size: 数据块最大长度（字节）
+            max_channels: 同时打开的最大通道数，超出时拒绝对端的打开请求
+        """
+        if not 0 < window <= 0xFFFF:
+            raise ValueError(f"无效的窗口大小: {window}")
+        if not 0 < chunk_size <= MAX_DATA_LENGTH - _DATA_STRUCT.size:
+            raise ValueError(f"无效的数据块长度: {chunk_size}")
+        self.protocol = protocol
+        self.send = send
+        self.window = window
+        self.chunk_size = chunk_size
+        self.max_channels = max_channels
+        self.credit_threshold = max(1, window // 2)  # 累计读取多少数据块后归还信用
+        self._channels: Dict[int, Channel] = {}
+        self._next_id = 1 if initiator else 2
+        self._opening: Dict[int, asyncio.Future] = {}  # 通道号 -> 等待打开确认的Future
+        self._incoming: Deque[Channel] = deque()  # 等待 accept 的通道
+        self._incoming_event: Optional[asyncio.Event] = None
+        self._control: Deque[bytes] = deque()  # 待发送的控制帧
+        self._ready: Deque[Channel] = deque()  # 有待发数据块的通道，轮询发送
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump: Optional[asyncio.Task] = None
+        self._decoder = protocol.create_stream_decoder(chunk_size + _DATA_STRUCT.size)
+        self.closed = False
+
+        # 统计计数
+        self.frames_sent = 0  # 发出的数据包数
+        self.frames_received = 0  # 收到的通道层数据包数
+        self.rejected = 0  # 被拒绝的打开请求数（本端或对端）
+        self.unknown_channel = 0  # 发往未打开通道的数据包数
+        self.overflows = 0  # 超出信用被丢弃的数据块数
+
+    @property
+    def channels(self) -> List[Channel]:
+        """当前打开的通道"""
+        return list(self._channels.values())
+
+    def _allocate_id(self) -> int:
+        """按本端的奇偶分配未占用的通道号"""
+        for _ in range((MAX_CHANNEL_ID + 1) // 2):
+            channel_id = self._next_id
+            self._next_id += 2
+            if self._next_id > MAX_CHANNEL_ID:
+                self._next_id = 2 - (self._next_id & 1)  # 奇数回到1，偶数回到2
+            if channel_id not in self._channels and channel_id not in self._opening:
+                return channel_id
+        raise ChannelClosedError("没有可用的通道号")
+
+    async def open(self, name: str = "", timeout: Optional[float] = DEFAULT_OPEN_TIMEOUT) -> Channel:
+        """
+        打开通道并等待对端确认
+
+        参数:
+            name: 通道名称，对端据此区分用途（如 "upload"、"telemetry"、"shell"）
+            timeout: 等待确认的超时（秒），None表示不超时
+
+        返回:
+            Channel: 已打开的通道
+
+        异常:
+            ChannelClosedError: 复用器已关闭或对端拒绝
+            asyncio.TimeoutError: 超时未收到确认
+        """
+        if self.closed:
+            raise ChannelClosedError("通道复用器已关闭")
+        if len(self._channels) + len(self._opening) >= self.max_channels:
+            raise ChannelClosedError(f"打开的通道数已达上限: {self.max_channels}")
+        channel_id = self._allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        self._opening[channel_id] = future
+        # 打开前先登记通道，确认与首批数据块可能在同一次写入中到达
+        channel = Channel(self, channel_id, name)
+        self._channels[channel_id] = channel
+        self._send_control(CMD_CHANNEL_OPEN, _CREDIT_STRUCT.pack(channel_id, self.window) + name.encode("utf-8"))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            self._opening.pop(channel_id, None)
+            self._release(channel)
+            channel._on_closed()
+            raise
+        logger.debug(f"已打开通道: {name} ({channel_id})")
+        return channel
+
+    async def accept(self) -> Channel:
+        """
+        等待对端打开的下一个通道
+
+        返回:
+            Channel: 对端打开的通道
+
+        异常:
+            ChannelClosedError: 复用器已关闭
+        """
+        if self._incoming_event is None:
+            self._incoming_event = asyncio.Event()
+        while not self._incoming:
+            if self.closed:
+                raise ChannelClosedError("通道复用器已关闭")
+            self._incoming_event.clear()
+            await self._incoming_event.wait()
+        return self._incoming.popleft()
+
+    def __aiter__(self) -> "ChannelMux":
+        return self
+
+    async def __anext__(self) -> Channel:
+        try:
+            return await self.accept()
+        except ChannelClosedError:
+            raise StopAsyncIteration
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """
+        输入接收到的原始字节流，可为任意分片
+
+        参数:
+            data: 新接收的数据
+
+        返回:
+            int: 本次处理的通道层数据包数
+        """
+        handled = 0
+        for command_id, payload in self._decoder.feed(data):
+            if self.feed_frame(command_id, payload):
+                handled += 1
+        return handled
+
+    def feed_packet(self, packet: bytes) -> bool:
+        """
+        输入一个完整的数据包
+
+        参数:
+            packet: 接收到的数据包
+
+        返回:
+            bool: 是否为通道层数据包
+        """
+        command_id, payload = self.protocol.decode_packet(packet)
+        if command_id is None:
+            return False
+        return self.feed_frame(command_id, payload)
+
+    def feed_frame(self, command_id: int, payload: bytes) -> bool:
+        """
+        输入一个已解码的帧
+
+        参数:
+            command_id: 命令ID
+            payload: 数据负载
+
+        返回:
+            bool: 是否为通道层数据包，其他命令返回False由调用方继续处理
+        """
+        if command_id not in CHANNEL_COMMANDS:
+            return False
+        if not payload or self.closed:
+            return True
+        self.frames_received += 1
+        channel_id = payload[0]
+
+        if command_id == CMD_CHANNEL_DATA:
+            channel = self._channels.get(channel_id)
+            if channel is None or len(payload) < _DATA_STRUCT.size:
+                self.unknown_channel += 1
+                return True
+            channel._on_data(bytes(payload[_DATA_STRUCT.size:]), payload[1])
+        elif command_id == CMD_CHANNEL_CREDIT:
+            channel = self._channels.get(channel_id)
+            if channel is None or len(payload) < _CREDIT_STRUCT.size:
+                self.unknown_channel += 1
+                return True
+            channel.send_credits += _CREDIT_STRUCT.unpack_from(payload)[1]
+            self._schedule(channel)
+        elif command_id == CMD_CHANNEL_OPEN:
+            self._on_open(channel_id, payload)
+        elif command_id == CMD_CHANNEL_OPEN_ACK:
+            future = self._opening.pop(channel_id, None)
+            channel = self._channels.get(channel_id)
+            if future is None or channel is None or len(payload) < _CREDIT_STRUCT.size:
+                self.unknown_channel += 1
+                return True
+            channel.send_credits += _CREDIT_STRUCT.unpack_from(payload)[1]
+            if not future.done():
+                future.set_result(None)
+            self._schedule(channel)
+        else:
+            future = self._opening.pop(channel_id, None)
+            channel = self._channels.get(channel_id)
+            if future is not None:
+                self.rejected += 1
+                if not future.done():
+                    future.set_exception(ChannelClosedError(f"对端拒绝打开通道: {channel_id}"))
+            elif channel is not None:
+                logger.debug(f"对端关闭通道: {channel.name} ({channel_id})")
+                self._release(channel)
+                channel._on_closed()
+            else:
+                self.unknown_channel += 1
+        return True
+
+    def _on_open(self, channel_id: int, payload: bytes) -> None:
+        """处理对端的打开请求"""
+        if (len(payload) < _CREDIT_STRUCT.size or channel_id in self._channels
+                or len(self._channels) >= self.max_channels):
+            self.rejected += 1
+            logger.warning(f"拒绝打开通道: {channel_id}")
+            self._send_control(CMD_CHANNEL_CLOSE, bytes((channel_id,)))
+            return
+        credits = _CREDIT_STRUCT.unpack_from(payload)[1]
+        name = bytes(payload[_CREDIT_STRUCT.size:]).decode("utf-8", errors="replace")
+        channel = Channel(self, channel_id, name, credits)
+        self._channels[channel_id] = channel
+        self._send_control(CMD_CHANNEL_OPEN_ACK, _CREDIT_STRUCT.pack(channel_id, self.window))
+        self._incoming.append(channel)
+        if self._incoming_event is not None:
+            self._incoming_event.set()
+        logger.debug(f"对端打开通道: {name} ({channel_id})")
+
+    def _release(self, channel: Channel) -> None:
+        """从通道表中移除通道"""
+        if self._channels.get(channel.id) is channel:
+            del self._channels[channel.id]
+
+    def _send_control(self, command_id: int, payload: bytes) -> None:
+        """排队一个控制帧，优先于数据块发送"""
+        self._control.append(self.protocol.encode_packet(command_id, payload))
+        self._wake()
+
+    def _schedule(self, channel: Channel) -> None:
+        """将有待发数据块的通道加入轮询队列"""
+        if channel._outbox and not channel._queued:
+            channel._queued = True
+            self._ready.append(channel)
+            self._wake()
+
+    def _wake(self) -> None:
+        """唤醒发送任务，必要时启动"""
+        if self.closed:
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+
+    def _next_ready(self) -> Optional[Channel]:
+        """轮询取出下一个有信用的通道，信用耗尽的通道等收到信用后重新加入"""
+        while self._ready:
+            channel = self._ready.popleft()
+            channel._queued = False
+            if channel.closed or not channel._outbox:
+                continue
+            if channel.send_credits > 0:
+                return channel
+            channel.credit_stalls += 1
+        return None
+
+    async def _run(self) -> None:
+        """发送任务：控制帧优先，数据块按通道轮询，每轮每个通道发出一块"""
+        while not self.closed:
+            if self._control:
+                await self._transmit(self._control.popleft())
+                continue
+            channel = self._next_ready()
+            if channel is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            chunk, flags, future = channel._outbox.popleft()
+            channel.send_credits -= 1
+            await self._transmit(self.protocol.encode_packet(
+                CMD_CHANNEL_DATA, _DATA_STRUCT.pack(channel.id, flags) + chunk))
+            channel.chunks_sent += 1
+            channel.bytes_sent += len(chunk)
+            if future is not None and not future.done():
+                future.set_result(None)
+            self._schedule(channel)
+
+    async def _transmit(self, packet: bytes) -> None:
+        """发出一个数据包"""
+        try:
+            result = self.send(packet)
+            if inspect.isawaitable(result):
+                await result
+            self.frames_sent += 1
+        except Exception as e:
+            logger.error(f"发送通道数据包时出错: {e}")
+
+    async def close(self) -> None:
+        """关闭复用器和所有通道，未发出的消息以 ChannelClosedError 失败"""
+        if self.closed:
+            return
+        # 先尽量通知对端各通道已关闭
+        for channel in list(self._channels.values()):
+            self._control.append(self.protocol.encode_packet(CMD_CHANNEL_CLOSE, bytes((channel.id,))))
+        while self._control:
+            await self._transmit(self._control.popleft())
+        self.closed = True
+        if self._pump is not None:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except asyncio.CancelledError:
+                pass
+            self._pump = None
+        for future in self._opening.values():
+            if not future.done():
+                future.set_exception(ChannelClosedError("通道复用器已关闭"))
+        self._opening.clear()
+        for channel in list(self._channels.values()):
+            channel._on_closed()
+        self._channels.clear()
+        self._ready.clear()
+        if self._incoming_event is not None:
+            self._incoming_event.set()
+        self._decoder.reset()
+
+    def get_stats(self) -> Dict:
+        """
+        获取复用器统计
+
+        返回:
+            Dict: 统计信息和各通道统计
+        """
+        return {
+            "channels": len(self._channels),
+            "frames_sent": self.frames_sent,
+            "frames_received": self.frames_received,
+            "rejected": self.rejected,
+            "unknown_channel": self.unknown_channel,
+            "overflows": self.overflows,
+            "per_channel": [channel.get_stats() for channel in self._channels.values()],
+        }
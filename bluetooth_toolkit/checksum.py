@@ -0,0 +1,233 @@
+"""
+校验和模块 - 提供协议数据包可选的校验和算法
+"""
+
+import binascii
+import struct
+import zlib
+from typing import Dict, List, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+_LENGTH_STRUCT = struct.Struct("!BH")  # 命令ID + 数据长度
+
+
+class Checksum:
+    """
+    校验和算法基类
+
+    校验和覆盖数据包中的命令ID、数据长度和数据负载，按大端序追加在数据包末尾。
+    子类实现 update 即可支持增量计算。
+    """
+
+    name = "base"
+    size = 1  # 校验和字节数
+    initial = 0  # 初始值
+
+    def __init__(self):
+        """初始化校验和算法"""
+        self._struct = struct.Struct({1: "!B", 2: "!H", 4: "!I"}[self.size])
+
+    def update(self, value: int, data: BytesLike) -> int:
+        """
+        在已有校验值基础上继续计算
+
+        参数:
+            value: 已有的校验值
+            data: 新增数据
+
+        返回:
+            int: 更新后的校验值
+        """
+        raise NotImplementedError
+
+    def compute(self, data: BytesLike) -> int:
+        """
+        计算数据的校验值
+
+        参数:
+            data: 校验区域数据
+
+        返回:
+            int: 校验值
+        """
+        return self.update(self.initial, data)
+
+    def pack(self, value: int) -> bytes:
+        """将校验值编码为字节"""
+        return self._struct.pack(value)
+
+    def unpack_from(self, buffer: BytesLike, offset: int = 0) -> int:
+        """从缓冲区指定偏移读取校验值"""
+        return self._struct.unpack_from(buffer, offset)[0]
+
+    def frame_checksum(self, command_id: int, data_length: int, data: BytesLike) -> bytes:
+        """
+        计算数据包的校验和字节
+
+        参数:
+            command_id: 命令ID
+            data_length: 数据长度
+            data: 数据负载
+
+        返回:
+            bytes: 编码后的校验和
+        """
+        value = self.update(self.initial, _LENGTH_STRUCT.pack(command_id, data_length))
+        return self.pack(self.update(value, data))
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.name}>"
+
+
+class SumChecksum(Checksum):
+    """8位累加和校验（协议默认格式）"""
+
+    name = "sum8"
+    size = 1
+
+    def __init__(self):
+        """初始化累加和校验"""
+        super().__init__()
+        self._bytes = [bytes((i,)) for i in range(256)]  # 预生成的单字节校验和
+
+    def update(self, value: int, data: BytesLike) -> int:
+        return (value + sum(data)) & 0xFF
+
+    def pack(self, value: int) -> bytes:
+        return self._bytes[value]
+
+    def unpack_from(self, buffer: BytesLike, offset: int = 0) -> int:
+        return buffer[offset]
+
+    def frame_checksum(self, command_id: int, data_length: int, data: BytesLike) -> bytes:
+        # 直接由整数累加，无需先打包头部
+        return self._bytes[(command_id + (data_length >> 8) + (data_length & 0xFF) + sum(data)) & 0xFF]
+
+
+class CRC8Checksum(Checksum):
+    """查表法CRC-8，默认多项式0x07（CRC-8/SMBUS）"""
+
+    name = "crc8"
+    size = 1
+
+    def __init__(self, poly: int = 0x07, initial: int = 0x00):
+        """
+        初始化CRC-8校验
+
+        参数:
+            poly: 生成多项式，默认为0x07
+            initial: 初始值，默认为0x00
+        """
+        super().__init__()
+        self.poly = poly
+        self.initial = initial
+        self._table = self._build_table(poly)
+
+    @staticmethod
+    def _build_table(poly: int) -> List[int]:
+        """预计算256项CRC表"""
+        table = []
+        for byte in range(256):
+            crc = byte
+            for _ in range(8):
+                crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+            table.append(crc)
+        return table
+
+    def update(self, value: int, data: BytesLike) -> int:
+        table = self._table
+        for byte in data:
+            value = table[value ^ byte]
+        return value
+
+
+class CRC16Checksum(Checksum):
+    """
+    查表法CRC-16，默认CRC-16/CCITT-FALSE（多项式0x1021，初始值0xFFFF）
+
+    多项式为0x1021时使用标准库 binascii.crc_hqx（C实现的同一查表算法），
+    其他多项式使用Python预计算表。
+    """
+
+    name = "crc16"
+    size = 2
+
+    def __init__(self, poly: int = 0x1021, initial: int = 0xFFFF):
+        """
+        初始化CRC-16校验
+
+        参数:
+            poly: 生成多项式，默认为0x1021
+            initial: 初始值，默认为0xFFFF
+        """
+        super().__init__()
+        self.poly = poly
+        self.initial = initial
+        self._table = self._build_table(poly)
+        self._native = poly == 0x1021
+
+    @staticmethod
+    def _build_table(poly: int) -> List[int]:
+        """预计算256项CRC表"""
+        table = []
+        for byte in range(256):
+            crc = byte << 8
+            for _ in range(8):
+                crc = ((crc << 1) ^ poly) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+            table.append(crc)
+        return table
+
+    def update(self, value: int, data: BytesLike) -> int:
+        if self._native:
+            return binascii.crc_hqx(data, value)
+        table = self._table
+        for byte in data:
+            value = ((value << 8) & 0xFFFF) ^ table[(value >> 8) ^ byte]
+        return value
+
+
+class CRC32Checksum(Checksum):
+    """CRC-32（与zlib/以太网相同），由 zlib.crc32 计算"""
+
+    name = "crc32"
+    size = 4
+
+    def update(self, value: int, data: BytesLike) -> int:
+        return zlib.crc32(data, value)
+
+    def compute(self, data: BytesLike) -> int:
+        return zlib.crc32(data)
+
+
+CHECKSUMS: Dict[str, type] = {
+    SumChecksum.name: SumChecksum,
+    CRC8Checksum.name: CRC8Checksum,
+    CRC16Checksum.name: CRC16Checksum,
+    CRC32Checksum.name: CRC32Checksum,
+}
+
+DEFAULT_CHECKSUM = SumChecksum()
+
+
+def get_checksum(checksum: Union[str, Checksum, None] = None) -> Checksum:
+    """
+    获取校验和算法实例
+
+    参数:
+        checksum: 算法名称（sum8/crc8/crc16/crc32）或算法实例，None表示默认的sum8
+
+    返回:
+        Checksum: 校验和算法实例
+
+    异常:
+        ValueError: 未知的算法名称
+    """
+    if checksum is None:
+        return DEFAULT_CHECKSUM
+    if isinstance(checksum, Checksum):
+        return checksum
+    try:
+        return CHECKSUMS[checksum.lower()]()
+    except KeyError:
+        raise ValueError(f"未知的校验和算法: {checksum}，可选: {', '.join(CHECKSUMS)}") from None
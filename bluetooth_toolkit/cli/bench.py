@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+协议性能基准测试命令行工具
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bluetooth_toolkit import Protocol, ProtocolHandler, Reassembler, Segmenter, Session, SessionResponder
+from bluetooth_toolkit.channel import ChannelMux
+from bluetooth_toolkit.checksum import CHECKSUMS, get_checksum
+from bluetooth_toolkit.coalesce import FrameCoalescer
+from bluetooth_toolkit.lanes import PRIORITY_BULK, PRIORITY_CONTROL
+from bluetooth_toolkit.logqueue import DEFAULT_FORMAT, QueueLogging, TrafficLog
+from bluetooth_toolkit.metrics import LatencyHistogram, RateCounter
+from bluetooth_toolkit.notify import NotificationQueue
+from bluetooth_toolkit.pipeline import Pipeline
+from bluetooth_toolkit.packet import BufferPool, Packet
+from bluetooth_toolkit.protocol import DISPATCH_HEADER, OFFLOAD_CPU, OFFLOAD_IO, np
+from bluetooth_toolkit.schema import Array, Schema, String
+from bluetooth_toolkit.segment import ATT_HEADER_SIZE
+from bluetooth_toolkit.transfer import DEFAULT_CHUNK_SIZE, TransferReceiver, TransferSender
+from bluetooth_toolkit.utils import setup_logging
+
+def make_frames(protocol, count, payload_size):
+    """生成测试用的编码数据包列表"""
+    rng = random.Random(0)
+    return [
+        protocol.encode_packet(i & 0xFF, bytes(rng.getrandbits(8) for _ in range(payload_size)))
+        for i in range(count)
+    ]
+
+def report(name, count, elapsed, nbytes=None):
+    """输出单项测试结果"""
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    line = f"{name:<28} {count:>9} 帧  {elapsed * 1000:>9.1f} ms  {rate:>12,.0f} 帧/秒"
+    if nbytes is not None and elapsed > 0:
+        line += f"  {nbytes / elapsed / 1e6:>8.2f} MB/秒"
+    print(line)
+
+def bench_stream(args):
+    """流式解码器基准：按MTU分片输入粘连的数据流"""
+    protocol = Protocol("bench")
+    frames = make_frames(protocol, args.count, args.payload)
+    stream = b"".join(frames)
+    chunks = [stream[i:i + args.mtu] for i in range(0, len(stream), args.mtu)]
+
+    start = time.perf_counter()
+    for frame in frames:
+        protocol.decode_packet(frame)
+    report("decode_packet (整帧)", len(frames), time.perf_counter() - start, len(stream))
+
+    decoder = protocol.create_stream_decoder(args.payload)
+    decoded = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        decoded += len(decoder.feed(chunk))
+    report(f"StreamDecoder (MTU={args.mtu})", decoded, time.perf_counter() - start, len(stream))
+
+    # 注入随机噪声后检验重新同步
+    rng = random.Random(1)
+    noisy = bytearray()
+    for frame in frames:
+        if rng.random() < 0.01:
+            noisy += os.urandom(rng.randint(1, 8))
+        noisy += frame
+    decoder = protocol.create_stream_decoder(args.payload)
+    decoded = 0
+    start = time.perf_counter()
+    for i in range(0, len(noisy), args.mtu):
+        decoded += len(decoder.feed(noisy[i:i + args.mtu]))
+    report("StreamDecoder (1%噪声)", decoded, time.perf_counter() - start, len(noisy))
+    print(f"  丢弃字节: {decoder.bytes_discarded}, 校验和错误: {decoder.checksum_errors}, "
+          f"待解码字节: {decoder.pending}")
+
+def bench_batch(args):
+    """批量编解码基准：逐帧调用与encode_many/decode_many对比"""
+    protocol = Protocol("bench")
+    rng = random.Random(0)
+    items = [(i & 0xFF, bytes(rng.getrandbits(8) for _ in range(args.payload))) for i in range(args.count)]
+
+    start = time.perf_counter()
+    stream = b"".join([protocol.encode_packet(command_id, data) for command_id, data in items])
+    report("encode_packet (逐帧)", len(items), time.perf_counter() - start, len(stream))
+
+    out = bytearray()
+    start = time.perf_counter()
+    protocol.encode_many(items, out)
+    report("encode_many", len(items), time.perf_counter() - start, len(out))
+
+    frames = make_frames(protocol, args.count, args.payload)
+    start = time.perf_counter()
+    for frame in frames:
+        protocol.decode_packet(frame)
+    report("decode_packet (逐帧)", len(frames), time.perf_counter() - start, len(stream))
+
+    start = time.perf_counter()
+    decoded = protocol.decode_many(out)
+    backend = "NumPy" if np is not None else "纯Python"
+    report(f"decode_many ({backend})", len(decoded), time.perf_counter() - start, len(out))
+
+def bench_checksum(args):
+    """校验和算法基准：比较各算法的计算吞吐量、编解码速率和漏检率"""
+    rng = random.Random(0)
+    payloads = [bytes(rng.getrandbits(8) for _ in range(args.payload)) for _ in range(1000)]
+    rounds = max(1, args.count // len(payloads))
+
+    for name in CHECKSUMS:
+        checksum = get_checksum(name)
+        compute = checksum.compute
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for payload in payloads:
+                compute(payload)
+        count = rounds * len(payloads)
+        report(f"{name} 计算", count, time.perf_counter() - start, count * args.payload)
+
+        protocol = Protocol("bench", checksum=checksum)
+        items = [(i & 0xFF, payloads[i % len(payloads)]) for i in range(args.count)]
+        start = time.perf_counter()
+        stream = protocol.encode_many(items)
+        report(f"{name} encode_many", len(items), time.perf_counter() - start, len(stream))
+        start = time.perf_counter()
+        decoded = protocol.decode_many(stream)
+        report(f"{name} decode_many", len(decoded), time.perf_counter() - start, len(stream))
+
+        # 每帧随机翻转3个比特，统计未被检出的损坏帧
+        undetected = 0
+        trials = 10000
+        logging.disable(logging.ERROR)
+        for i in range(trials):
+            frame = bytearray(protocol.encode_packet(i & 0xFF, payloads[i % len(payloads)]))
+            for _ in range(3):
+                frame[rng.randrange(1, len(frame))] ^= 1 << rng.randrange(8)
+            if protocol.decode_packet(bytes(frame))[0] is not None:
+                undetected += 1
+        logging.disable(logging.NOTSET)
+        print(f"  {name} 漏检率: {undetected}/{trials}")
+
+def bench_segment(args):
+    """分段重组基准：大数据包按MTU切分后重组"""
+    protocol = Protocol("bench")
+    segmenter = Segmenter(args.mtu + ATT_HEADER_SIZE)
+    reassembler = Reassembler()
+    size = max(args.payload, 4096)
+    packet = protocol.encode_packet(0x01, os.urandom(size))
+    count = max(1, args.count // 100)
+
+    segments = []
+    start = time.perf_counter()
+    for _ in range(count):
+        segments.extend(segmenter.segment(packet))
+    report(f"segment ({size}B, MTU={segmenter.mtu})", count, time.perf_counter() - start, count * len(packet))
+    overhead = (sum(len(s) for s in segments) - count * len(packet)) / (count * len(packet))
+    print(f"  分段数: {len(segments)}, 头部开销: {overhead:.2%}")
+
+    messages = 0
+    feed = reassembler.feed
+    start = time.perf_counter()
+    for segment in segments:
+        if feed(segment) is not None:
+            messages += 1
+    report("reassemble", messages, time.perf_counter() - start, messages * len(packet))
+
+def bench_demux(args):
+    """多协议分发基准：按包头查表识别协议，与单协议解码对比"""
+    handler = ProtocolHandler(dispatch=DISPATCH_HEADER)
+    protocols = [Protocol(f"bench{i}", header=0xA0 + 2 * i) for i in range(4)]
+    for i, protocol in enumerate(protocols):
+        handler.register_protocol(i, protocol)
+    rng = random.Random(0)
+    frames = [
+        rng.choice(protocols).encode_packet(i & 0xFF, bytes(rng.getrandbits(8) for _ in range(args.payload)))
+        for i in range(args.count)
+    ]
+    stream = b"".join(frames)
+
+    decode = protocols[0].decode_packet
+    single = make_frames(protocols[0], args.count, args.payload)
+    start = time.perf_counter()
+    for frame in single:
+        decode(frame)
+    report("decode_packet (单协议)", len(single), time.perf_counter() - start)
+
+    demux = handler.demux_packet
+    start = time.perf_counter()
+    for frame in frames:
+        demux(frame)
+    report(f"demux_packet ({len(protocols)}协议)", len(frames), time.perf_counter() - start)
+
+    decoder = handler.create_stream_decoder(args.payload)
+    decoded = 0
+    start = time.perf_counter()
+    for i in range(0, len(stream), args.mtu):
+        decoded += len(decoder.feed(stream[i:i + args.mtu]))
+    report(f"StreamDecoder 混合流 (MTU={args.mtu})", decoded, time.perf_counter() - start, len(stream))
+
+def bench_session(args):
+    """流水线会话基准：模拟链路往返延迟，比较不同窗口下的请求吞吐量"""
+    protocol = Protocol("bench")
+    protocol.register_command(0x01, "echo", lambda data: data)
+    responder = SessionResponder(protocol)
+    rtt = 0.01  # 模拟的往返延迟（秒）
+    count = max(1, min(args.count, 2000))
+    payload = bytes(args.payload)
+
+    async def run(window, n):
+        loop = asyncio.get_running_loop()
+        session = None
+
+        def send(packet):
+            # 响应在一个往返延迟后到达
+            response = responder.handle_packet(packet)
+            if response is not None:
+                loop.call_later(rtt, session.feed_packet, response)
+
+        session = Session(protocol, send, window=window)
+        start = time.perf_counter()
+        await asyncio.gather(*[session.request(0x01, payload) for _ in range(n)])
+        return time.perf_counter() - start
+
+    for window in (1, 8, 32):
+        # 窗口为1时逐个往返，减少请求数以免耗时过长
+        n = count if window > 1 else max(1, count // 20)
+        report(f"Session (窗口={window}, RTT={rtt * 1000:.0f}ms)", n, asyncio.run(run(window, n)))
+
+def bench_schema(args):
+    """数据负载模式基准：手工切片解析与预编译模式解码对比"""
+    reading = Schema("Reading", [("sensor", "u8"), ("temperature", "i16"), ("humidity", "u16"), ("timestamp", "u32")])
+    payloads = [reading.encode((i & 0xFF, i % 1000 - 500, i % 100, i)) for i in range(1000)]
+    rounds = max(1, args.count // len(payloads))
+    count = rounds * len(payloads)
+
+    def manual(data):
+        return (data[0], int.from_bytes(data[1:3], "big", signed=True),
+                int.from_bytes(data[3:5], "big"), int.from_bytes(data[5:9], "big"))
+
+    for name, decode in (("手工切片解析", manual), ("Schema.decode (定长)", reading.decode)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for payload in payloads:
+                decode(payload)
+        report(name, count, time.perf_counter() - start, count * reading.size)
+
+    batch = Schema("Batch", [("sensor", "u8"), ("samples", Array("i16")), ("label", String())])
+    payload = batch.encode((1, tuple(range(args.payload)), "sensor-1"))
+    decode = batch.decode
+    start = time.perf_counter()
+    for _ in range(count):
+        decode(payload)
+    report("Schema.decode (变长)", count, time.perf_counter() - start, count * len(payload))
+
+def bench_coalesce(args):
+    """发送合并基准：小数据包逐个发送与合并为MTU大小写入的对比（默认协商MTU 247，一次写入可容纳多帧）"""
+    protocol = Protocol("bench")
+    mtu = args.coalesce_mtu
+    frame_size = protocol.min_packet_size + args.payload
+    if frame_size * 2 > mtu - ATT_HEADER_SIZE:
+        print(f"  注意: 每帧 {frame_size} 字节，MTU {mtu} 的一次写入容纳不下两帧，合并没有效果")
+    link_rate = 1000  # 模拟链路每秒可发送的通知数
+    count = args.count
+
+    async def run(coalesce):
+        writes = []
+        send = writes.append
+        start = time.perf_counter()
+        if coalesce:
+            coalescer = FrameCoalescer(protocol, send, mtu=mtu)
+            write = coalescer.write
+            for i in range(count):
+                await write(i & 0xFF, bytes(args.payload))
+            await coalescer.close()
+        else:
+            encode = protocol.encode_packet
+            for i in range(count):
+                send(encode(i & 0xFF, bytes(args.payload)))
+        return writes, time.perf_counter() - start
+
+    for coalesce in (False, True):
+        writes, elapsed = asyncio.run(run(coalesce))
+        label = "合并发送" if coalesce else "逐帧发送"
+        report(f"{label} (MTU={mtu})", count, elapsed)
+        link_seconds = len(writes) / link_rate
+        goodput = count * args.payload / link_seconds
+        print(f"  写入次数: {len(writes)}, 每次写入 {count / len(writes):.2f} 帧, "
+              f"链路 {link_rate} 包/秒时: {count / link_seconds:,.0f} 帧/秒, 有效负载 {goodput / 1000:.1f} KB/秒")
+
+def measure_allocations(func, count):
+    """用 tracemalloc 统计 func 执行期间的峰值临时内存（字节）和残留内存（字节/帧）"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline, (current - baseline) / count
+
+def bench_zerocopy(args):
+    """零拷贝解码基准：复制数据负载与 Packet 视图 + 缓冲区池对比耗时和内存分配"""
+    protocol = Protocol("bench", checksum="crc32")
+    size = max(args.payload, 256)
+    frames = make_frames(protocol, 64, size)
+    batch = b"".join(frames)
+    rounds = max(1, args.count // len(frames))
+    count = rounds * len(frames)
+    source = bytearray(batch)  # 模拟链路上收到的数据
+    pool = BufferPool(len(batch))
+    frame_size = len(frames[0])
+
+    def copy_path():
+        decode = protocol.decode_packet
+        for _ in range(rounds):
+            received = bytes(source)  # 传输层每次接收返回新的bytes
+            for i in range(0, len(received), frame_size):
+                decode(received[i:i + frame_size])
+
+    def view_path():
+        packet = Packet()
+        for _ in range(rounds):
+            buffer = pool.acquire()
+            with memoryview(buffer) as view:
+                view[:len(source)] = source  # 相当于 recv_into 写入复用的缓冲区
+                for packet in protocol.iter_packets(view, packet):
+                    pass
+                packet.release()
+            pool.release(buffer)
+
+    for name, func in (("decode_packet (复制)", copy_path), ("iter_packets (视图+缓冲区池)", view_path)):
+        start = time.perf_counter()
+        func()
+        report(f"{name} {size}B", count, time.perf_counter() - start, count * len(frames[0]))
+        peak, retained = measure_allocations(func, count)
+        print(f"  tracemalloc: 峰值临时内存 {peak:,} 字节, 残留 {retained:.2f} 字节/帧")
+    print(f"  缓冲区池: 新分配 {pool.created}, 复用 {pool.reused}")
+
+def bench_metrics(args):
+    """指标统计基准：比较未启用与启用指标时处理数据包的开销"""
+    protocol = Protocol("bench")
+    protocol.register_command(0x01, "echo", lambda data: data)
+    frames = make_frames(protocol, 1000, args.payload)
+    frames = [protocol.encode_packet(0x01, frame[4:-1]) for frame in frames]
+    rounds = max(1, args.count // len(frames))
+    count = rounds * len(frames)
+
+    for enabled in (False, True):
+        if enabled:
+            protocol.enable_metrics()
+        handle = protocol.handle_packet
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for frame in frames:
+                handle(frame)
+        report(f"handle_packet (指标{'启用' if enabled else '未启用'})", count, time.perf_counter() - start)
+
+    latency = protocol.metrics.snapshot()["commands"][0x01]["latency"]
+    print(f"  echo 处理耗时: p50 {latency['p50'] * 1e6:.1f} µs, p99 {latency['p99'] * 1e6:.1f} µs, "
+          f"最大 {latency['max'] * 1e6:.1f} µs")
+
+def bench_cache(args):
+    """响应缓存基准：客户端轮询纯函数命令时启用缓存前后的处理速率"""
+    config = {f"key{i}".encode(): os.urandom(args.payload) for i in range(16)}
+    schema = Schema("ConfigValue", [("found", "bool"), ("value", Array("u8"))])
+
+    def read_config(key):
+        value = config.get(bytes(key), b"")
+        return schema.encode((bool(value), tuple(value)))
+
+    protocol = Protocol("bench")
+    protocol.register_command(0x01, "read_config", read_config, cache=True)
+    keys = list(config)
+    frames = [protocol.encode_packet(0x01, keys[i % len(keys)]) for i in range(args.count)]
+
+    for enabled in (False, True):
+        if enabled:
+            cache = protocol.enable_response_cache(max_entries=256)
+        handle = protocol.handle_packet
+        start = time.perf_counter()
+        for frame in frames:
+            handle(frame)
+        report(f"handle_packet (缓存{'启用' if enabled else '未启用'})", len(frames), time.perf_counter() - start)
+    stats = cache.get_stats()
+    print(f"  命中率: {stats['hit_ratio']:.2%}, 条目: {stats['entries']}, 字节: {stats['bytes']}")
+
+def digest_rounds(data):
+    """CPU密集型阶段：重复计算摘要（模块级函数，可在进程池中执行）"""
+    for _ in range(2000):
+        data = hashlib.sha256(data).digest()
+    return data
+
+def bench_lanes(args):
+    """优先级通道基准：批量命令积压时控制命令的响应延迟和批量吞吐量"""
+    async def bulk_write(data):
+        await asyncio.sleep(0)  # 模拟一次写存储的让出
+        return None
+
+    def status(data):
+        return b"ok"
+
+    protocol = Protocol("bench")
+    protocol.register_command(0x01, "bulk_write", bulk_write, priority=PRIORITY_BULK)
+    protocol.register_command(0x02, "status", status, priority=PRIORITY_CONTROL)
+    bulk_frame = protocol.encode_packet(0x01, os.urandom(args.payload))
+    status_frame = protocol.encode_packet(0x02)
+    bulk_count = min(args.count, 20000)
+    probes = 50
+
+    async def run(enabled):
+        handler = ProtocolHandler()
+        handler.register_protocol(0, protocol)
+        if enabled:
+            handler.enable_priority_lanes(max_queue=bulk_count)
+            submit = handler.submit_packet
+        else:
+            # 未启用时按到达顺序逐个处理
+            lock = asyncio.Lock()
+
+            async def submit(frame):
+                async with lock:
+                    return await handler.handle_packet_async(frame)
+
+        start = time.perf_counter()
+        bulk = [asyncio.ensure_future(submit(bulk_frame)) for _ in range(bulk_count)]
+        latencies = []
+        for _ in range(probes):
+            await asyncio.sleep(0)
+            sent = time.perf_counter()
+            await submit(status_frame)
+            latencies.append(time.perf_counter() - sent)
+        await asyncio.gather(*bulk)
+        elapsed = time.perf_counter() - start
+        if enabled:
+            await handler.disable_priority_lanes()
+        label = "启用" if enabled else "未启用"
+        report(f"批量命令 (优先级通道{label})", bulk_count, elapsed)
+        print(f"  控制命令延迟: 平均 {sum(latencies) / len(latencies) * 1e3:.2f} ms, "
+              f"最大 {max(latencies) * 1e3:.2f} ms")
+
+    for enabled in (False, True):
+        asyncio.run(run(enabled))
+
+def bench_channel(args):
+    """逻辑通道基准：大文件上传进行中时交互通道的往返延迟"""
+    protocol = Protocol("bench")
+    chunk_size = 128
+    upload = os.urandom(chunk_size * min(args.count, 2000))
+    probes = 20
+
+    async def link(peer):
+        # 模拟链路：每次写入让出一次事件循环后到达对端
+        async def send(packet):
+            await asyncio.sleep(0)
+            peer().feed(packet)
+        return send
+
+    async def run_pipe():
+        # 单一字节管道：交互消息排在整个上传之后
+        decoder = protocol.create_stream_decoder()
+        send = await link(lambda: decoder)
+        start = time.perf_counter()
+        for offset in range(0, len(upload), chunk_size):
+            await send(protocol.encode_packet(0x01, upload[offset:offset + chunk_size]))
+        await send(protocol.encode_packet(0x02, b"ls"))
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed
+
+    async def run_mux():
+        client = server = None
+        client = ChannelMux(protocol, await link(lambda: server), chunk_size=chunk_size)
+        server = ChannelMux(protocol, await link(lambda: client), initiator=False, chunk_size=chunk_size)
+
+        async def serve():
+            async for channel in server:
+                asyncio.ensure_future(drain(channel))
+
+        async def drain(channel):
+            async for message in channel:
+                if channel.name == "shell":
+                    await channel.send(message)
+
+        serving = asyncio.ensure_future(serve())
+        file_channel = await client.open("upload")
+        shell = await client.open("shell")
+        start = time.perf_counter()
+        transfer = asyncio.ensure_future(file_channel.send(upload))
+        latencies = []
+        for _ in range(probes):
+            sent = time.perf_counter()
+            await shell.send(b"ls")
+            await shell.recv_message()
+            latencies.append(time.perf_counter() - sent)
+        await transfer
+        elapsed = time.perf_counter() - start
+        serving.cancel()
+        await client.close()
+        await server.close()
+        return elapsed, sum(latencies) / len(latencies)
+
+    chunks = len(upload) // chunk_size
+    elapsed, latency = asyncio.run(run_pipe())
+    report("单一管道上传", chunks, elapsed)
+    print(f"  交互消息等待: {latency * 1e3:.2f} ms（排在整个上传之后）")
+    elapsed, latency = asyncio.run(run_mux())
+    report("通道复用上传", chunks, elapsed)
+    print(f"  交互通道平均往返: {latency * 1e3:.2f} ms")
+
+def bench_counters(args):
+    """状态计数基准：每条消息加锁计数与事件循环内无锁计数（含速率窗口和耗时直方图）"""
+    count = args.count
+
+    async def locked():
+        lock = asyncio.Lock()
+        total = 0
+        for _ in range(count):
+            async with lock:
+                total += 1
+        return total
+
+    async def lock_free():
+        total = 0
+        for _ in range(count):
+            total += 1
+        return total
+
+    async def lock_free_rates():
+        messages = RateCounter()
+        byte_rate = RateCounter()
+        latency = LatencyHistogram()
+        total = 0
+        for _ in range(count):
+            total += 1
+            now = time.monotonic()
+            messages.record(1, now)
+            byte_rate.record(args.payload, now)
+            latency.record(0.0002)
+        return total
+
+    for name, func in (("asyncio.Lock 计数", locked), ("无锁计数", lock_free),
+                       ("无锁计数 + 速率窗口 + 耗时直方图", lock_free_rates)):
+        start = time.perf_counter()
+        asyncio.run(func())
+        report(name, count, time.perf_counter() - start)
+
+def bench_notify(args):
+    """TX通知队列基准：写入处理中直接等待通知发出与交给发送队列（合并连续的回复帧）"""
+    count = min(args.count, 2000)
+    response = Protocol("notify").encode_packet(0x01, os.urandom(args.payload))
+    max_batch = args.coalesce_mtu - ATT_HEADER_SIZE  # 回复是自带长度的帧，可以合并到一次通知
+    send_delay = 0.0002  # 模拟一次通知的往返耗时
+
+    async def notify(value):
+        await asyncio.sleep(send_delay)
+
+    async def inline():
+        start = time.perf_counter()
+        for _ in range(count):
+            await notify(response)
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed, count
+
+    async def queued():
+        queue = NotificationQueue(notify, max_size=256, max_batch=max_batch)
+        start = time.perf_counter()
+        for _ in range(count):
+            await queue.put(response)
+        handled = time.perf_counter() - start
+        await queue.stop(drain=True)
+        return handled, time.perf_counter() - start, queue.batches
+
+    for name, func in (("写入处理中等待通知", inline), ("通知发送队列", queued)):
+        handled, delivered, sends = asyncio.run(func())
+        report(name, count, handled)
+        print(f"  全部送达: {delivered * 1e3:.1f} ms, 通知次数: {sends}")
+
+def bench_pipeline(args):
+    """流水线基准：CPU密集型阶段在事件循环、线程池和进程池中执行的吞吐量"""
+    count = min(args.count, 400)
+    workers = os.cpu_count() or 1
+    messages = [os.urandom(args.payload) for _ in range(count)]
+
+    async def run(offload):
+        pipeline = Pipeline("bench")
+        pipeline.add_stage("digest", digest_rounds, offload)
+        inflight = 1 if offload is None else workers
+        semaphore = asyncio.Semaphore(inflight)
+
+        async def one(message):
+            async with semaphore:
+                await pipeline.run(message)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(message) for message in messages))
+        elapsed = time.perf_counter() - start
+        pipeline.shutdown_executors()
+        return elapsed
+
+    print(f"  CPU 核数: {workers}")
+    for name, offload in (("事件循环内执行", None), ("线程池", OFFLOAD_IO), ("进程池", OFFLOAD_CPU)):
+        report(name, count, asyncio.run(run(offload)))
+
+def bench_logging(args):
+    """日志基准：写入处理中同步写日志文件与队列日志（延迟格式化、按模板限流）的单条耗时"""
+    count = min(args.count, 20000)
+    messages = [os.urandom(args.payload) for _ in range(256)]
+    bench_logger = logging.getLogger("bench.logging")
+    bench_logger.propagate = False
+    formatter = logging.Formatter(DEFAULT_FORMAT)
+
+    def run(name, log):
+        latency = LatencyHistogram()
+        start = time.perf_counter()
+        for i in range(count):
+            t = time.perf_counter()
+            log(i, messages[i & 0xFF])
+            latency.record(time.perf_counter() - t)
+        report(name, count, time.perf_counter() - start)
+        stats = latency.snapshot()
+        print(f"  单条耗时 p50: {stats['p50'] * 1e6:.1f} us, p99: {stats['p99'] * 1e6:.1f} us, "
+              f"最大: {stats['max'] * 1e6:.1f} us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = logging.FileHandler(os.path.join(tmp, "sync.log"))
+        handler.setFormatter(formatter)
+        bench_logger.addHandler(handler)
+        bench_logger.setLevel(logging.DEBUG)
+        run("同步文件 + f-string", lambda i, value: bench_logger.debug(f"收到写入请求 {i}: {value}"))
+        bench_logger.removeHandler(handler)
+        handler.close()
+
+        for name, rate in (("队列 + 延迟格式化", 0), ("队列 + 延迟格式化 + 限流", 100)):
+            handler = logging.FileHandler(os.path.join(tmp, f"queue{rate}.log"))
+            handler.setFormatter(formatter)
+            log = QueueLogging([handler], level=logging.DEBUG, rate=rate, max_queue=count, target=bench_logger)
+            with log:
+                run(name, lambda i, value: bench_logger.debug("收到写入请求 %d: %s", i, value))
+            stats = log.get_stats()
+            print(f"  限流抑制: {stats['suppressed']}, 队列满丢弃: {stats['dropped']}")
+            handler.close()
+
+        traffic = TrafficLog(os.path.join(tmp, "traffic.cap"), max_queue=count)
+        run("二进制流量日志", lambda i, value: traffic.record(0, value))
+        traffic.close()
+        print(f"  已写入记录: {traffic.records}")
+
+def bench_transfer(args):
+    """批量传输基准：单程延迟 2 ms 的模拟链路上，逐块确认与信用窗口的吞吐量"""
+    protocol = Protocol("bench")
+    latency = 0.002
+    data = os.urandom(DEFAULT_CHUNK_SIZE * min(args.count, 500))
+
+    def link(deliver):
+        # 模拟链路：数据包按发送顺序在 latency 秒后到达对端
+        queue = asyncio.Queue()
+
+        async def pump():
+            loop = asyncio.get_running_loop()
+            while True:
+                due, packet = await queue.get()
+                if due > loop.time():
+                    await asyncio.sleep(due - loop.time())
+                await deliver(packet)
+
+        def send(packet):
+            queue.put_nowait((asyncio.get_running_loop().time() + latency, packet))
+        return send, pump
+
+    async def run(directory, window):
+        sender_decoder = protocol.create_stream_decoder()
+        receiver_decoder = protocol.create_stream_decoder()
+
+        async def to_sender(packet):
+            for command_id, payload in sender_decoder.feed(packet):
+                sender.feed_frame(command_id, payload)
+
+        async def to_receiver(packet):
+            for command_id, payload in receiver_decoder.feed(packet):
+                await receiver.handle_frame(command_id, payload)
+
+        send_back, pump_back = link(to_sender)
+        send_forward, pump_forward = link(to_receiver)
+        receiver = TransferReceiver(protocol, send_back, directory, window=window)
+        sender = TransferSender(protocol, send_forward)
+        pumps = [asyncio.ensure_future(pump_back()), asyncio.ensure_future(pump_forward())]
+        start = time.perf_counter()
+        await sender.send(data, f"window{window}.bin")
+        elapsed = time.perf_counter() - start
+        for pump in pumps:
+            pump.cancel()
+        return elapsed, sender.get_stats()
+
+    chunks = len(data) // DEFAULT_CHUNK_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, window in (("逐块确认（窗口 1）", 1), ("信用窗口 32", 32)):
+            elapsed, stats = asyncio.run(run(tmp, window))
+            report(name, chunks, elapsed, len(data))
+            print(f"  等待信用: {stats['credit_stalls']} 次")
+        with open(os.path.join(tmp, "window32.bin"), "rb") as f:
+            print(f"  接收文件一致: {'是' if f.read() == data else '否'}")
+
+BENCHMARKS = {
+    'stream': bench_stream,
+    'batch': bench_batch,
+    'checksum': bench_checksum,
+    'segment': bench_segment,
+    'demux': bench_demux,
+    'session': bench_session,
+    'schema': bench_schema,
+    'coalesce': bench_coalesce,
+    'zerocopy': bench_zerocopy,
+    'metrics': bench_metrics,
+    'cache': bench_cache,
+    'lanes': bench_lanes,
+    'channel': bench_channel,
+    'counters': bench_counters,
+    'notify': bench_notify,
+    'pipeline': bench_pipeline,
+    'logging': bench_logging,
+    'transfer': bench_transfer,
+}
+
+def main():
+    """主函数"""
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='协议性能基准测试工具')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f'要运行的基准测试，默认运行全部，可选: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--count', type=int, default=100000, help='测试帧数')
+    parser.add_argument('--payload', type=int, default=16, help='每帧数据负载长度（字节）')
+    parser.add_argument('--mtu', type=int, default=20, help='模拟的单次写入长度（字节）')
+    parser.add_argument('--coalesce-mtu', type=int, default=247, help='coalesce 场景模拟的协商后 ATT MTU')
+    parser.add_argument('--verbose', '-v', action='store_true', help='显示详细日志')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准测试: {', '.join(unknown)}，可选: {', '.join(BENCHMARKS)}")
+
+    # 设置日志，基准测试默认只输出警告以上级别
+    log_level = logging.DEBUG if args.verbose else logging.WARNING
+    setup_logging(log_level)
+
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"\n== {name} ==")
+        BENCHMARKS[name](args)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+抓包回放命令行工具
+
+默认按通道把 RX 记录送入流式解码器后逐帧处理，因此既能回放 Protocol.start_capture
+记录的完整数据包，也能回放服务器 --traffic-log 记录的原始写入（分片、粘连）；
+--packets 把每条记录作为一个完整数据包交给 handle_packet。
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from collections import Counter
+
+from bluetooth_toolkit import Protocol
+from bluetooth_toolkit.protocol import STREAM_MAX_DATA_LENGTH
+from bluetooth_toolkit.capture import DIRECTION_RX, DIRECTION_TX, CaptureReader, replay
+from bluetooth_toolkit.checksum import CHECKSUMS
+from bluetooth_toolkit.utils import setup_logging
+
+def print_info(reader):
+    """输出抓包文件摘要"""
+    directions = Counter()
+    channels = Counter()
+    commands = Counter()
+    size = 0
+    for record in reader:
+        directions[record.direction] += 1
+        channels[record.channel] += 1
+        size += len(record.frame)
+        if record.direction == DIRECTION_RX and len(record.frame) > 1:
+            commands[record.frame[1]] += 1
+    print(f"记录数: {len(reader)}, 时长: {reader.duration:.3f} 秒, 数据: {size} 字节")
+    print(f"接收: {directions[DIRECTION_RX]}, 发送: {directions[DIRECTION_TX]}")
+    print(f"通道: {', '.join(f'{channel}={count}' for channel, count in sorted(channels.items()))}")
+    print("接收命令分布:")
+    for command_id, count in commands.most_common(10):
+        print(f"  0x{command_id:02X}: {count}")
+
+def stream_target(protocol, use_async, max_data_length, counts):
+    """
+    创建按通道流式解码的回放目标
+
+    参数:
+        protocol: 处理命令的协议
+        use_async: 是否使用 handle_command_async
+        max_data_length: 流式解码器允许的最大数据长度
+        counts: 计数器，累计解码的帧数和丢弃的字节数
+
+    返回:
+        以 (数据, 通道号) 调用的协程函数，返回本条记录产生的响应列表，没有响应时返回None
+    """
+    decoders = {}
+
+    async def target(data, channel):
+        decoder = decoders.get(channel)
+        if decoder is None:
+            decoder = decoders[channel] = protocol.create_stream_decoder(max_data_length)
+        discarded = decoder.bytes_discarded
+        frames = decoder.feed(data)
+        responses = []
+        for command_id, payload in frames:
+            if use_async:
+                response = await protocol.handle_command_async(command_id, payload)
+            else:
+                response = protocol.handle_command(command_id, payload)
+            if response is not None:
+                responses.append(response)
+        counts["frames"] += len(frames)
+        counts["discarded"] += decoder.bytes_discarded - discarded
+        return responses or None
+
+    return target
+
+def main():
+    """主函数"""
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='抓包回放工具')
+    parser.add_argument('capture', help='抓包文件路径')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='回放速度倍数，1为原始速度，0为最大速度（默认）')
+    parser.add_argument('--checksum', choices=list(CHECKSUMS), default='sum8', help='协议校验和算法')
+    parser.add_argument('--channel', type=int, help='只回放指定通道')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='使用 handle_command_async（--packets 时为 handle_packet_async）处理')
+    parser.add_argument('--packets', action='store_true',
+                        help='每条记录作为一个完整数据包处理，不经流式解码（只适用于 Protocol.start_capture 的抓包）')
+    parser.add_argument('--max-data-length', type=int, default=STREAM_MAX_DATA_LENGTH,
+                        help='流式解码允许的最大数据长度，超过视为损坏帧')
+    parser.add_argument('--info', action='store_true', help='只输出抓包文件摘要')
+    parser.add_argument('--verbose', '-v', action='store_true', help='显示详细日志')
+    args = parser.parse_args()
+
+    # 设置日志，回放时默认只输出警告以上级别
+    log_level = logging.DEBUG if args.verbose else logging.WARNING
+    setup_logging(log_level)
+
+    try:
+        reader = CaptureReader(args.capture)
+    except (OSError, ValueError) as e:
+        print(f"无法打开抓包文件: {e}")
+        return 1
+
+    with reader:
+        if args.info:
+            print_info(reader)
+            return 0
+
+        # 所有命令注册为回显，测量解码和分发的吞吐量
+        protocol = Protocol("replay", checksum=args.checksum)
+        for command_id in range(256):
+            protocol.register_command(command_id, f"cmd_{command_id:02X}", lambda data: data)
+        metrics = protocol.enable_metrics()
+        speed = args.speed or None
+        if args.packets:
+            target = protocol.handle_packet_async if args.use_async else protocol.handle_packet
+            stats = asyncio.run(replay(reader, target, speed=speed, channel=args.channel))
+            print(f"回放 {stats['frames']} 帧, 响应 {stats['responses']} 帧, 耗时 {stats['elapsed']:.3f} 秒, "
+                  f"{stats['frames_per_second']:,.0f} 帧/秒")
+            snapshot = metrics.snapshot()
+            print(f"解码错误: {snapshot['decode_errors']}")
+        else:
+            counts = Counter()
+            target = stream_target(protocol, args.use_async, args.max_data_length, counts)
+            stats = asyncio.run(replay(reader, target, speed=speed, channel=args.channel, pass_channel=True))
+            elapsed = stats['elapsed']
+            print(f"回放 {stats['frames']} 条记录, 解码 {counts['frames']} 帧, 耗时 {elapsed:.3f} 秒, "
+                  f"{counts['frames'] / elapsed if elapsed > 0 else 0.0:,.0f} 帧/秒")
+            print(f"丢弃字节: {counts['discarded']}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
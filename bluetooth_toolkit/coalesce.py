@@ -0,0 +1,229 @@
+"""
+发送合并模块 - 将多个小数据包合并为一次MTU大小的写入
+
+类似TCP的Nagle算法：数据包先进入发送缓冲区，缓冲区写满一个MTU、
+等待超过最大延迟或显式调用 flush 时才整体发出。接收端使用
+StreamDecoder 即可从合并后的写入中还原各个数据包。
+"""
+
+import asyncio
+import inspect
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from .protocol import Protocol
+from .segment import ATT_HEADER_SIZE, DEFAULT_MTU
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_DELAY = 0.005  # 默认最大合并延迟（秒）
+
+
+class FrameCoalescer:
+    """
+    发送合并器
+
+    位于 Protocol.encode_packet 与传输层之间。低延迟命令可通过 bypass_commands
+    或 urgent 参数绕过合并：先发出已缓冲的数据包以保持顺序，再立即单独发送。
+    取出缓冲区的写入（包括定时器到期时）在取出时同步提交：发送空闲时直接发出，
+    否则进入发送队列由单个发送任务按提交顺序发出，写入顺序与取出顺序一致。
+    """
+
+    def __init__(self, protocol: Protocol, send: Callable[[bytes], Any], mtu: int = DEFAULT_MTU,
+                 max_delay: float = DEFAULT_MAX_DELAY, bypass_commands: Iterable[int] = ()):
+        """
+        初始化发送合并器
+
+        参数:
+            protocol: 编码数据包使用的协议对象
+            send: 发送一次写入的函数，可以是普通函数或返回可等待对象的函数
+            mtu: 协商后的ATT MTU，每次写入不超过 MTU - 3 字节
+            max_delay: 数据包在缓冲区中等待的最长时间（秒），0表示每次写入后在下一轮事件循环发出
+            bypass_commands: 不参与合并、立即发送的命令ID
+        """
+        if mtu <= ATT_HEADER_SIZE:
+            raise ValueError(f"MTU过小: {mtu}")
+        self.protocol = protocol
+        self.send = send
+        self.capacity = mtu - ATT_HEADER_SIZE  # 单次写入的最大字节数
+        self.max_delay = max_delay
+        self.bypass_commands = set(bypass_commands)
+        self._buffer = bytearray()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._outbox: Deque[Tuple[bytes, asyncio.Future]] = deque()  # 待发出的写入及其完成通知
+        self._sender: Optional[asyncio.Task] = None  # 发送任务，发送队列为空时退出
+
+        # 统计计数
+        self.frames = 0  # 写入的数据包数
+        self.writes = 0  # 实际发出的写入次数
+        self.bytes_sent = 0  # 发出的字节数
+        self.bypassed = 0  # 绕过合并的数据包数
+        self.size_flushes = 0  # 因缓冲区写满发出的次数
+        self.timer_flushes = 0  # 因超过最大延迟发出的次数
+        self.explicit_flushes = 0  # 因显式flush或绕过发出的次数
+
+    @property
+    def pending(self) -> int:
+        """缓冲区中尚未发出的字节数"""
+        return len(self._buffer)
+
+    async def write(self, command_id: int, data: bytes = b"", urgent: bool = False) -> None:
+        """
+        编码并写入一个数据包
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+            urgent: 是否立即发送，不参与合并
+        """
+        packet = self.protocol.encode_packet(command_id, data)
+        await self.write_packet(packet, urgent or command_id in self.bypass_commands)
+
+    async def write_packet(self, packet: bytes, urgent: bool = False) -> None:
+        """
+        写入一个已编码的数据包
+
+        参数:
+            packet: 编码后的数据包
+            urgent: 是否立即发送，不参与合并
+        """
+        self.frames += 1
+        buffer = self._buffer
+
+        if urgent or len(packet) >= self.capacity:
+            # 绕过合并或超过单次写入长度的数据包单独发送，先发出缓冲区以保持顺序
+            if urgent:
+                self.bypassed += 1
+            if buffer:
+                self.explicit_flushes += 1
+                self._submit(self._take())
+            await self._transmit(packet)
+            return
+
+        if len(buffer) + len(packet) > self.capacity:
+            self.size_flushes += 1
+            pending = self._take()
+            buffer = self._buffer
+            buffer += packet
+            self._arm_timer()
+            await self._transmit(pending)
+            return
+
+        buffer += packet
+        if len(buffer) == self.capacity:
+            self.size_flushes += 1
+            await self._transmit(self._take())
+        else:
+            self._arm_timer()
+
+    async def flush(self) -> None:
+        """立即发出缓冲区中的所有数据包"""
+        if self._buffer:
+            self.explicit_flushes += 1
+            await self._transmit(self._take())
+
+    async def close(self) -> None:
+        """发出剩余数据并停止定时器"""
+        await self.flush()
+        self._cancel_timer()
+        if self._sender is not None:
+            await self._sender
+
+    def _take(self) -> bytes:
+        """取出缓冲区内容并清空"""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._cancel_timer()
+        return data
+
+    def _arm_timer(self) -> None:
+        """缓冲区非空且未设置定时器时启动最大延迟定时器"""
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._on_timer)
+
+    def _cancel_timer(self) -> None:
+        """取消最大延迟定时器"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self) -> None:
+        """最大延迟到期，发出缓冲区"""
+        self._timer = None
+        if self._buffer:
+            self.timer_flushes += 1
+            self._submit(self._take())
+
+    async def _transmit(self, data: bytes) -> None:
+        """发出一次写入并等待发送完成"""
+        done = self._submit(data)
+        if done is not None:
+            await done
+
+    def _submit(self, data: bytes) -> Optional[asyncio.Future]:
+        """
+        同步确定写入顺序：发送队列空闲时直接发送，否则排在队列之后
+
+        返回:
+            Optional[asyncio.Future]: 发送完成时完成的Future，已同步发出时为None
+        """
+        loop = asyncio.get_running_loop()
+        if self._outbox or (self._sender is not None and not self._sender.done()):
+            done = loop.create_future()
+            self._outbox.append((data, done))
+            return done
+        self.writes += 1
+        self.bytes_sent += len(data)
+        try:
+            result = self.send(data)
+        except Exception as e:
+            logger.error(f"发送合并写入时出错: {e}")
+            return None
+        if not inspect.isawaitable(result):
+            return None
+        # 发送完成前提交的写入进入队列，由发送任务在本次发送完成后发出
+        done = loop.create_future()
+        self._sender = loop.create_task(self._send_loop(result, done))
+        return done
+
+    async def _send_loop(self, inflight: Any, inflight_done: asyncio.Future) -> None:
+        """发送任务：等待进行中的发送完成，再按提交顺序逐个发出排队的写入"""
+        try:
+            await inflight
+        except Exception as e:
+            logger.error(f"发送合并写入时出错: {e}")
+        if not inflight_done.done():
+            inflight_done.set_result(None)
+        outbox = self._outbox
+        while outbox:
+            data, done = outbox.popleft()
+            self.writes += 1
+            self.bytes_sent += len(data)
+            try:
+                result = self.send(data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"发送合并写入时出错: {e}")
+            if not done.done():
+                done.set_result(None)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取合并统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "frames": self.frames,
+            "writes": self.writes,
+            "bytes_sent": self.bytes_sent,
+            "frames_per_write": self.frames / self.writes if self.writes else 0,
+            "fill_ratio": self.bytes_sent / (self.writes * self.capacity) if self.writes else 0,
+            "bypassed": self.bypassed,
+            "size_flushes": self.size_flushes,
+            "timer_flushes": self.timer_flushes,
+            "explicit_flushes": self.explicit_flushes,
+        }
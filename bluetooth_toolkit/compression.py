@@ -0,0 +1,211 @@
+"""
+压缩模块 - 提供协议数据负载的可选压缩和编解码协商
+"""
+
+import bz2
+import logging
+import lzma
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+DEFAULT_THRESHOLD = 128  # 数据负载达到该长度才尝试压缩
+MAX_DECOMPRESSED_SIZE = 1 << 20  # 解压后允许的最大长度，防止解压炸弹
+
+# 编解码器ID -> (名称, 压缩函数, 解压器工厂)
+# 压缩后的数据负载格式: [编解码器ID(1字节)] [压缩数据]
+CODECS: Dict[int, Tuple[str, Callable[[BytesLike, Optional[int]], bytes], Callable]] = {
+    1: ("zlib",
+        lambda data, level: zlib.compress(data, -1 if level is None else level),
+        zlib.decompressobj),
+    2: ("bz2",
+        lambda data, level: bz2.compress(data, 9 if level is None else level),
+        bz2.BZ2Decompressor),
+    3: ("lzma",
+        lambda data, level: lzma.compress(data, preset=level),
+        lzma.LZMADecompressor),
+}
+CODEC_IDS = {name: codec_id for codec_id, (name, _, _) in CODECS.items()}
+
+
+def decompress_payload(data: BytesLike, max_size: int = MAX_DECOMPRESSED_SIZE) -> Optional[bytes]:
+    """
+    解压压缩帧的数据负载
+
+    参数:
+        data: 压缩帧的数据负载，首字节为编解码器ID
+        max_size: 解压后允许的最大长度
+
+    返回:
+        Optional[bytes]: 解压后的数据，编解码器未知、数据损坏或超长时返回None
+    """
+    if not data:
+        logger.error("压缩帧数据负载为空")
+        return None
+    codec = CODECS.get(data[0])
+    if codec is None:
+        logger.error(f"未知的编解码器ID: {data[0]}")
+        return None
+    name, _, decompressor_factory = codec
+    try:
+        decompressor = decompressor_factory()
+        result = decompressor.decompress(memoryview(data)[1:], max_size + 1)
+    except Exception as e:
+        logger.error(f"{name} 解压失败: {e}")
+        return None
+    if len(result) > max_size:
+        logger.error(f"解压后数据超过最大长度 {max_size}")
+        return None
+    if not decompressor.eof:
+        logger.error(f"{name} 压缩数据不完整")
+        return None
+    return result
+
+
+class PayloadCompressor:
+    """
+    数据负载压缩器
+
+    负责决定哪些数据负载需要压缩、执行压缩/解压，并统计节省的字节数和耗费的CPU时间。
+    发送端使用的编解码器可通过 offer/negotiate 与对端协商。
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, codecs: Iterable[str] = ("zlib",),
+                 level: Optional[int] = None, max_decompressed_size: int = MAX_DECOMPRESSED_SIZE):
+        """
+        初始化压缩器
+
+        参数:
+            threshold: 数据负载达到该长度才尝试压缩
+            codecs: 本端支持的编解码器名称，按优先级排序，首个为默认发送编解码器
+            level: 压缩级别，None表示使用编解码器默认值
+            max_decompressed_size: 解压后允许的最大长度
+        """
+        codec_ids = []
+        for name in codecs:
+            if name not in CODEC_IDS:
+                raise ValueError(f"未知的编解码器: {name}，可选: {', '.join(CODEC_IDS)}")
+            codec_ids.append(CODEC_IDS[name])
+        if not codec_ids:
+            raise ValueError("至少需要一个编解码器")
+
+        self.threshold = threshold
+        self.level = level
+        self.max_decompressed_size = max_decompressed_size
+        self.codec_ids = tuple(codec_ids)
+        self.codec_id: Optional[int] = codec_ids[0]  # 发送使用的编解码器，None表示对端不支持压缩
+
+        # 统计计数
+        self.compressed_frames = 0  # 压缩发送的帧数
+        self.skipped_frames = 0  # 尝试压缩但收益不足而原样发送的帧数
+        self.bytes_in = 0  # 被压缩帧的原始字节数
+        self.bytes_out = 0  # 被压缩帧压缩后的字节数（含编解码器ID）
+        self.compress_seconds = 0.0  # 压缩耗时
+        self.decompressed_frames = 0  # 解压的帧数
+        self.decompress_errors = 0  # 解压失败次数
+        self.decompress_seconds = 0.0  # 解压耗时
+
+    @property
+    def codec(self) -> Optional[str]:
+        """当前发送使用的编解码器名称"""
+        return CODECS[self.codec_id][0] if self.codec_id is not None else None
+
+    @property
+    def bytes_saved(self) -> int:
+        """压缩节省的字节数"""
+        return self.bytes_in - self.bytes_out
+
+    def offer(self) -> bytes:
+        """
+        生成编解码器协商报文
+
+        返回:
+            bytes: 本端支持的编解码器ID列表，按优先级排序
+        """
+        return bytes(self.codec_ids)
+
+    def negotiate(self, peer_offer: BytesLike) -> Optional[str]:
+        """
+        根据对端的协商报文选择发送使用的编解码器
+
+        参数:
+            peer_offer: 对端 offer() 生成的报文
+
+        返回:
+            Optional[str]: 选定的编解码器名称，双方无共同编解码器时返回None并停止压缩发送
+        """
+        peer_ids = set(peer_offer)
+        self.codec_id = next((codec_id for codec_id in self.codec_ids if codec_id in peer_ids), None)
+        if self.codec_id is None:
+            logger.info("与对端无共同的编解码器，停止压缩发送")
+        else:
+            logger.info(f"已协商编解码器: {self.codec}")
+        return self.codec
+
+    def compress(self, data: BytesLike) -> Optional[bytes]:
+        """
+        压缩数据负载
+
+        参数:
+            data: 原始数据负载
+
+        返回:
+            Optional[bytes]: 压缩后的数据负载（含编解码器ID），压缩后不更短时返回None
+        """
+        codec_id = self.codec_id
+        if codec_id is None:
+            return None
+        start = time.perf_counter()
+        compressed = bytes((codec_id,)) + CODECS[codec_id][1](data, self.level)
+        self.compress_seconds += time.perf_counter() - start
+        if len(compressed) >= len(data):
+            self.skipped_frames += 1
+            return None
+        self.compressed_frames += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return compressed
+
+    def decompress(self, data: BytesLike) -> Optional[bytes]:
+        """
+        解压压缩帧的数据负载
+
+        参数:
+            data: 压缩帧的数据负载
+
+        返回:
+            Optional[bytes]: 解压后的数据，失败返回None
+        """
+        start = time.perf_counter()
+        result = decompress_payload(data, self.max_decompressed_size)
+        self.decompress_seconds += time.perf_counter() - start
+        if result is None:
+            self.decompress_errors += 1
+        else:
+            self.decompressed_frames += 1
+        return result
+
+    def get_stats(self) -> Dict[str, Union[int, float, str, None]]:
+        """
+        获取压缩统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "codec": self.codec,
+            "compressed_frames": self.compressed_frames,
+            "skipped_frames": self.skipped_frames,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_saved,
+            "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 0,
+            "compress_seconds": self.compress_seconds,
+            "decompressed_frames": self.decompressed_frames,
+            "decompress_errors": self.decompress_errors,
+            "decompress_seconds": self.decompress_seconds,
+        }
@@ -0,0 +1,122 @@
+"""
+指标导出模块 - 在本地HTTP端口或Unix套接字上提供指标抓取
+
+只实现抓取所需的最小HTTP/1.0子集:
+    GET /metrics  Prometheus文本格式
+    GET /stats    JSON格式
+指标在收到抓取请求时才生成，记录指标的代码路径不受导出影响。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"  # 默认只监听本机
+DEFAULT_PORT = 9101
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+_MAX_REQUEST_HEADER = 8192  # 请求头最大字节数
+_READ_TIMEOUT = 5.0  # 读取请求的超时（秒）
+
+
+class MetricsExporter:
+    """
+    指标导出服务
+
+    render_prometheus 和 render_json 在事件循环线程中调用，
+    与只在事件循环中更新的计数器之间不需要加锁。
+    """
+
+    def __init__(self, render_prometheus: Callable[[], str], render_json: Optional[Callable[[], Dict]] = None):
+        """
+        初始化指标导出服务
+
+        参数:
+            render_prometheus: 生成Prometheus文本的函数
+            render_json: 生成JSON可序列化字典的函数，None表示不提供 /stats
+        """
+        self.render_prometheus = render_prometheus
+        self.render_json = render_json
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.path: Optional[str] = None
+        self.requests = 0  # 处理的抓取请求数
+
+    @property
+    def address(self) -> Optional[str]:
+        """监听地址，未启动时为None"""
+        if self._server is None:
+            return None
+        if self.path is not None:
+            return self.path
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, path: Optional[str] = None) -> None:
+        """
+        开始监听
+
+        参数:
+            host: 监听地址
+            port: 监听端口，0表示由系统分配
+            path: Unix套接字路径，指定时忽略 host/port
+        """
+        if self._server is not None:
+            return
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+            self.path = path
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"指标导出已启动: {self.address}")
+
+    async def stop(self) -> None:
+        """停止监听"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        logger.info("指标导出已停止")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个抓取连接"""
+        try:
+            header = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), _READ_TIMEOUT)
+            if len(header) > _MAX_REQUEST_HEADER:
+                raise ValueError("请求头过长")
+            parts = header.split(b"\r\n", 1)[0].split()
+            method = parts[0] if parts else b""
+            target = parts[1].split(b"?", 1)[0] if len(parts) > 1 else b""
+            self.requests += 1
+            if method not in (b"GET", b"HEAD"):
+                status, content_type, body = "405 Method Not Allowed", "text/plain", b"method not allowed\n"
+            elif target == b"/metrics":
+                status, content_type, body = "200 OK", PROMETHEUS_CONTENT_TYPE, self.render_prometheus().encode("utf-8")
+            elif target == b"/stats" and self.render_json is not None:
+                body = json.dumps(self.render_json(), ensure_ascii=False, indent=2).encode("utf-8")
+                status, content_type = "200 OK", JSON_CONTENT_TYPE
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii"))
+            if method != b"HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError) as e:
+            logger.debug(f"无效的抓取请求: {e}")
+        except Exception as e:
+            logger.error(f"处理抓取请求时出错: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,344 @@
+"""
+进程内模拟的 BLE 外设后端 - 在没有蓝牙硬件的机器上运行和测量 GATT 服务器
+
+    FakeBlessServer  与 bless.BlessServer 用法相同的替身：登记服务和特征，记录 update_value 调用并转给订阅者，
+                     由 write/connect/disconnect 模拟客户端的写入和连接事件
+    LoadGenerator    模拟 N 个客户端按设定的速率和长度并发写入，统计接受/拒绝数和写入回调耗时
+
+没有安装 bless 时，本模块也提供 GATTCharacteristicProperties/GATTAttributePermissions 的同名替身。
+"""
+
+import asyncio
+import inspect
+import logging
+import random
+import time
+from collections import deque
+from enum import IntFlag
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECENT = 64  # 保留最近发出的通知条数
+
+
+class GATTCharacteristicProperties(IntFlag):
+    """特征属性（取值与 bless 相同）"""
+    broadcast = 0x0001
+    read = 0x0002
+    write_without_response = 0x0004
+    write = 0x0008
+    notify = 0x0010
+    indicate = 0x0020
+
+
+class GATTAttributePermissions(IntFlag):
+    """属性权限（取值与 bless 相同）"""
+    readable = 0x1
+    writeable = 0x2
+    read_encryption_required = 0x4
+    write_encryption_required = 0x8
+
+
+class FakeCharacteristic:
+    """模拟的 GATT 特征"""
+
+    __slots__ = ("uuid", "service_uuid", "properties", "permissions", "value")
+
+    def __init__(self, service_uuid: str, uuid: str, properties: int, value: Optional[bytearray], permissions: int):
+        self.service_uuid = service_uuid
+        self.uuid = uuid
+        self.properties = properties
+        self.permissions = permissions
+        self.value = value if value is not None else bytearray()
+
+
+class FakeBlessServer:
+    """
+    BlessServer 的进程内替身
+
+    write_request_func 可以是普通函数或协程函数，write 按 bless 的参数形式调用它，
+    客户端地址放在 options["device"] 中。update_value 记录通知并转给 subscribe 登记的回调
+    （模拟订阅了通知的客户端），可选地模拟发送耗时。
+    """
+
+    def __init__(self, name: str, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 handle_connection: Optional[Callable] = None, handle_disconnection: Optional[Callable] = None,
+                 notify_delay: float = 0.0, recent: int = DEFAULT_RECENT):
+        """
+        初始化模拟服务器
+
+        参数:
+            name: 设备名称
+            loop: 事件循环，保留参数以与 BlessServer 兼容
+            handle_connection: 客户端连接回调 handle_connection(address)
+            handle_disconnection: 客户端断开回调 handle_disconnection(address)
+            notify_delay: 每次 update_value 模拟的发送耗时（秒）
+            recent: 保留最近发出的通知条数
+        """
+        self.name = name
+        self.loop = loop
+        self.handle_connection = handle_connection
+        self.handle_disconnection = handle_disconnection
+        self.notify_delay = notify_delay
+        self.write_request_func: Optional[Callable] = None
+        self.read_request_func: Optional[Callable] = None
+        self.services: Dict[str, List[str]] = {}  # 服务UUID -> 特征UUID列表
+        self.characteristics: Dict[str, FakeCharacteristic] = {}
+        self.advertising = False
+        self.started = asyncio.Event()  # 开始广播时设置
+        self.notifications: Deque[bytes] = deque(maxlen=recent)  # 最近发出的通知
+        self.subscribers: List[Callable[[bytes], Any]] = []  # 通知回调
+
+        # 统计计数
+        self.writes = 0  # 模拟的写入次数
+        self.notify_count = 0  # update_value 调用次数
+        self.notify_bytes = 0  # 通知的总字节数
+
+    async def add_new_service(self, uuid: str) -> None:
+        self.services.setdefault(uuid.upper(), [])
+
+    async def add_new_characteristic(self, service_uuid: str, char_uuid: str, properties: int,
+                                     value: Optional[bytearray], permissions: int) -> None:
+        service_uuid = service_uuid.upper()
+        if service_uuid not in self.services:
+            raise ValueError(f"服务不存在: {service_uuid}")
+        char_uuid = char_uuid.upper()
+        self.characteristics[char_uuid] = FakeCharacteristic(service_uuid, char_uuid, properties, value, permissions)
+        self.services[service_uuid].append(char_uuid)
+
+    def get_characteristic(self, uuid: str) -> Optional[FakeCharacteristic]:
+        return self.characteristics.get(uuid.upper())
+
+    async def start(self, **kwargs) -> bool:
+        self.advertising = True
+        self.started.set()
+        logger.info(f"模拟 BLE 服务器已开始广播: {self.name}")
+        return True
+
+    async def stop(self) -> bool:
+        self.advertising = False
+        return True
+
+    async def is_connected(self) -> bool:
+        return self.advertising
+
+    async def update_value(self, char_uuid: str, value: Any = None) -> bool:
+        """
+        记录一次通知
+
+        参数:
+            char_uuid: 特征UUID
+            value: 通知数据，None表示发送特征的当前值
+
+        返回:
+            bool: 特征是否存在
+        """
+        characteristic = self.get_characteristic(char_uuid)
+        if characteristic is None:
+            return False
+        if value is not None:
+            characteristic.value = value
+        if self.notify_delay:
+            await asyncio.sleep(self.notify_delay)
+        data = bytes(characteristic.value)
+        self.notify_count += 1
+        self.notify_bytes += len(data)
+        self.notifications.append(data)
+        for callback in self.subscribers:
+            await _maybe_await(callback(data))
+        return True
+
+    def subscribe(self, callback: Callable[[bytes], Any]) -> None:
+        """
+        登记通知回调，模拟订阅了通知的客户端
+
+        参数:
+            callback: 每次通知时调用 callback(数据)，可以是普通函数或协程函数
+        """
+        self.subscribers.append(callback)
+
+    async def connect(self, address: str) -> None:
+        """模拟客户端连接"""
+        if self.handle_connection is not None:
+            await _maybe_await(self.handle_connection(address))
+
+    async def disconnect(self, address: str) -> None:
+        """模拟客户端断开"""
+        if self.handle_disconnection is not None:
+            await _maybe_await(self.handle_disconnection(address))
+
+    async def write(self, char_uuid: str, value: bytes, address: str) -> Any:
+        """
+        模拟客户端写入特征
+
+        参数:
+            char_uuid: 特征UUID
+            value: 写入的数据
+            address: 客户端地址
+
+        返回:
+            写入回调的返回值
+
+        异常:
+            ValueError: 特征不存在
+        """
+        characteristic = self.get_characteristic(char_uuid)
+        if characteristic is None:
+            raise ValueError(f"特征不存在: {char_uuid}")
+        self.writes += 1
+        if self.write_request_func is None:
+            characteristic.value = bytearray(value)
+            return None
+        return await _maybe_await(self.write_request_func(characteristic, bytearray(value), options={"device": address}))
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取模拟服务器统计
+
+        返回:
+            Dict: 写入次数、通知次数和通知字节数
+        """
+        return {
+            "writes": self.writes,
+            "notifications": self.notify_count,
+            "notify_bytes": self.notify_bytes,
+        }
+
+
+async def _maybe_await(result: Any) -> Any:
+    """回调返回可等待对象时等待其结果"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class LoadGenerator:
+    """
+    多客户端写入负载
+
+    每个模拟客户端先连接，然后按固定间隔（按计划时间，不累积漂移）写入，
+    持续 duration 秒后断开；disconnect 为False时保持连接，由 close 统一断开，
+    以便服务器先处理完已接受的消息。rate 为0时不等待，尽可能快地写入（每次写入后让出事件循环）。
+    """
+
+    def __init__(self, server: FakeBlessServer, char_uuid: str, clients: int = 1, rate: float = 0,
+                 duration: float = 5.0, payload: Optional[Callable[[int, int], bytes]] = None,
+                 size: int = 20, jitter: float = 0.0, seed: int = 0, disconnect: bool = True):
+        """
+        初始化负载生成器
+
+        参数:
+            server: 模拟服务器
+            char_uuid: 写入的特征UUID
+            clients: 模拟客户端数
+            rate: 每个客户端每秒写入次数，0表示不限
+            duration: 持续时间（秒）
+            payload: 生成写入数据的函数 payload(客户端编号, 序号)，默认为 size 字节的可打印字符
+            size: 默认写入数据的长度（字节）
+            jitter: 写入间隔的随机抖动比例（0-1）
+            seed: 随机数种子，保证多次运行的负载相同
+            disconnect: 写入结束后是否立即断开
+        """
+        self.server = server
+        self.char_uuid = char_uuid
+        self.clients = clients
+        self.rate = rate
+        self.duration = duration
+        self.size = size
+        self.payload = payload or self._default_payload
+        self.jitter = jitter
+        self.seed = seed
+        self.disconnect = disconnect
+        self.connected: List[str] = []  # 仍处于连接状态的模拟客户端地址
+        self.latency = LatencyHistogram()  # 写入回调耗时（含等待）
+        self.sent = 0  # 写入次数
+        self.accepted = 0  # 写入回调返回 True 的次数
+        self.rejected = 0  # 写入回调返回 False 的次数
+        self.errors = 0  # 写入回调抛出异常的次数
+        self.elapsed = 0.0
+
+    def _default_payload(self, client: int, seq: int) -> bytes:
+        """默认负载：客户端编号和序号，用可打印字符补足到 size 字节"""
+        head = f"{client}:{seq} ".encode("ascii")
+        return (head + b"x" * self.size)[:max(self.size, 1)]
+
+    async def _client(self, index: int) -> None:
+        """单个模拟客户端"""
+        address = f"SIM:{index:04d}"
+        rng = random.Random(self.seed + index)
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        await self.server.connect(address)
+        self.connected.append(address)
+        start = time.perf_counter()
+        deadline = start + self.duration
+        next_at = start + rng.random() * interval  # 错开各客户端的首次写入
+        seq = 0
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if interval:
+                    if next_at > now:
+                        await asyncio.sleep(next_at - now)
+                    next_at += interval * (1 + self.jitter * (rng.random() * 2 - 1))
+                value = self.payload(index, seq)
+                seq += 1
+                t = time.perf_counter()
+                try:
+                    result = await self.server.write(self.char_uuid, value, address)
+                except Exception as e:
+                    self.errors += 1
+                    logger.debug(f"模拟客户端 {address} 写入出错: {e}")
+                else:
+                    if result is False:
+                        self.rejected += 1
+                    else:
+                        self.accepted += 1
+                finally:
+                    self.latency.record(time.perf_counter() - t)
+                    self.sent += 1
+                if not interval:
+                    await asyncio.sleep(0)
+        finally:
+            if self.disconnect:
+                self.connected.remove(address)
+                await self.server.disconnect(address)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        运行负载直到所有客户端结束
+
+        返回:
+            Dict: 见 get_stats
+        """
+        start = time.perf_counter()
+        await asyncio.gather(*(self._client(i) for i in range(self.clients)))
+        self.elapsed = time.perf_counter() - start
+        return self.get_stats()
+
+    async def close(self) -> None:
+        """断开仍处于连接状态的模拟客户端"""
+        while self.connected:
+            await self.server.disconnect(self.connected.pop())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取负载统计
+
+        返回:
+            Dict: 写入次数、接受/拒绝/异常数、写入速率和写入回调耗时摘要
+        """
+        return {
+            "clients": self.clients,
+            "elapsed": self.elapsed,
+            "sent": self.sent,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "writes_per_second": self.sent / self.elapsed if self.elapsed > 0 else 0.0,
+            "latency": self.latency.snapshot(),
+        }
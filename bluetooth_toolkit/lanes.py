@@ -0,0 +1,210 @@
+"""
+优先级通道模块 - 按命令优先级分队列、加权调度处理
+
+每个优先级对应一个独立队列，调度器按平滑加权轮询从非空队列中取出任务，
+控制类命令不必排在大量批量数据命令之后，批量命令仍能按权重获得处理机会。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import DEFAULT_PREFIX, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CONTROL = 0  # 控制类命令（停止、状态查询等）
+PRIORITY_NORMAL = 1  # 普通命令
+PRIORITY_BULK = 2  # 批量数据命令
+PRIORITY_NAMES = {PRIORITY_CONTROL: "control", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+DEFAULT_WEIGHTS = {PRIORITY_CONTROL: 8, PRIORITY_NORMAL: 4, PRIORITY_BULK: 1}
+DEFAULT_MAX_QUEUE = 1024  # 每个通道的默认最大排队数
+
+
+class _Lane:
+    """单个优先级通道"""
+
+    __slots__ = ("priority", "weight", "queue", "current", "max_queue",
+                 "enqueued", "processed", "rejected", "max_depth", "wait")
+
+    def __init__(self, priority: int, weight: int, max_queue: int):
+        self.priority = priority
+        self.weight = weight
+        self.queue = deque()  # (入队时间, 任务, Future)
+        self.current = 0  # 平滑加权轮询的当前权重
+        self.max_queue = max_queue
+        self.enqueued = 0  # 入队任务数
+        self.processed = 0  # 已处理任务数
+        self.rejected = 0  # 队列已满被拒绝的任务数
+        self.max_depth = 0  # 最大排队深度
+        self.wait = LatencyHistogram()  # 排队等待时间
+
+
+class PriorityScheduler:
+    """
+    加权优先级调度器
+
+    任务按优先级进入各自的队列，工作协程每次按平滑加权轮询选择一个非空队列，
+    取出最早的任务交给处理函数执行。只有一个工作协程时，高优先级任务的等待时间
+    不超过一个正在执行的任务的耗时。
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[Any]], weights: Optional[Dict[int, int]] = None,
+                 max_queue: int = DEFAULT_MAX_QUEUE, workers: int = 1):
+        """
+        初始化调度器
+
+        参数:
+            handler: 处理任务的协程函数，返回值作为 submit 的结果
+            weights: 优先级 -> 权重，默认为 control:8 / normal:4 / bulk:1
+            max_queue: 每个通道的最大排队数，超出时拒绝新任务
+            workers: 并发处理任务的工作协程数
+        """
+        weights = weights or DEFAULT_WEIGHTS
+        if any(weight <= 0 for weight in weights.values()):
+            raise ValueError(f"通道权重须为正数: {weights}")
+        self.handler = handler
+        self.lanes: Dict[int, _Lane] = {
+            priority: _Lane(priority, weight, max_queue) for priority, weight in sorted(weights.items())
+        }
+        self.workers = workers
+        self._available: Optional[asyncio.Semaphore] = None  # 排队任务数，首次提交时在事件循环中创建
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        """工作协程是否在运行"""
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """在当前事件循环中启动工作协程"""
+        if self._tasks:
+            return
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """停止工作协程，取消仍在排队的任务"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for lane in self.lanes.values():
+            while lane.queue:
+                lane.queue.popleft()[2].cancel()
+        self._available = None
+
+    async def submit(self, item: Any, priority: int = PRIORITY_NORMAL) -> Any:
+        """
+        提交任务并等待处理结果
+
+        参数:
+            item: 传给处理函数的任务
+            priority: 优先级，未配置的优先级按普通优先级处理
+
+        返回:
+            处理函数的返回值；队列已满被拒绝时返回None
+        """
+        lane = self.lanes.get(priority) or self.lanes.get(PRIORITY_NORMAL) or next(iter(self.lanes.values()))
+        if len(lane.queue) >= lane.max_queue:
+            lane.rejected += 1
+            if lane.rejected == 1:
+                logger.warning(f"通道 {PRIORITY_NAMES.get(lane.priority, lane.priority)} 已满，开始拒绝任务")
+            return None
+        if not self._tasks:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.append((time.perf_counter(), item, future))
+        lane.enqueued += 1
+        if len(lane.queue) > lane.max_depth:
+            lane.max_depth = len(lane.queue)
+        self._available.release()
+        return await future
+
+    def _next_lane(self) -> _Lane:
+        """平滑加权轮询选择下一个非空通道"""
+        best = None
+        total = 0
+        for lane in self.lanes.values():
+            if lane.queue:
+                lane.current += lane.weight
+                total += lane.weight
+                if best is None or lane.current > best.current:
+                    best = lane
+        best.current -= total
+        return best
+
+    async def _worker(self) -> None:
+        """工作协程：按权重取出任务并执行"""
+        while True:
+            await self._available.acquire()
+            lane = self._next_lane()
+            enqueued_at, item, future = lane.queue.popleft()
+            lane.wait.record(time.perf_counter() - enqueued_at)
+            if future.cancelled():
+                continue
+            try:
+                result = await self.handler(item)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"处理通道任务时出错: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            lane.processed += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        获取各通道的队列深度和等待时间
+
+        返回:
+            Dict: 通道名称 -> 通道统计
+        """
+        return {
+            PRIORITY_NAMES.get(priority, str(priority)): {
+                "weight": lane.weight,
+                "depth": len(lane.queue),
+                "max_depth": lane.max_depth,
+                "enqueued": lane.enqueued,
+                "processed": lane.processed,
+                "rejected": lane.rejected,
+                "wait": lane.wait.snapshot(),
+            }
+            for priority, lane in self.lanes.items()
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        lines = []
+        families = (
+            ("lane_depth", "gauge", "通道当前排队数", lambda lane: len(lane.queue)),
+            ("lane_processed_total", "counter", "通道已处理任务数", lambda lane: lane.processed),
+            ("lane_rejected_total", "counter", "通道队列已满被拒绝的任务数", lambda lane: lane.rejected),
+            ("lane_wait_seconds_sum", "counter", "通道排队等待时间总和（秒）", lambda lane: lane.wait.total),
+            ("lane_wait_seconds_max", "gauge", "通道最大排队等待时间（秒）", lambda lane: lane.wait.max),
+        )
+        for name, kind, help_text, value in families:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for priority, lane in self.lanes.items():
+                lines.append(f'{prefix}_{name}{{lane="{PRIORITY_NAMES.get(priority, priority)}"}} {value(lane)}')
+        return "\n".join(lines) + "\n"
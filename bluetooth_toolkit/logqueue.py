@@ -0,0 +1,295 @@
+"""
+非阻塞日志模块 - 日志记录在调用方只入队，格式化和写文件在后台线程中进行
+
+    QueueLogging   在根日志器上安装 QueueLogHandler，由 QueueListener 线程交给实际的处理器
+    RateLimitFilter 按日志模板（logger名 + 未格式化的消息）限流，超出的记录直接丢弃并计数
+    TrafficLog     把收发的原始数据包写入抓包文件（格式见 capture 模块），写文件在后台线程中进行
+
+调用方需使用 logger.debug("... %s", value) 形式的延迟格式化：
+QueueLogHandler 不在调用方格式化消息，被级别或限流过滤掉的记录不会产生格式化开销。
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+from .capture import CaptureWriter
+from .metrics import DEFAULT_PREFIX
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 10000  # 默认日志队列容量（条）
+DEFAULT_MAX_KEYS = 1024  # 限流器最多跟踪的日志模板数
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    延迟格式化的有界队列日志处理器
+
+    标准 QueueHandler 在入队前格式化消息（为了跨进程pickle），这里记录只在
+    本进程内传给 QueueListener，原样入队，消息在监听线程中由实际的处理器格式化。
+    记录的参数在格式化前不应再被修改（如复用的 bytearray），需要时由调用方传入副本。
+    队列满时丢弃记录并计数，不阻塞调用方。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0  # 队列满被丢弃的记录数
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """原样入队，不格式化"""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按日志模板限流
+
+    同一 logger 的同一未格式化消息（即同一处日志调用）共用一个令牌桶，
+    超出速率的记录被丢弃；之后第一条放行的记录附带被抑制的条数。
+    不同模板数超过 max_keys 时淘汰最早创建的令牌桶。
+    过滤在调用方线程中执行，线程池中的日志调用与事件循环共用一把锁。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_keys: int = DEFAULT_MAX_KEYS):
+        """
+        初始化限流过滤器
+
+        参数:
+            rate: 每个模板每秒允许的记录数
+            burst: 每个模板允许的突发记录数，None表示等于 rate
+            max_keys: 最多跟踪的模板数
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        self._suppressed: Dict[Tuple[str, Any], int] = {}  # 模板 -> 上次放行后被抑制的条数
+        self._lock = threading.Lock()
+        self.passed = 0  # 放行的记录数
+        self.suppressed = 0  # 被抑制的记录数
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    oldest = next(iter(self._buckets))
+                    del self._buckets[oldest]
+                    self._suppressed.pop(oldest, None)
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if not bucket.consume():
+                self.suppressed += 1
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self.passed += 1
+            skipped = self._suppressed.pop(key, 0)
+        if skipped:
+            record.msg = f"{record.msg} (此前已抑制 {skipped} 条)"
+        return True
+
+
+class QueueLogging:
+    """
+    非阻塞日志管线
+
+    start 后根日志器（或指定日志器）只保留一个 QueueLogHandler，原有的处理器
+    移到 QueueListener 线程中执行；stop 时处理完队列中剩余的记录并恢复原有设置。
+    """
+
+    def __init__(self, handlers: Iterable[logging.Handler], level: int = logging.INFO, rate: float = 0,
+                 burst: Optional[float] = None, max_queue: int = DEFAULT_MAX_QUEUE,
+                 target: Optional[logging.Logger] = None):
+        """
+        初始化日志管线
+
+        参数:
+            handlers: 在监听线程中执行的实际处理器（如 FileHandler、StreamHandler）
+            level: 日志级别
+            rate: 每个日志模板每秒允许的记录数，0表示不限流
+            burst: 每个日志模板允许的突发记录数，None表示等于 rate
+            max_queue: 日志队列容量（条），队列满时丢弃新记录
+            target: 安装到的日志器，默认为根日志器
+        """
+        self.handlers = list(handlers)
+        self.level = level
+        self.target = target or logging.getLogger()
+        self.handler = QueueLogHandler(queue.Queue(max_queue))
+        self.rate_filter = RateLimitFilter(rate, burst) if rate > 0 else None
+        if self.rate_filter is not None:
+            self.handler.addFilter(self.rate_filter)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *self.handlers,
+                                                       respect_handler_level=True)
+        self._saved: Optional[Tuple[list, int]] = None
+
+    def start(self) -> None:
+        """安装队列处理器并启动监听线程"""
+        if self._saved is not None:
+            return
+        self._saved = (self.target.handlers[:], self.target.level)
+        for handler in self._saved[0]:
+            self.target.removeHandler(handler)
+        self.target.addHandler(self.handler)
+        self.target.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """处理完队列中剩余的记录，停止监听线程并恢复原有处理器"""
+        if self._saved is None:
+            return
+        self.target.removeHandler(self.handler)
+        self.listener.stop()
+        handlers, level = self._saved
+        for handler in handlers:
+            self.target.addHandler(handler)
+        self.target.setLevel(level)
+        self._saved = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def __enter__(self) -> "QueueLogging":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取日志管线统计
+
+        返回:
+            Dict: 队列深度、队列满丢弃数、限流放行数和抑制数
+        """
+        return {
+            "depth": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "passed": self.rate_filter.passed if self.rate_filter else None,
+            "suppressed": self.rate_filter.suppressed if self.rate_filter else 0,
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        stats = self.get_stats()
+        return (f"# HELP {prefix}_log_queue_depth 日志队列当前排队数\n"
+                f"# TYPE {prefix}_log_queue_depth gauge\n"
+                f"{prefix}_log_queue_depth {stats['depth']}\n"
+                f"# HELP {prefix}_log_dropped_total 日志队列满被丢弃的记录数\n"
+                f"# TYPE {prefix}_log_dropped_total counter\n"
+                f"{prefix}_log_dropped_total {stats['dropped']}\n"
+                f"# HELP {prefix}_log_suppressed_total 被限流抑制的日志记录数\n"
+                f"# TYPE {prefix}_log_suppressed_total counter\n"
+                f"{prefix}_log_suppressed_total {stats['suppressed']}\n")
+
+
+class TrafficLog:
+    """
+    二进制流量日志
+
+    record 在调用方只取时间戳并入队，由后台线程通过 CaptureWriter 写入抓包文件，
+    生成的文件可用 CaptureReader 读取。队列满时丢弃并计数。记录的是原始收发数据，
+    一条 RX 记录可能是帧的分片或多个粘连的帧，cli.replay 默认按通道流式解码后回放；
+    文本模式的数据不是帧，不能回放。
+    """
+
+    _STOP = None  # 通知写入线程退出
+
+    def __init__(self, path: Union[str, os.PathLike], max_queue: int = DEFAULT_MAX_QUEUE):
+        """
+        打开流量日志
+
+        参数:
+            path: 抓包文件路径，已存在时在末尾追加
+            max_queue: 待写入队列容量（条）
+        """
+        self._writer = CaptureWriter(path)
+        self.path = self._writer.path
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="traffic-log", daemon=True)
+        self._thread.start()
+        self.dropped = 0  # 队列满被丢弃的记录数
+
+    def record(self, direction: int, frame: Union[bytes, bytearray, memoryview], channel: int = 0) -> None:
+        """
+        记录一个数据包
+
+        参数:
+            direction: DIRECTION_RX 或 DIRECTION_TX
+            frame: 数据包，可变缓冲区会被复制
+            channel: 通道号，例如客户端编号
+        """
+        if not isinstance(frame, bytes):
+            frame = bytes(frame)
+        try:
+            self._queue.put_nowait((time.time() - self._writer.start_time, direction, channel, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        """写入线程：取出记录写入文件，队列暂时为空时刷新到磁盘"""
+        writer = self._writer
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            timestamp, direction, channel, frame = item
+            writer.record(direction, frame, channel, timestamp)
+            if self._queue.empty():
+                writer.flush()
+        writer.close()
+
+    @property
+    def records(self) -> int:
+        """已写入的记录数"""
+        return self._writer.records
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        写完队列中剩余的记录后关闭文件
+
+        参数:
+            timeout: 等待写入线程结束的最长时间（秒），None表示不限
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"流量日志未在 {timeout} 秒内写完: {self.path}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取流量日志统计
+
+        返回:
+            Dict: 文件路径、已写入记录数、待写入数和丢弃数
+        """
+        return {
+            "path": self.path,
+            "records": self._writer.records,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
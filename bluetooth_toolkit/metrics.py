@@ -0,0 +1,342 @@
+"""
+指标模块 - 按命令统计调用次数、解码错误和处理耗时直方图
+
+计数器和直方图都是普通的整数列表/字典，记录时不加锁：在事件循环线程中
+记录是精确的，从多个线程同时调用同步处理函数时计数可能有极少量丢失。
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 解码失败原因
+DECODE_LENGTH = "length"  # 长度不足或与数据长度字段不符
+DECODE_HEADER = "header"  # 包头无效
+DECODE_CHECKSUM = "checksum"  # 校验和不匹配
+DECODE_DECOMPRESS = "decompress"  # 压缩帧解压失败
+DECODE_REASONS = (DECODE_LENGTH, DECODE_HEADER, DECODE_CHECKSUM, DECODE_DECOMPRESS)
+
+DEFAULT_PREFIX = "bluetooth_protocol"  # Prometheus指标名前缀
+PERCENTILES = (50, 90, 99)  # 快照中输出的百分位
+
+# 直方图按微秒整数分桶：0-7微秒每微秒一桶，之后每个2倍区间分4个子桶（相对误差不超过25%）
+_SUB_BITS = 2
+_SUB_BUCKETS = 1 << _SUB_BITS
+_LINEAR_LIMIT = 2 * _SUB_BUCKETS
+MAX_TRACKABLE_US = (1 << 27) - 1  # 约134秒，更长的耗时计入溢出桶
+
+
+def _bucket_index(us: int) -> int:
+    """微秒数对应的桶序号"""
+    if us < _LINEAR_LIMIT:
+        return us
+    shift = us.bit_length() - _SUB_BITS - 1
+    return (shift + 1) * _SUB_BUCKETS + ((us >> shift) & (_SUB_BUCKETS - 1))
+
+
+def _bucket_upper(index: int) -> int:
+    """桶的上界（微秒，不含）"""
+    if index < _LINEAR_LIMIT:
+        return index + 1
+    shift = index // _SUB_BUCKETS - 1
+    return (_SUB_BUCKETS + index % _SUB_BUCKETS + 1) << shift
+
+
+NUM_BUCKETS = _bucket_index(MAX_TRACKABLE_US) + 2  # 最后一个为溢出桶
+BUCKET_BOUNDS = [_bucket_upper(i) / 1e6 for i in range(NUM_BUCKETS - 1)] + [float("inf")]  # 各桶上界（秒）
+# Prometheus导出时只输出每个2倍区间末尾的桶，保持各序列的桶边界一致
+_EXPORT_BUCKETS = [i for i in range(NUM_BUCKETS - 1) if i >= _LINEAR_LIMIT - 1 and (i + 1) % _SUB_BUCKETS == 0]
+
+
+class LatencyHistogram:
+    """定长分桶的耗时直方图（HDR风格的对数线性分桶）"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        """初始化直方图"""
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0  # 耗时总和（秒）
+        self.max = 0.0  # 最大耗时（秒）
+
+    def record(self, seconds: float) -> None:
+        """
+        记录一次耗时
+
+        参数:
+            seconds: 耗时（秒）
+        """
+        us = int(seconds * 1e6)
+        self.counts[_bucket_index(us) if us <= MAX_TRACKABLE_US else NUM_BUCKETS - 1] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        估算百分位耗时
+
+        参数:
+            percent: 百分位，0-100
+
+        返回:
+            float: 所在桶的上界（秒），没有记录时返回0
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                return min(BUCKET_BOUNDS[index], self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        获取直方图摘要
+
+        返回:
+            Dict: 次数、总和、平均、最大值和常用百分位（秒）
+        """
+        result = {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent}"] = self.percentile(percent)
+        return result
+
+
+class RateCounter:
+    """
+    滑动窗口速率计数器
+
+    按秒分槽的环形数组，记录只做一次取模和加法；计算速率时汇总窗口内仍有效的槽。
+    """
+
+    __slots__ = ("window", "_slots", "_seconds", "_start")
+
+    def __init__(self, window: int = 10):
+        """
+        初始化速率计数器
+
+        参数:
+            window: 窗口长度（秒）
+        """
+        if window <= 0:
+            raise ValueError(f"无效的窗口长度: {window}")
+        self.window = window
+        self._slots = [0] * window  # 每秒的累计量
+        self._seconds = [-1] * window  # 各槽对应的整秒时间戳
+        self._start = time.monotonic()
+
+    def record(self, amount: float = 1, now: Optional[float] = None) -> None:
+        """
+        记录一次事件
+
+        参数:
+            amount: 计入的量，例如消息数或字节数
+            now: 单调时钟时间，None表示当前时间
+        """
+        second = int(time.monotonic() if now is None else now)
+        index = second % self.window
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._slots[index] = 0
+        self._slots[index] += amount
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """
+        计算窗口内的平均速率
+
+        参数:
+            now: 单调时钟时间，None表示当前时间
+
+        返回:
+            float: 每秒的量；启动不足一个窗口时按已运行时间计算
+        """
+        if now is None:
+            now = time.monotonic()
+        second = int(now)
+        total = 0
+        for stamp, value in zip(self._seconds, self._slots):
+            if 0 <= second - stamp < self.window:
+                total += value
+        span = min(float(self.window), max(now - self._start, 1.0))
+        return total / span
+
+
+def histogram_samples(name: str, histogram: LatencyHistogram, labels: str = "") -> List[str]:
+    """
+    生成直方图的Prometheus样本行（_bucket/_sum/_count）
+
+    参数:
+        name: 完整的指标名（含前缀）
+        histogram: 耗时直方图
+        labels: 额外标签，如 'protocol="p",command="c"'，为空表示无标签
+
+    返回:
+        List[str]: 样本行
+    """
+    prefix = labels + "," if labels else ""
+    suffix = f"{{{labels}}}" if labels else ""
+    lines = []
+    cumulative = 0
+    start = 0
+    for index in _EXPORT_BUCKETS:
+        cumulative += sum(histogram.counts[start:index + 1])
+        start = index + 1
+        lines.append(f'{name}_bucket{{{prefix}le="{BUCKET_BOUNDS[index]:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{suffix} {histogram.total}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+class _CommandStats:
+    """单个命令的统计"""
+
+    __slots__ = ("count", "errors", "latency")
+
+    def __init__(self):
+        self.count = 0  # 处理函数调用次数
+        self.errors = 0  # 处理函数抛出异常次数
+        self.latency = LatencyHistogram()
+
+
+class ProtocolMetrics:
+    """
+    协议指标
+
+    由 Protocol.enable_metrics 创建；未启用时协议只多一次属性判断。
+    """
+
+    def __init__(self, protocol_name: str, command_names: Optional[Dict[int, str]] = None):
+        """
+        初始化协议指标
+
+        参数:
+            protocol_name: 协议名称，作为导出标签
+            command_names: 命令ID -> 命令名称，与协议的 commands 字典共享
+        """
+        self.protocol_name = protocol_name
+        self.command_names = command_names if command_names is not None else {}
+        self.commands: Dict[int, _CommandStats] = {}
+        self.decode_errors: Dict[str, int] = dict.fromkeys(DECODE_REASONS, 0)
+
+    def observe(self, command_id: int, seconds: float, error: bool = False) -> None:
+        """
+        记录一次处理函数调用
+
+        参数:
+            command_id: 命令ID
+            seconds: 处理耗时（秒）
+            error: 处理函数是否抛出异常
+        """
+        stats = self.commands.get(command_id)
+        if stats is None:
+            stats = self.commands[command_id] = _CommandStats()
+        stats.count += 1
+        if error:
+            stats.errors += 1
+        stats.latency.record(seconds)
+
+    def decode_error(self, reason: str, count: int = 1) -> None:
+        """
+        记录解码失败
+
+        参数:
+            reason: 失败原因，DECODE_REASONS 之一
+            count: 失败次数
+        """
+        self.decode_errors[reason] += count
+
+    def reset(self) -> None:
+        """清零所有统计"""
+        self.commands.clear()
+        self.decode_errors = dict.fromkeys(DECODE_REASONS, 0)
+
+    def snapshot(self) -> Dict:
+        """
+        获取指标快照
+
+        返回:
+            Dict: 解码错误计数和每个命令的调用次数、错误次数与耗时摘要
+        """
+        return {
+            "protocol": self.protocol_name,
+            "decode_errors": dict(self.decode_errors),
+            "commands": {
+                command_id: {
+                    "name": self.command_names.get(command_id, str(command_id)),
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "latency": stats.latency.snapshot(),
+                }
+                for command_id, stats in sorted(self.commands.items())
+            },
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        return format_prometheus([self], prefix)
+
+
+def _escape(value: str) -> str:
+    """转义Prometheus标签值"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_prometheus(metrics_list: Iterable[ProtocolMetrics], prefix: str = DEFAULT_PREFIX) -> str:
+    """
+    将多个协议的指标导出为一份Prometheus文本，每个指标族只输出一次 HELP/TYPE
+
+    参数:
+        metrics_list: 协议指标列表
+        prefix: 指标名前缀
+
+    返回:
+        str: Prometheus文本格式的指标
+    """
+    metrics_list = list(metrics_list)
+    commands: List[str] = []
+    errors: List[str] = []
+    decode: List[str] = []
+    latency: List[str] = []
+
+    for metrics in metrics_list:
+        protocol = _escape(metrics.protocol_name)
+        for reason, value in metrics.decode_errors.items():
+            decode.append(f'{prefix}_decode_errors_total{{protocol="{protocol}",reason="{reason}"}} {value}')
+        for command_id, stats in sorted(metrics.commands.items()):
+            labels = f'protocol="{protocol}",command="{_escape(metrics.command_names.get(command_id, str(command_id)))}"'
+            commands.append(f"{prefix}_commands_total{{{labels}}} {stats.count}")
+            errors.append(f"{prefix}_handler_errors_total{{{labels}}} {stats.errors}")
+            latency.extend(histogram_samples(f"{prefix}_handler_seconds", stats.latency, labels))
+
+    lines = []
+    for name, kind, help_text, samples in (
+        ("commands_total", "counter", "命令处理函数调用次数", commands),
+        ("handler_errors_total", "counter", "命令处理函数异常次数", errors),
+        ("decode_errors_total", "counter", "按原因统计的数据包解码失败次数", decode),
+        ("handler_seconds", "histogram", "命令处理耗时（秒）", latency),
+    ):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,281 @@
+"""
+通知发送队列模块 - 用独立任务发送TX通知，与RX写入处理解耦
+
+写入处理函数只把响应放入有界队列即可返回，发送任务逐个取出并调用发送函数
+（如 bless 的 update_value）。队列满时按策略阻塞调用方或丢弃数据。启用合并时
+发送任务取出数据时把队列中紧随其后的数据合并为一次发送，减少通知次数；合并后
+接收方只能按数据自身的边界拆分，只适用于自带长度的数据（如帧），且合并长度
+不能超过协商的 ATT MTU 减 3 字节，默认不合并。
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Union
+
+from .metrics import DEFAULT_PREFIX, LatencyHistogram, histogram_samples
+
+logger = logging.getLogger(__name__)
+
+POLICY_BLOCK = "block"  # 队列满时等待空位（向写入方施加背压）
+POLICY_DROP_NEWEST = "drop-newest"  # 队列满时丢弃新数据
+POLICY_DROP_OLDEST = "drop-oldest"  # 队列满时丢弃最旧的数据
+POLICIES = (POLICY_BLOCK, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST)
+
+DEFAULT_MAX_SIZE = 256  # 默认队列容量（条）
+DEFAULT_MAX_BATCH = 0  # 默认不合并，每条数据单独发送
+DEFAULT_SEND_TIMEOUT = 5.0  # 默认单次发送超时（秒）
+
+
+class NotificationQueue:
+    """
+    有界通知发送队列
+
+    put/put_nowait 在事件循环中调用；发送函数在发送任务中串行调用，
+    同一时刻只有一个发送在进行，发送顺序与入队顺序一致。
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], max_size: int = DEFAULT_MAX_SIZE,
+                 policy: str = POLICY_BLOCK, max_batch: int = DEFAULT_MAX_BATCH,
+                 send_timeout: Optional[float] = DEFAULT_SEND_TIMEOUT):
+        """
+        初始化通知发送队列
+
+        参数:
+            send: 发送一次通知的函数，可以是普通函数或返回可等待对象的函数
+            max_size: 队列容量（条）
+            policy: 队列满时的策略，POLICY_BLOCK/POLICY_DROP_NEWEST/POLICY_DROP_OLDEST
+            max_batch: 合并发送的最大字节数，0表示不合并；单条超过该长度时单独发送。
+                只有数据自带边界时才能合并，且不应超过 MTU - ATT_HEADER_SIZE
+            send_timeout: 单次发送超时（秒），None表示不超时
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"无效的队列策略: {policy}")
+        if max_size <= 0:
+            raise ValueError(f"无效的队列容量: {max_size}")
+        self.send = send
+        self.max_size = max_size
+        self.policy = policy
+        self.max_batch = max_batch
+        self.send_timeout = send_timeout
+        self._queue: Deque[Tuple[float, bytes]] = deque()  # (入队时间, 数据)
+        self._not_empty: Optional[asyncio.Event] = None  # 首次使用时在事件循环中创建
+        self._not_full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        # 统计计数
+        self.enqueued = 0  # 入队的数据条数
+        self.sent = 0  # 已发出的数据条数
+        self.batches = 0  # 实际发送次数
+        self.bytes_sent = 0  # 已发出的字节数
+        self.dropped = 0  # 因队列满被丢弃的条数
+        self.blocked = 0  # 因队列满而等待的入队次数
+        self.timeouts = 0  # 发送超时次数
+        self.errors = 0  # 发送出错次数
+        self.max_depth = 0  # 最大排队深度
+        self.wait = LatencyHistogram()  # 数据在队列中的等待时间
+        self.send_latency = LatencyHistogram()  # 单次发送耗时
+
+    @property
+    def depth(self) -> int:
+        """当前排队的数据条数"""
+        return len(self._queue)
+
+    def _events(self) -> None:
+        """在事件循环中创建事件并启动发送任务"""
+        if self._not_empty is None:
+            self._not_empty = asyncio.Event()
+            self._not_full = asyncio.Event()
+            self._not_full.set()
+        if self._task is None and not self.closed:
+            self._task = asyncio.ensure_future(self._run())
+
+    def start(self) -> None:
+        """在当前事件循环中启动发送任务；首次入队时也会自动启动"""
+        self._events()
+
+    def put_nowait(self, value: Union[bytes, bytearray]) -> bool:
+        """
+        不等待地放入一条数据
+
+        参数:
+            value: 通知数据
+
+        返回:
+            bool: 是否入队；队列满时阻塞策略和丢弃新数据策略返回False，丢弃旧数据策略总是入队
+        """
+        if self.closed:
+            return False
+        self._events()
+        if len(self._queue) >= self.max_size:
+            if self.policy != POLICY_DROP_OLDEST:
+                self.dropped += 1
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append((time.perf_counter(), bytes(value)))
+        self.enqueued += 1
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        if len(self._queue) >= self.max_size:
+            self._not_full.clear()
+        self._not_empty.set()
+        return True
+
+    async def put(self, value: Union[bytes, bytearray]) -> bool:
+        """
+        放入一条数据，阻塞策略下队列满时等待空位
+
+        参数:
+            value: 通知数据
+
+        返回:
+            bool: 是否入队，丢弃或队列已关闭时返回False
+        """
+        if self.policy == POLICY_BLOCK and not self.closed:
+            self._events()
+            if len(self._queue) >= self.max_size:
+                self.blocked += 1
+                while len(self._queue) >= self.max_size and not self.closed:
+                    await self._not_full.wait()
+        return self.put_nowait(value)
+
+    def _take_batch(self) -> Tuple[bytes, int]:
+        """取出队首数据及紧随其后、合并后不超过 max_batch 的数据"""
+        now = time.perf_counter()
+        enqueued_at, value = self._queue.popleft()
+        self.wait.record(now - enqueued_at)
+        if not self.max_batch or len(value) >= self.max_batch or not self._queue:
+            return value, 1
+        parts = [value]
+        size = len(value)
+        while self._queue and size + len(self._queue[0][1]) <= self.max_batch:
+            enqueued_at, value = self._queue.popleft()
+            self.wait.record(now - enqueued_at)
+            parts.append(value)
+            size += len(value)
+        return b"".join(parts), len(parts)
+
+    async def _run(self) -> None:
+        """发送任务"""
+        while True:
+            if not self._queue:
+                if self.closed:
+                    return
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            value, count = self._take_batch()
+            self._not_full.set()
+            start = time.perf_counter()
+            try:
+                result = self.send(value)
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, self.send_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.error(f"发送通知超时: {len(value)} 字节")
+                continue
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"发送通知时出错: {e}")
+                continue
+            finally:
+                self.send_latency.record(time.perf_counter() - start)
+            self.sent += count
+            self.batches += 1
+            self.bytes_sent += len(value)
+
+    async def stop(self, drain: bool = True, timeout: Optional[float] = None) -> int:
+        """
+        停止发送任务
+
+        参数:
+            drain: 是否先发出队列中剩余的数据
+            timeout: 等待剩余数据发出的最长时间（秒），None表示不限
+
+        返回:
+            int: 未发出而被丢弃的数据条数
+        """
+        self.closed = True
+        if self._not_full is not None:
+            self._not_full.set()  # 唤醒等待空位的调用方
+        task, self._task = self._task, None
+        if task is not None:
+            if drain:
+                self._not_empty.set()
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"通知队列未在 {timeout} 秒内发完，剩余 {len(self._queue)} 条")
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        remaining = len(self._queue)
+        self._queue.clear()
+        return remaining
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取队列统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "policy": self.policy,
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "batches": self.batches,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "wait": self.wait.snapshot(),
+            "send_latency": self.send_latency.snapshot(),
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        lines = [
+            f"# HELP {prefix}_tx_queue_depth 通知队列当前排队数",
+            f"# TYPE {prefix}_tx_queue_depth gauge",
+            f"{prefix}_tx_queue_depth {len(self._queue)}",
+        ]
+        for name, help_text, value in (
+            ("tx_enqueued_total", "入队的通知数", self.enqueued),
+            ("tx_sent_total", "已发出的通知数", self.sent),
+            ("tx_batches_total", "实际发送次数（合并后）", self.batches),
+            ("tx_bytes_total", "已发出的字节数", self.bytes_sent),
+            ("tx_dropped_total", "队列满被丢弃的通知数", self.dropped),
+            ("tx_timeouts_total", "发送超时次数", self.timeouts),
+            ("tx_errors_total", "发送出错次数", self.errors),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {value}")
+        for name, help_text, histogram in (
+            ("tx_queue_wait_seconds", "通知在队列中的等待时间（秒）", self.wait),
+            ("tx_send_seconds", "单次发送耗时（秒）", self.send_latency),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            lines.extend(histogram_samples(f"{prefix}_{name}", histogram))
+        return "\n".join(lines) + "\n"
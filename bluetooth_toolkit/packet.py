@@ -0,0 +1,108 @@
+"""
+数据包视图模块 - 零拷贝的数据包视图和可复用的接收缓冲区池
+"""
+
+import logging
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+DEFAULT_BUFFER_SIZE = 4096  # 默认缓冲区大小
+DEFAULT_MAX_BUFFERS = 64  # 缓冲区池默认保留的最大空闲缓冲区数
+
+
+class Packet:
+    """
+    数据包视图
+
+    payload 是指向接收缓冲区的 memoryview，解析和校验数据包时不复制数据负载。
+    视图在缓冲区被复用或修改前有效，需要保留数据时调用 tobytes 复制。
+    同一个 Packet 对象可传给 Protocol.decode_view/iter_packets 反复复用。
+    """
+
+    __slots__ = ("header", "command_id", "payload")
+
+    def __init__(self, header: int = 0, command_id: int = 0, payload: Optional[BytesLike] = None):
+        """
+        初始化数据包视图
+
+        参数:
+            header: 帧包头
+            command_id: 命令ID
+            payload: 数据负载视图
+        """
+        self.header = header
+        self.command_id = command_id
+        self.payload = payload
+
+    def tobytes(self) -> bytes:
+        """复制数据负载为bytes"""
+        return bytes(self.payload) if self.payload is not None else b""
+
+    def release(self) -> None:
+        """释放数据负载视图，之后缓冲区可以被调整大小"""
+        if isinstance(self.payload, memoryview):
+            self.payload.release()
+        self.payload = None
+
+    def __len__(self) -> int:
+        return len(self.payload) if self.payload is not None else 0
+
+    def __repr__(self) -> str:
+        return f"<Packet header=0x{self.header:02X} command={self.command_id} length={len(self)}>"
+
+
+class BufferPool:
+    """
+    定长 bytearray 缓冲区池
+
+    缓冲区用完后归还池中复用，稳态下接收和批量编解码不再分配新的缓冲区。
+    缓冲区长度固定不变，因此从中导出的 memoryview 视图不会阻止其复用。
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, max_buffers: int = DEFAULT_MAX_BUFFERS):
+        """
+        初始化缓冲区池
+
+        参数:
+            buffer_size: 每个缓冲区的字节数
+            max_buffers: 池中保留的最大空闲缓冲区数，超出的归还缓冲区直接丢弃
+        """
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free: List[bytearray] = []
+        self.created = 0  # 新分配的缓冲区数
+        self.reused = 0  # 复用的缓冲区数
+
+    def acquire(self) -> bytearray:
+        """
+        取出一个缓冲区
+
+        返回:
+            bytearray: 长度为 buffer_size 的缓冲区，内容未清零
+        """
+        if self._free:
+            self.reused += 1
+            return self._free.pop()
+        self.created += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray) -> None:
+        """
+        归还缓冲区
+
+        参数:
+            buffer: acquire 取出的缓冲区，归还后不应再使用指向它的视图
+        """
+        if len(buffer) != self.buffer_size:
+            logger.warning(f"归还的缓冲区长度 {len(buffer)} 与池不符，已丢弃")
+            return
+        if len(self._free) < self.max_buffers:
+            self._free.append(buffer)
+
+    @property
+    def available(self) -> int:
+        """池中空闲的缓冲区数"""
+        return len(self._free)
@@ -0,0 +1,211 @@
+"""
+消息处理流水线模块 - 按注册顺序依次执行的处理阶段
+
+每个阶段接收上一阶段的输出并返回新的值，返回None表示消息已处理完毕、不再继续；
+阶段抛出 StageRejected 表示消息被拒绝。同步阶段可以标记为IO/CPU密集型，
+分别在线程池/进程池中执行，事件循环只负责在阶段之间传递结果。
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import DEFAULT_PREFIX, LatencyHistogram, histogram_samples
+from .protocol import OFFLOAD_CPU, OFFLOAD_IO
+
+logger = logging.getLogger(__name__)
+
+
+class StageRejected(Exception):
+    """阶段拒绝了消息，reason 为拒绝原因"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Stage:
+    """单个处理阶段及其统计"""
+
+    __slots__ = ("name", "func", "offload", "count", "rejected", "errors", "latency")
+
+    def __init__(self, name: str, func: Callable, offload: Optional[str]):
+        self.name = name
+        self.func = func
+        self.offload = offload
+        self.count = 0  # 执行次数
+        self.rejected = 0  # 抛出 StageRejected 的次数
+        self.errors = 0  # 抛出其他异常的次数
+        self.latency = LatencyHistogram()  # 执行耗时（含排队等待执行器的时间）
+
+
+class Pipeline:
+    """
+    消息处理流水线
+
+    run 按顺序执行各阶段。流水线本身不保证消息之间的顺序，
+    需要保序时由调用方保证同一来源同一时刻只有一条消息在流水线中。
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        """
+        初始化流水线
+
+        参数:
+            name: 流水线名称，作为导出标签
+        """
+        self.name = name
+        self.stages: List[_Stage] = []
+        self.io_executor: Optional[Executor] = None  # None表示使用事件循环默认线程池
+        self.cpu_executor: Optional[Executor] = None  # None表示首次使用时创建进程池
+
+    def add_stage(self, name: str, func: Callable, offload: Optional[str] = None) -> "Pipeline":
+        """
+        追加一个阶段
+
+        参数:
+            name: 阶段名称
+            func: 阶段函数，接收上一阶段的输出，可以是普通函数或协程函数
+            offload: 同步阶段函数的卸载方式：OFFLOAD_IO 在线程池中执行，OFFLOAD_CPU 在进程池中执行
+                     （函数须可被pickle，即模块级函数），None 表示在事件循环中直接执行
+
+        返回:
+            Pipeline: 流水线本身，便于链式调用
+        """
+        if offload not in (None, OFFLOAD_IO, OFFLOAD_CPU):
+            raise ValueError(f"无效的卸载方式: {offload}")
+        if offload is not None and inspect.iscoroutinefunction(func):
+            raise ValueError(f"协程函数不能卸载到执行器: {name}")
+        self.stages.append(_Stage(name, func, offload))
+        return self
+
+    def stage(self, name: str, offload: Optional[str] = None) -> Callable[[Callable], Callable]:
+        """
+        以装饰器形式追加阶段
+
+        参数:
+            name: 阶段名称
+            offload: 卸载方式，同 add_stage
+        """
+        def decorator(func: Callable) -> Callable:
+            self.add_stage(name, func, offload)
+            return func
+        return decorator
+
+    def set_executors(self, io_executor: Optional[Executor] = None, cpu_executor: Optional[Executor] = None) -> None:
+        """
+        设置卸载阶段使用的执行器
+
+        参数:
+            io_executor: IO密集型阶段使用的执行器，通常为ThreadPoolExecutor
+            cpu_executor: CPU密集型阶段使用的执行器，通常为ProcessPoolExecutor
+        """
+        self.io_executor = io_executor
+        self.cpu_executor = cpu_executor
+
+    def shutdown_executors(self, wait: bool = True) -> None:
+        """
+        关闭由流水线创建或设置的执行器
+
+        参数:
+            wait: 是否等待正在执行的任务完成
+        """
+        for executor in (self.io_executor, self.cpu_executor):
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        self.io_executor = None
+        self.cpu_executor = None
+
+    def _get_executor(self, offload: str) -> Optional[Executor]:
+        """获取卸载类型对应的执行器"""
+        if offload == OFFLOAD_IO:
+            return self.io_executor
+        if self.cpu_executor is None:
+            self.cpu_executor = ProcessPoolExecutor()
+            logger.info(f"流水线 {self.name} 已创建CPU密集型阶段进程池")
+        return self.cpu_executor
+
+    async def run(self, value: Any) -> Any:
+        """
+        依次执行各阶段
+
+        参数:
+            value: 第一个阶段的输入
+
+        返回:
+            最后一个阶段的输出；某个阶段返回None时提前结束并返回None
+
+        异常:
+            StageRejected: 某个阶段拒绝了消息
+            Exception: 阶段函数抛出的其他异常
+        """
+        loop = asyncio.get_running_loop()
+        for stage in self.stages:
+            start = time.perf_counter()
+            try:
+                if stage.offload is None:
+                    value = stage.func(value)
+                else:
+                    value = await loop.run_in_executor(self._get_executor(stage.offload), stage.func, value)
+                if inspect.isawaitable(value):
+                    value = await value
+            except StageRejected:
+                stage.rejected += 1
+                raise
+            except Exception:
+                stage.errors += 1
+                raise
+            finally:
+                stage.count += 1
+                stage.latency.record(time.perf_counter() - start)
+            if value is None:
+                return None
+        return value
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        获取各阶段统计
+
+        返回:
+            Dict: 阶段名称 -> 执行次数、拒绝数、异常数和耗时摘要
+        """
+        return {
+            stage.name: {
+                "offload": stage.offload,
+                "count": stage.count,
+                "rejected": stage.rejected,
+                "errors": stage.errors,
+                "latency": stage.latency.snapshot(),
+            }
+            for stage in self.stages
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        lines = []
+        for name, help_text, attr in (
+            ("stage_runs_total", "阶段执行次数", "count"),
+            ("stage_rejected_total", "阶段拒绝的消息数", "rejected"),
+            ("stage_errors_total", "阶段异常次数", "errors"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for stage in self.stages:
+                lines.append(f'{prefix}_{name}{{pipeline="{self.name}",stage="{stage.name}"}} {getattr(stage, attr)}')
+        lines.append(f"# HELP {prefix}_stage_seconds 阶段执行耗时（秒）")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage in self.stages:
+            lines.extend(histogram_samples(f"{prefix}_stage_seconds", stage.latency,
+                                           f'pipeline="{self.name}",stage="{stage.name}"'))
+        return "\n".join(lines) + "\n"
@@ -2,42 +2,282 @@
 协议处理模块 - 提供蓝牙协议的封装和处理
 """
 
+import asyncio
+import inspect
 import logging
 import struct
 import time
-from typing import Dict, List, Optional, Union, Callable, Any, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Union, Callable, Any, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy为可选依赖，缺失时退回纯Python实现
+    np = None
+
+from .cache import DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES, ResponseCache
+from .capture import DIRECTION_RX, DIRECTION_TX, CaptureWriter
+from .checksum import Checksum, SumChecksum, get_checksum
+from .compression import DEFAULT_THRESHOLD, PayloadCompressor, decompress_payload
+from .lanes import DEFAULT_MAX_QUEUE, PRIORITY_NORMAL, PriorityScheduler
+from .metrics import (DECODE_CHECKSUM, DECODE_DECOMPRESS, DECODE_HEADER, DECODE_LENGTH, DEFAULT_PREFIX,
+                      ProtocolMetrics, format_prometheus)
+from .packet import Packet
+from .schema import Schema
 
 logger = logging.getLogger(__name__)
 
+PACKET_HEADER = 0xAA  # 包头
+FLAG_COMPRESSED = 0x01  # 包头中的压缩标志位
+COMPRESSED_HEADER = PACKET_HEADER | FLAG_COMPRESSED  # 压缩帧包头，普通帧格式保持不变
+HEADER_SIZE = 4  # 包头(1) + 命令ID(1) + 数据长度(2)
+MIN_PACKET_SIZE = 5  # 包头(1) + 命令ID(1) + 数据长度(2) + 校验和(默认1字节)
+MAX_DATA_LENGTH = 0xFFFF  # 数据长度字段为16位
+STREAM_MAX_DATA_LENGTH = 1024  # 流式解码默认允许的最大数据长度，超过视为损坏帧；需要更大的帧时显式指定
+STREAM_LOOKAHEAD = 256  # 等待中的帧已缓冲该字节数后才向后查找重新同步点
+
+_HEADER_STRUCT = struct.Struct("!BH")
+_FRAME_HEADER_STRUCT = struct.Struct("!BBH")  # 包头 + 命令ID + 数据长度
+NUMPY_BATCH_THRESHOLD = 64  # 批量解码中帧数达到该值时才使用NumPy校验
+
+DISPATCH_HEADER = "header"  # 按帧包头识别协议
+DISPATCH_PREFIX = "prefix"  # 按帧前的1字节协议ID识别协议
+_PREFIX_BYTES = [bytes((i,)) for i in range(256)]  # 预生成的协议ID前缀
+
+OFFLOAD_IO = "io"  # IO密集型处理函数，在线程池中执行
+OFFLOAD_CPU = "cpu"  # CPU密集型处理函数，在进程池中执行
+
+
 class Protocol:
     """协议基类，定义协议的基本结构和操作"""
     
-    def __init__(self, name: str, version: str = "1.0"):
+    def __init__(self, name: str, version: str = "1.0", checksum: Union[str, Checksum, None] = None,
+                 header: int = PACKET_HEADER):
         """
         初始化协议
         
         参数:
             name: 协议名称
             version: 协议版本，默认为"1.0"
+            checksum: 校验和算法名称（sum8/crc8/crc16/crc32）或实例，默认为8位累加和
+            header: 帧包头，默认为0xAA；最低位保留为压缩标志，须为偶数。
+                    多个协议共用一条链路时各自使用不同的包头
         """
+        if not 0 <= header <= 0xFF or header & FLAG_COMPRESSED:
+            raise ValueError(f"无效的包头: {header}")
         self.name = name
         self.version = version
+        self.header = header
+        self.compressed_header = header | FLAG_COMPRESSED
         self.commands = {}  # 命令字典
         self.handlers = {}  # 处理函数字典
+        self.checksum = get_checksum(checksum)
+        self.min_packet_size = HEADER_SIZE + self.checksum.size  # 空数据包长度
+        self.offload = {}  # 命令ID -> 卸载类型(OFFLOAD_IO/OFFLOAD_CPU)
+        self.concurrency_limits = {}  # 命令ID -> 最大并发数
+        self.io_executor = None  # IO密集型处理函数的线程池，None表示使用事件循环默认线程池
+        self.cpu_executor = None  # CPU密集型处理函数的进程池，None表示首次使用时创建
+        self._semaphores = {}  # 命令ID -> asyncio.Semaphore，首次使用时创建
+        self.compression = None  # 数据负载压缩器，None表示发送时不压缩
+        self.compress_default = True  # 未单独设置的命令是否压缩
+        self.compress_commands = {}  # 命令ID -> 是否压缩
+        self.schemas = {}  # 命令ID -> 请求数据负载模式
+        self.response_schemas = {}  # 命令ID -> 响应数据负载模式
+        self.metrics = None  # 协议指标，None表示未启用
+        self.capture = None  # 抓包写入器，None表示未抓包
+        self.capture_channel = 0  # 抓包记录的通道号
+        self.response_cache = None  # 响应缓存，None表示未启用
+        self.cached_commands = set()  # 响应可缓存的命令ID
+        self.priorities = {}  # 命令ID -> 优先级，未设置的命令为 PRIORITY_NORMAL
     
-    def register_command(self, command_id: int, name: str, handler: Optional[Callable] = None) -> None:
+    def register_command(self, command_id: int, name: str, handler: Optional[Callable] = None,
+                         offload: Optional[str] = None, max_concurrency: Optional[int] = None,
+                         compress: Optional[bool] = None, schema: Optional[Schema] = None,
+                         response_schema: Optional[Schema] = None, cache: bool = False,
+                         priority: int = PRIORITY_NORMAL) -> None:
         """
         注册命令
         
         参数:
             command_id: 命令ID
             name: 命令名称
-            handler: 命令处理函数，可选
+            handler: 命令处理函数，可选，可以是普通函数或协程函数；协程函数只能通过 handle_packet_async 调用，
+                     handle_packet 遇到时记录错误并返回None
+            offload: 同步处理函数的卸载方式，仅对 handle_packet_async 生效：
+                     OFFLOAD_IO 在线程池中执行，OFFLOAD_CPU 在进程池中执行
+                     （处理函数须可被pickle，即模块级函数），None 表示在调用方直接执行
+            max_concurrency: 该命令同时执行的最大数量，仅对 handle_packet_async 生效，None表示不限制
+            compress: 启用压缩后该命令是否压缩，None表示沿用 enable_compression 的默认设置
+            schema: 请求数据负载模式，设置后处理函数接收解码后的记录而非原始字节
+            response_schema: 响应数据负载模式，设置后处理函数可返回记录、序列或字典，按模式编码
+            cache: 响应是否只取决于数据负载（纯函数命令），启用响应缓存后缓存其已编码的响应
+            priority: 优先级（PRIORITY_CONTROL/PRIORITY_NORMAL/PRIORITY_BULK），
+                      仅对 ProtocolHandler 启用优先级通道后的 submit_packet 生效
         """
+        if offload not in (None, OFFLOAD_IO, OFFLOAD_CPU):
+            raise ValueError(f"无效的卸载方式: {offload}")
         self.commands[command_id] = name
         if handler:
             self.handlers[command_id] = handler
             logger.debug(f"已注册命令处理函数: {name} (ID: {command_id})")
+        self.offload.pop(command_id, None)
+        self.concurrency_limits.pop(command_id, None)
+        self._semaphores.pop(command_id, None)
+        if offload:
+            self.offload[command_id] = offload
+        if max_concurrency:
+            self.concurrency_limits[command_id] = max_concurrency
+        if compress is not None:
+            self.compress_commands[command_id] = compress
+        self.schemas.pop(command_id, None)
+        self.response_schemas.pop(command_id, None)
+        if schema is not None:
+            self.schemas[command_id] = schema
+        if response_schema is not None:
+            self.response_schemas[command_id] = response_schema
+        if cache:
+            self.cached_commands.add(command_id)
+        else:
+            self.cached_commands.discard(command_id)
+        if self.response_cache is not None:
+            self.response_cache.invalidate(command_id)
+        if priority != PRIORITY_NORMAL:
+            self.priorities[command_id] = priority
+        else:
+            self.priorities.pop(command_id, None)
+
+    def enable_compression(self, threshold: int = DEFAULT_THRESHOLD, codecs: Iterable[str] = ("zlib",),
+                           level: Optional[int] = None, default: bool = True) -> PayloadCompressor:
+        """
+        启用发送数据负载压缩
+
+        长度达到阈值且压缩后更短的数据负载以压缩帧发送，包头置压缩标志位；
+        其余数据包保持原格式，不支持压缩的旧对端仍可解码。
+        无论是否启用，本协议都能解码收到的压缩帧。
+
+        参数:
+            threshold: 数据负载达到该长度才尝试压缩
+            codecs: 支持的编解码器名称（zlib/bz2/lzma），按优先级排序
+            level: 压缩级别，None表示使用编解码器默认值
+            default: 未通过 register_command/set_command_compression 单独设置的命令是否压缩
+
+        返回:
+            PayloadCompressor: 压缩器，可用于编解码器协商和读取统计
+        """
+        self.compression = PayloadCompressor(threshold, codecs, level)
+        self.compress_default = default
+        return self.compression
+
+    def disable_compression(self) -> None:
+        """停止发送压缩帧"""
+        self.compression = None
+
+    def set_command_compression(self, command_id: int, enabled: Optional[bool]) -> None:
+        """
+        设置单个命令是否压缩
+
+        参数:
+            command_id: 命令ID
+            enabled: 是否压缩，None表示恢复默认设置
+        """
+        if enabled is None:
+            self.compress_commands.pop(command_id, None)
+        else:
+            self.compress_commands[command_id] = enabled
+
+    def enable_metrics(self) -> ProtocolMetrics:
+        """
+        启用按命令的调用次数、解码错误和处理耗时统计
+
+        返回:
+            ProtocolMetrics: 协议指标，已启用时返回现有对象
+        """
+        if self.metrics is None:
+            self.metrics = ProtocolMetrics(self.name, self.commands)
+            logger.info(f"协议 {self.name} 已启用指标统计")
+        return self.metrics
+
+    def disable_metrics(self) -> None:
+        """停用指标统计"""
+        self.metrics = None
+
+    def enable_response_cache(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                              ttl: Optional[float] = None) -> ResponseCache:
+        """
+        启用响应缓存：注册时标记 cache=True 的命令按 (命令ID, 数据负载) 缓存已编码的响应
+
+        参数:
+            max_entries: 最大缓存条目数
+            max_bytes: 缓存的响应数据包总字节数上限
+            ttl: 条目有效期（秒），None表示不过期
+
+        返回:
+            ResponseCache: 响应缓存
+        """
+        self.response_cache = ResponseCache(max_entries, max_bytes, ttl)
+        logger.info(f"协议 {self.name} 已启用响应缓存: 最多 {max_entries} 条 / {max_bytes} 字节")
+        return self.response_cache
+
+    def disable_response_cache(self) -> None:
+        """停用并清空响应缓存"""
+        self.response_cache = None
+
+    def invalidate_cache(self, command_id: Optional[int] = None, payload: Optional[bytes] = None) -> int:
+        """
+        使响应缓存失效，例如命令依赖的配置被修改后
+
+        参数:
+            command_id: 命令ID，None表示清空全部缓存
+            payload: 请求数据负载，None表示该命令的全部条目
+
+        返回:
+            int: 删除的条目数
+        """
+        if self.response_cache is None:
+            return 0
+        return self.response_cache.invalidate(command_id, payload)
+
+    def start_capture(self, writer: CaptureWriter, channel: int = 0) -> None:
+        """
+        开始抓包：handle_packet/handle_packet_async 收到的数据包和发出的响应写入抓包文件
+
+        参数:
+            writer: 抓包写入器
+            channel: 记录的通道号，例如协议ID
+        """
+        self.capture = writer
+        self.capture_channel = channel
+        logger.info(f"协议 {self.name} 开始抓包: {writer.path}")
+
+    def stop_capture(self) -> None:
+        """停止抓包，写入器由调用方关闭"""
+        if self.capture is not None:
+            self.capture.flush()
+        self.capture = None
+
+    def set_executors(self, io_executor: Optional[Executor] = None, cpu_executor: Optional[Executor] = None) -> None:
+        """
+        设置卸载处理函数使用的执行器
+
+        参数:
+            io_executor: IO密集型处理函数使用的执行器，通常为ThreadPoolExecutor
+            cpu_executor: CPU密集型处理函数使用的执行器，通常为ProcessPoolExecutor
+        """
+        self.io_executor = io_executor
+        self.cpu_executor = cpu_executor
+
+    def shutdown_executors(self, wait: bool = True) -> None:
+        """
+        关闭由协议创建或设置的执行器
+
+        参数:
+            wait: 是否等待正在执行的任务完成
+        """
+        for executor in (self.io_executor, self.cpu_executor):
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        self.io_executor = None
+        self.cpu_executor = None
     
     def encode_packet(self, command_id: int, data: bytes = b"") -> bytes:
         """
@@ -50,21 +290,66 @@ class Protocol:
         返回:
             bytes: 编码后的数据包
         """
-        # 基本协议格式: [包头(1字节)] [命令ID(1字节)] [数据长度(2字节)] [数据] [校验和(1字节)]
-        packet_header = 0xAA  # 包头
+        # 基本协议格式: [包头(1字节)] [命令ID(1字节)] [数据长度(2字节)] [数据] [校验和(1/2/4字节)]
+        header = self.header
+        if self.compression is not None:
+            header, data = self._compress(command_id, data)
         data_length = len(data)
-        
-        # 构建数据包
-        packet = struct.pack("!BH", command_id, data_length) + data
-        
-        # 计算校验和
-        checksum = sum(packet) & 0xFF
-        
-        # 添加包头和校验和
-        packet = bytes([packet_header]) + packet + bytes([checksum])
-        
-        return packet
-    
+
+        # 校验和覆盖命令ID、数据长度和数据
+        checksum = self.checksum.frame_checksum(command_id, data_length, data)
+
+        return _FRAME_HEADER_STRUCT.pack(header, command_id, data_length) + data + checksum
+
+    def encode_many(self, frames: Iterable[Tuple[int, bytes]], out: Optional[bytearray] = None) -> bytearray:
+        """
+        批量编码数据包到一个连续缓冲区
+
+        所有帧直接追加写入同一个bytearray，不为每帧构造中间对象。
+        调用方可传入自己的缓冲区以便复用。
+
+        参数:
+            frames: (命令ID, 数据负载)序列
+            out: 输出缓冲区，可选，编码结果追加在其末尾
+
+        返回:
+            bytearray: 依次拼接的编码后数据包
+        """
+        if out is None:
+            out = bytearray()
+        pack = _FRAME_HEADER_STRUCT.pack
+        frame_checksum = self.checksum.frame_checksum
+        compress = self._compress if self.compression is not None else None
+        header = self.header
+        for command_id, data in frames:
+            if compress is not None:
+                header, data = compress(command_id, data)
+            data_length = len(data)
+            out += pack(header, command_id, data_length)
+            out += data
+            out += frame_checksum(command_id, data_length, data)
+        return out
+
+    def _compress(self, command_id: int, data: bytes) -> Tuple[int, bytes]:
+        """按压缩策略处理待发送的数据负载，返回(包头, 数据负载)"""
+        compression = self.compression
+        if len(data) >= compression.threshold and self.compress_commands.get(command_id, self.compress_default):
+            compressed = compression.compress(data)
+            if compressed is not None:
+                return self.compressed_header, compressed
+        return self.header, data
+
+    def _decompress(self, data: bytes) -> Optional[bytes]:
+        """解压收到的压缩帧数据负载"""
+        if self.compression is not None:
+            return self.compression.decompress(data)
+        return decompress_payload(data)
+
+    def _decode_error(self, reason: str, count: int = 1) -> None:
+        """启用指标时记录解码失败原因"""
+        if self.metrics is not None:
+            self.metrics.decode_error(reason, count)
+
     def decode_packet(self, packet: bytes) -> Tuple[Optional[int], Optional[bytes]]:
         """
         解码数据包
@@ -76,35 +361,259 @@ class Protocol:
             Tuple[Optional[int], Optional[bytes]]: (命令ID, 数据负载)，解析失败则返回(None, None)
         """
         # 检查数据包长度
-        if len(packet) < 5:  # 包头(1) + 命令ID(1) + 数据长度(2) + 校验和(1)
+        if len(packet) < self.min_packet_size:  # 包头(1) + 命令ID(1) + 数据长度(2) + 校验和
             logger.error(f"数据包长度不足: {len(packet)}")
+            self._decode_error(DECODE_LENGTH)
             return None, None
         
         # 检查包头
-        if packet[0] != 0xAA:
-            logger.error(f"无效的包头: {packet[0]}")
+        header = packet[0]
+        if header != self.header and header != self.compressed_header:
+            logger.error(f"无效的包头: {header}")
+            self._decode_error(DECODE_HEADER)
             return None, None
         
         # 解析命令ID和数据长度
-        command_id, data_length = struct.unpack("!BH", packet[1:4])
+        command_id, data_length = _HEADER_STRUCT.unpack_from(packet, 1)
         
         # 检查数据包长度是否匹配
-        expected_length = 5 + data_length  # 包头(1) + 命令ID(1) + 数据长度(2) + 数据(data_length) + 校验和(1)
+        expected_length = self.min_packet_size + data_length  # 包头(1) + 命令ID(1) + 数据长度(2) + 数据(data_length) + 校验和
         if len(packet) != expected_length:
             logger.error(f"数据包长度不匹配: 预期 {expected_length}，实际 {len(packet)}")
+            self._decode_error(DECODE_LENGTH)
             return None, None
         
         # 提取数据负载
-        data = packet[4:-1]
+        checksum_pos = HEADER_SIZE + data_length
+        data = packet[HEADER_SIZE:checksum_pos]
         
-        # 检查校验和
-        expected_checksum = sum(packet[1:-1]) & 0xFF
-        actual_checksum = packet[-1]
+        # 检查校验和，在视图上计算以免复制校验区域
+        with memoryview(packet) as view:
+            expected_checksum = self.checksum.compute(view[1:checksum_pos])
+        actual_checksum = self.checksum.unpack_from(packet, checksum_pos)
         if expected_checksum != actual_checksum:
             logger.error(f"校验和不匹配: 预期 {expected_checksum}，实际 {actual_checksum}")
+            self._decode_error(DECODE_CHECKSUM)
             return None, None
+
+        # 解压压缩帧
+        if header == self.compressed_header:
+            data = self._decompress(data)
+            if data is None:
+                self._decode_error(DECODE_DECOMPRESS)
+                return None, None
         
         return command_id, data
+
+    def decode_view(self, buffer: Union[bytes, bytearray, memoryview], offset: int = 0,
+                    end: Optional[int] = None, packet: Optional[Packet] = None) -> Optional[Packet]:
+        """
+        零拷贝解码缓冲区中的一个数据包
+
+        数据负载以指向buffer的memoryview返回，不复制数据；压缩帧解压后为新的bytes。
+
+        参数:
+            buffer: 接收缓冲区
+            offset: 数据包在缓冲区中的起始偏移
+            end: 数据包结束偏移，None表示缓冲区末尾
+            packet: 复用的数据包视图对象，None表示新建
+
+        返回:
+            Optional[Packet]: 数据包视图，解析失败返回None
+        """
+        view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        if end is None:
+            end = len(view)
+        if end - offset < self.min_packet_size:
+            logger.error(f"数据包长度不足: {end - offset}")
+            self._decode_error(DECODE_LENGTH)
+            return None
+
+        header, command_id, data_length = _FRAME_HEADER_STRUCT.unpack_from(view, offset)
+        if header != self.header and header != self.compressed_header:
+            logger.error(f"无效的包头: {header}")
+            self._decode_error(DECODE_HEADER)
+            return None
+        if end - offset != self.min_packet_size + data_length:
+            logger.error(f"数据包长度不匹配: 预期 {self.min_packet_size + data_length}，实际 {end - offset}")
+            self._decode_error(DECODE_LENGTH)
+            return None
+
+        checksum_pos = offset + HEADER_SIZE + data_length
+        if self.checksum.compute(view[offset + 1:checksum_pos]) != self.checksum.unpack_from(view, checksum_pos):
+            logger.error(f"校验和不匹配: 命令 {command_id}")
+            self._decode_error(DECODE_CHECKSUM)
+            return None
+
+        payload = view[offset + HEADER_SIZE:checksum_pos]
+        if header == self.compressed_header:
+            payload = self._decompress(payload)
+            if payload is None:
+                self._decode_error(DECODE_DECOMPRESS)
+                return None
+
+        if packet is None:
+            return Packet(header, command_id, payload)
+        packet.header = header
+        packet.command_id = command_id
+        packet.payload = payload
+        return packet
+
+    def iter_packets(self, buffer: Union[bytes, bytearray, memoryview], packet: Optional[Packet] = None) -> Iterator[Packet]:
+        """
+        零拷贝遍历缓冲区中首尾相连的多个数据包
+
+        与 decode_many 的帧边界规则相同：校验失败的帧被跳过，遇到无效包头或截断的帧时停止。
+        传入 packet 时每次产出同一个对象，其内容在下一次迭代时被覆盖。
+
+        参数:
+            buffer: 包含多个完整数据包的缓冲区
+            packet: 复用的数据包视图对象，None表示每帧新建
+
+        返回:
+            Iterator[Packet]: 数据包视图迭代器
+        """
+        view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        end = len(view)
+        pos = 0
+        header, compressed_header = self.header, self.compressed_header
+        min_packet_size = self.min_packet_size
+        compute = self.checksum.compute
+        read_checksum = self.checksum.unpack_from
+        unpack_from = _FRAME_HEADER_STRUCT.unpack_from
+
+        while end - pos >= min_packet_size:
+            frame_header, command_id, data_length = unpack_from(view, pos)
+            if frame_header != header and frame_header != compressed_header:
+                logger.error(f"无效的包头: {frame_header}，停止解析")
+                self._decode_error(DECODE_HEADER)
+                break
+            frame_end = pos + min_packet_size + data_length
+            if frame_end > end:
+                logger.error(f"数据包被截断: 偏移 {pos}")
+                self._decode_error(DECODE_LENGTH)
+                break
+
+            checksum_pos = pos + HEADER_SIZE + data_length
+            if compute(view[pos + 1:checksum_pos]) != read_checksum(view, checksum_pos):
+                logger.error(f"校验和不匹配: 偏移 {pos}")
+                self._decode_error(DECODE_CHECKSUM)
+                pos = frame_end
+                continue
+
+            payload = view[pos + HEADER_SIZE:checksum_pos]
+            pos = frame_end
+            if frame_header == compressed_header:
+                payload = self._decompress(payload)
+                if payload is None:
+                    self._decode_error(DECODE_DECOMPRESS)
+                    continue
+
+            if packet is None:
+                yield Packet(frame_header, command_id, payload)
+            else:
+                packet.header = frame_header
+                packet.command_id = command_id
+                packet.payload = payload
+                yield packet
+
+    def decode_many(self, buffer: Union[bytes, bytearray, memoryview]) -> List[Tuple[int, bytes]]:
+        """
+        单次遍历解码缓冲区中首尾相连的多个数据包
+
+        按帧头依次遍历各帧；使用8位累加和、安装了NumPy且缓冲区较大时，
+        校验和推迟到遍历结束后用前缀和一次性向量化校验，否则逐帧校验。校验失败的帧被丢弃，
+        遇到无效包头或截断的帧时停止解析。
+
+        参数:
+            buffer: 包含多个完整数据包的缓冲区
+
+        返回:
+            List[Tuple[int, bytes]]: 校验通过的(命令ID, 数据负载)列表
+        """
+        # 整体复制一次为bytes，之后每帧切片只需一次复制
+        buf = buffer if isinstance(buffer, bytes) else bytes(buffer)
+        end = len(buf)
+        unpack_from = _HEADER_STRUCT.unpack_from
+        checksum = self.checksum
+        compute = checksum.compute
+        read_checksum = checksum.unpack_from
+        min_packet_size = self.min_packet_size
+        use_numpy = (np is not None and isinstance(checksum, SumChecksum)
+                     and end >= NUMPY_BATCH_THRESHOLD * min_packet_size)
+        frames = []
+        append = frames.append
+        checksum_positions = []  # NumPy路径下延后统一校验
+        compressed_indexes = []  # 压缩帧在frames中的下标，校验后统一解压
+        failed = 0
+        plain_header = self.header
+        compressed_header = self.compressed_header
+
+        pos = 0
+        last_header = end - min_packet_size
+        while pos < end:
+            header = buf[pos] if pos <= last_header else None
+            if header != plain_header and header != compressed_header:
+                logger.error(f"批量解码在偏移 {pos} 处遇到无效数据，剩余 {end - pos} 字节未解析")
+                self._decode_error(DECODE_HEADER if header is not None else DECODE_LENGTH)
+                break
+            command_id, data_length = unpack_from(buf, pos + 1)
+            checksum_pos = pos + HEADER_SIZE + data_length
+            frame_end = pos + min_packet_size + data_length
+            if frame_end > end:
+                logger.error(f"批量解码在偏移 {pos} 处遇到截断的数据包")
+                self._decode_error(DECODE_LENGTH)
+                break
+            if use_numpy:
+                checksum_positions.append(checksum_pos)
+            elif compute(buf[pos + 1:checksum_pos]) != read_checksum(buf, checksum_pos):
+                failed += 1
+                pos = frame_end
+                continue
+            if header == compressed_header:
+                compressed_indexes.append(len(frames))
+            append((command_id, buf[pos + HEADER_SIZE:checksum_pos]))
+            pos = frame_end
+
+        valid = None
+        if checksum_positions:
+            valid = self._verify_checksums_numpy(buf, checksum_positions, frames)
+            failed = len(frames) - sum(valid)
+
+        if failed:
+            logger.error(f"批量解码中有 {failed} 个数据包校验和不匹配")
+            self._decode_error(DECODE_CHECKSUM, failed)
+
+        for index in compressed_indexes:
+            if valid is not None and not valid[index]:
+                continue
+            command_id, payload = frames[index]
+            payload = self._decompress(payload)
+            if payload is None:
+                self._decode_error(DECODE_DECOMPRESS)
+                if valid is None:
+                    valid = [True] * len(frames)
+                valid[index] = False
+            else:
+                frames[index] = (command_id, payload)
+
+        if valid is not None and not all(valid):
+            frames = [frame for frame, ok in zip(frames, valid) if ok]
+
+        return frames
+
+    @staticmethod
+    def _verify_checksums_numpy(buf, checksum_positions: List[int], frames: List[Tuple[int, bytes]]) -> List[bool]:
+        """使用前缀和向量化校验多个数据包的校验和"""
+        data = np.frombuffer(buf, dtype=np.uint8)
+        prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+        np.cumsum(data, dtype=np.uint64, out=prefix[1:])
+        ends = np.asarray(checksum_positions, dtype=np.intp)
+        lengths = np.fromiter((len(payload) for _, payload in frames), dtype=np.intp, count=len(frames))
+        # 校验和覆盖 [包头之后, 校验和之前) 区间，即命令ID、数据长度和数据
+        starts = ends - lengths - (HEADER_SIZE - 1)
+        sums = (prefix[ends] - prefix[starts]) & 0xFF
+        return (sums == data[ends]).tolist()
     
     def handle_packet(self, packet: bytes) -> Optional[bytes]:
         """
@@ -116,20 +625,87 @@ class Protocol:
         返回:
             Optional[bytes]: 响应数据包，如果不需要响应则返回None
         """
+        capture = self.capture
+        if capture is not None:
+            capture.record(DIRECTION_RX, packet, self.capture_channel)
+
         # 解码数据包
         command_id, data = self.decode_packet(packet)
         if command_id is None:
             return None
         
+        response = self.handle_command(command_id, data)
+        if capture is not None and response is not None:
+            capture.record(DIRECTION_TX, response, self.capture_channel)
+        return response
+
+    def handle_command(self, command_id: int, data: bytes) -> Optional[bytes]:
+        """
+        调用已解码命令的处理函数
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+
+        返回:
+            Optional[bytes]: 响应数据包，如果不需要响应则返回None
+        """
+        cache = self.response_cache
+        if cache is not None and command_id in self.cached_commands:
+            data = bytes(data)
+            response = cache.get(command_id, data)
+            if response is not None:
+                return response
+            generation = cache.generation(command_id)  # 处理期间发生失效时不缓存旧响应
+        else:
+            cache = None
+
+        response_data = self.invoke(command_id, data)
+        if response_data is not None:
+            # 编码响应数据包
+            response = self.encode_packet(command_id, response_data)
+            if cache is not None:
+                cache.put(command_id, data, response, generation)
+            return response
+        return None
+
+    def invoke(self, command_id: int, data: bytes) -> Optional[bytes]:
+        """
+        调用命令处理函数并返回未编码的响应数据
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+
+        返回:
+            Optional[bytes]: 响应数据负载，未找到处理函数、处理出错、处理函数是协程函数或不需要响应时返回None
+        """
         # 查找命令处理函数
         handler = self.handlers.get(command_id)
         if handler:
             try:
+                schema = self.schemas.get(command_id)
+                if schema is not None:
+                    data = schema.decode(data)
                 # 调用处理函数
-                response_data = handler(data)
-                if response_data is not None:
-                    # 编码响应数据包
-                    return self.encode_packet(command_id, response_data)
+                metrics = self.metrics
+                if metrics is None:
+                    result = handler(data)
+                else:
+                    start = time.perf_counter()
+                    try:
+                        result = handler(data)
+                    except Exception:
+                        metrics.observe(command_id, time.perf_counter() - start, error=True)
+                        raise
+                    metrics.observe(command_id, time.perf_counter() - start, error=inspect.isawaitable(result))
+                if inspect.isawaitable(result):
+                    # 同步路径无法等待协程处理函数，关闭协程以免出现“从未等待”的警告
+                    if inspect.iscoroutine(result):
+                        result.close()
+                    logger.error(f"命令 {command_id} 的处理函数是协程函数，须通过 handle_packet_async 处理")
+                    return None
+                return self._encode_result(command_id, result)
             except Exception as e:
                 logger.error(f"处理命令时出错: {e}")
         else:
@@ -137,30 +713,465 @@ class Protocol:
         
         return None
 
+    async def handle_packet_async(self, packet: bytes) -> Optional[bytes]:
+        """
+        在事件循环中异步处理接收到的数据包
+
+        协程处理函数直接await；注册时标记为IO/CPU密集型的同步处理函数
+        分派到对应执行器中运行，不阻塞事件循环；设置了并发上限的命令
+        超出上限时排队等待。
+
+        参数:
+            packet: 接收到的数据包
+
+        返回:
+            Optional[bytes]: 响应数据包，如果不需要响应则返回None
+        """
+        capture = self.capture
+        if capture is not None:
+            capture.record(DIRECTION_RX, packet, self.capture_channel)
+
+        # 解码数据包
+        command_id, data = self.decode_packet(packet)
+        if command_id is None:
+            return None
+
+        response = await self.handle_command_async(command_id, data)
+        if capture is not None and response is not None:
+            capture.record(DIRECTION_TX, response, self.capture_channel)
+        return response
+
+    async def handle_command_async(self, command_id: int, data: bytes) -> Optional[bytes]:
+        """
+        在事件循环中异步调用已解码命令的处理函数
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+
+        返回:
+            Optional[bytes]: 响应数据包，如果不需要响应则返回None
+        """
+        cache = self.response_cache
+        if cache is not None and command_id in self.cached_commands:
+            data = bytes(data)
+            response = cache.get(command_id, data)
+            if response is not None:
+                return response
+            generation = cache.generation(command_id)  # 处理期间发生失效时不缓存旧响应
+        else:
+            cache = None
+
+        response_data = await self.invoke_async(command_id, data)
+        if response_data is not None:
+            # 编码响应数据包
+            response = self.encode_packet(command_id, response_data)
+            if cache is not None:
+                cache.put(command_id, data, response, generation)
+            return response
+        return None
+
+    async def invoke_async(self, command_id: int, data: bytes) -> Optional[bytes]:
+        """
+        在事件循环中异步调用命令处理函数并返回未编码的响应数据
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+
+        返回:
+            Optional[bytes]: 响应数据负载，未找到处理函数、处理出错或不需要响应时返回None
+        """
+        # 查找命令处理函数
+        handler = self.handlers.get(command_id)
+        if handler is None:
+            logger.warning(f"未找到命令处理函数: {command_id}")
+            return None
+
+        try:
+            schema = self.schemas.get(command_id)
+            if schema is not None:
+                data = schema.decode(data)
+            semaphore = self._get_semaphore(command_id)
+            if semaphore is None:
+                return self._encode_result(command_id, await self._call_handler(command_id, handler, data))
+            async with semaphore:
+                result = await self._call_handler(command_id, handler, data)
+            return self._encode_result(command_id, result)
+        except Exception as e:
+            logger.error(f"处理命令时出错: {e}")
+
+        return None
+
+    def _encode_result(self, command_id: int, result: Any) -> Optional[bytes]:
+        """按响应模式编码处理函数的返回值"""
+        if result is None:
+            return None
+        response_schema = self.response_schemas.get(command_id)
+        if response_schema is not None:
+            return response_schema.encode(result)
+        return result
+
+    async def _call_handler(self, command_id: int, handler: Callable, data: bytes) -> Any:
+        """按注册的卸载方式调用处理函数，启用指标时记录耗时"""
+        metrics = self.metrics
+        if metrics is None:
+            return await self._run_handler(command_id, handler, data)
+        start = time.perf_counter()
+        try:
+            result = await self._run_handler(command_id, handler, data)
+        except Exception:
+            metrics.observe(command_id, time.perf_counter() - start, error=True)
+            raise
+        metrics.observe(command_id, time.perf_counter() - start)
+        return result
+
+    async def _run_handler(self, command_id: int, handler: Callable, data: bytes) -> Any:
+        """按注册的卸载方式调用处理函数"""
+        offload = self.offload.get(command_id)
+        if offload is None:
+            result = handler(data)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(offload), handler, data)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _get_executor(self, offload: str) -> Optional[Executor]:
+        """获取卸载类型对应的执行器"""
+        if offload == OFFLOAD_IO:
+            return self.io_executor
+        if self.cpu_executor is None:
+            self.cpu_executor = ProcessPoolExecutor()
+            logger.info(f"协议 {self.name} 已创建CPU密集型命令进程池")
+        return self.cpu_executor
+
+    def _get_semaphore(self, command_id: int) -> Optional[asyncio.Semaphore]:
+        """获取命令的并发限制信号量，未设置上限时返回None"""
+        semaphore = self._semaphores.get(command_id)
+        if semaphore is None:
+            limit = self.concurrency_limits.get(command_id)
+            if limit is None:
+                return None
+            semaphore = self._semaphores[command_id] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def create_stream_decoder(self, max_data_length: int = STREAM_MAX_DATA_LENGTH) -> "StreamDecoder":
+        """
+        创建与本协议帧格式匹配的流式解码器
+
+        参数:
+            max_data_length: 允许的最大数据长度，超过则视为损坏帧
+
+        返回:
+            StreamDecoder: 流式解码器
+        """
+        return StreamDecoder(max_data_length, self.checksum, self._decompress, self.header)
+
+
+class StreamDecoder:
+    """
+    流式解码器，从任意分片的字节流中重组完整数据包
+
+    BLE写入按MTU分片到达，也可能多个数据包粘连在一次写入中。
+    解码器内部维护一个接收缓冲区和读取偏移，只在已消费部分超过
+    缓冲区一半时才压缩缓冲区，避免每次feed都复制全部数据。
+    遇到包头错误或校验和错误时丢弃一个字节并在下一个已知包头处重新同步。
+    长度字段损坏（但未超过 max_data_length）的帧会让解码器等待并不存在的数据，
+    因此等待中的帧已缓冲 STREAM_LOOKAHEAD 字节后向后查找：缓冲区中其后已有完整且校验通过的帧时，
+    把等待中的帧视为损坏并在该处重新同步。
+
+    帧格式按包头字节登记在256项查找表中，同一字节流可以承载多个
+    包头不同的协议（见 ProtocolHandler.create_stream_decoder）。
+    """
+
+    def __init__(self, max_data_length: int = STREAM_MAX_DATA_LENGTH, checksum: Union[str, Checksum, None] = None,
+                 decompress: Optional[Callable[[bytes], Optional[bytes]]] = None,
+                 header: Optional[int] = PACKET_HEADER):
+        """
+        初始化流式解码器
+
+        参数:
+            max_data_length: 允许的最大数据长度，超过则视为损坏帧并重新同步
+            checksum: 校验和算法名称或实例，需与发送端协议一致，默认为8位累加和
+            decompress: 压缩帧数据负载的解压函数，None表示不接受压缩帧
+            header: 帧包头，None表示暂不登记帧格式，之后通过 add_format 登记
+        """
+        self.max_data_length = max_data_length
+        self.checksum = get_checksum(checksum)
+        self.decompress = decompress
+        self.tagged = False  # 是否在结果中附带帧格式标签
+        self._formats = [None] * 256  # 包头字节 -> (标签, 校验函数, 读取校验和函数, 最小包长, 解压函数)
+        self._headers = []  # 已登记的包头字节，用于重新同步
+        self._buffer = bytearray()
+        self._pos = 0  # 当前读取偏移
+        self._scan_offset = 0  # 等待中的帧之后已确定无法重新同步的字节数（相对读取偏移）
+        self.frames_decoded = 0  # 成功解码的帧数
+        self.bytes_discarded = 0  # 重新同步时丢弃的字节数
+        self.checksum_errors = 0  # 校验和错误次数
+        self.decompress_errors = 0  # 压缩帧解压失败次数
+        if header is not None:
+            self.add_format(header, self.checksum, decompress)
+
+    def add_format(self, header: int, checksum: Union[str, Checksum, None] = None,
+                   decompress: Optional[Callable[[bytes], Optional[bytes]]] = None, tag: Any = None) -> None:
+        """
+        登记一种帧格式
+
+        参数:
+            header: 帧包头，压缩帧包头为 header | FLAG_COMPRESSED
+            checksum: 校验和算法名称或实例
+            decompress: 压缩帧数据负载的解压函数，None表示不接受压缩帧
+            tag: 帧格式标签，不为None时 feed 返回 (标签, 命令ID, 数据负载)
+        """
+        checksum = get_checksum(checksum)
+        headers = [header] if decompress is None else [header, header | FLAG_COMPRESSED]
+        for value in headers:
+            if self._formats[value] is not None:
+                raise ValueError(f"包头已被登记: 0x{value:02X}")
+        entry = (tag, checksum.compute, checksum.unpack_from, HEADER_SIZE + checksum.size, None)
+        self._formats[header] = entry
+        self._headers.append(header)
+        if decompress is not None:
+            self._formats[header | FLAG_COMPRESSED] = entry[:4] + (decompress,)
+            self._headers.append(header | FLAG_COMPRESSED)
+        if tag is not None:
+            self.tagged = True
+
+    @property
+    def pending(self) -> int:
+        """缓冲区中尚未解码的字节数"""
+        return len(self._buffer) - self._pos
+
+    def reset(self) -> None:
+        """清空接收缓冲区"""
+        self._buffer.clear()
+        self._pos = 0
+        self._scan_offset = 0
+
+    def _resync(self, buf: bytearray, start: int, end: int) -> int:
+        """查找start之后最近的已登记包头，未找到时返回end"""
+        next_pos = end
+        for header in self._headers:
+            found = buf.find(header, start, next_pos)
+            if found >= 0:
+                next_pos = found
+        return next_pos
+
+    def _valid_frame_end(self, buf: bytearray, pos: int, end: int) -> int:
+        """pos 处是完整且校验通过的帧时返回帧结束偏移，否则返回-1"""
+        fmt = self._formats[buf[pos]]
+        if fmt is None or end - pos < fmt[3]:
+            return -1
+        data_length = _HEADER_STRUCT.unpack_from(buf, pos + 1)[1]
+        frame_end = pos + fmt[3] + data_length
+        if data_length > self.max_data_length or frame_end > end:
+            return -1
+        checksum_pos = pos + HEADER_SIZE + data_length
+        if fmt[1](buf[pos + 1:checksum_pos]) != fmt[2](buf, checksum_pos):
+            return -1
+        return frame_end
+
+    def _lookahead(self, buf: bytearray, start: int, end: int) -> Tuple[int, int]:
+        """
+        在等待中的帧之后从 start 起查找可重新同步的位置
+
+        候选帧须完整且校验通过，并且紧接着缓冲区末尾或另一个已登记的包头，
+        以免把大帧数据负载中恰好形如帧的字节误认为重新同步点。
+
+        返回:
+            Tuple[int, int]: (重新同步位置，未找到时为-1; 下次继续查找的位置，
+                              即第一个尚不完整的候选帧，之前的候选已确定无效)
+        """
+        formats = self._formats
+        resume = -1
+        candidate = self._resync(buf, start, end)
+        while candidate < end:
+            frame_end = self._valid_frame_end(buf, candidate, end)
+            if frame_end >= 0 and (frame_end == end or formats[buf[frame_end]] is not None):
+                return candidate, candidate
+            if resume < 0 and frame_end < 0 and self._incomplete(buf, candidate, end):
+                resume = candidate
+            candidate = self._resync(buf, candidate + 1, end)
+        return -1, end if resume < 0 else resume
+
+    def _incomplete(self, buf: bytearray, pos: int, end: int) -> bool:
+        """pos 处的候选帧是否因数据未到齐而无法判断"""
+        if end - pos < HEADER_SIZE:
+            return True
+        data_length = _HEADER_STRUCT.unpack_from(buf, pos + 1)[1]
+        return data_length <= self.max_data_length and pos + self._formats[buf[pos]][3] + data_length > end
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> List[Tuple]:
+        """
+        输入一段字节流并返回其中所有完整的数据包
+
+        参数:
+            data: 接收到的字节分片
+
+        返回:
+            List[Tuple]: 完整数据包的(命令ID, 数据负载)列表；
+                         登记了带标签的帧格式时为(标签, 命令ID, 数据负载)列表
+        """
+        buf = self._buffer
+        buf += data
+        pos = first = self._pos
+        end = len(buf)
+        scan_offset, self._scan_offset = self._scan_offset, 0
+        frames = []
+        append = frames.append
+        unpack_from = _HEADER_STRUCT.unpack_from
+        max_data_length = self.max_data_length
+        formats = self._formats
+        tagged = self.tagged
+
+        while end - pos >= MIN_PACKET_SIZE:
+            fmt = formats[buf[pos]]
+            if fmt is None:
+                # 在下一个包头处重新同步
+                next_pos = self._resync(buf, pos + 1, end)
+                self.bytes_discarded += next_pos - pos
+                pos = next_pos
+                continue
+
+            tag, compute, read_checksum, min_packet_size, decompress = fmt
+            command_id, data_length = unpack_from(buf, pos + 1)
+            if data_length > max_data_length:
+                self.bytes_discarded += 1
+                pos += 1
+                continue
+
+            frame_end = pos + min_packet_size + data_length
+            if frame_end > end:
+                # 其后已有可重新同步的完整帧时说明长度字段已损坏，否则等待更多数据
+                if end - pos < STREAM_LOOKAHEAD:
+                    break  # 常见情况：帧的其余分片尚未到达，不向后查找
+                start = pos + max(scan_offset, 1) if pos == first else pos + 1
+                next_pos, resume = self._lookahead(buf, start, end)
+                if next_pos < 0:
+                    self._scan_offset = resume - pos
+                    break
+                self.bytes_discarded += next_pos - pos
+                pos = next_pos
+                continue
+
+            checksum_pos = pos + HEADER_SIZE + data_length
+            if compute(buf[pos + 1:checksum_pos]) != read_checksum(buf, checksum_pos):
+                # 可能是误认的包头，丢弃一个字节后重新同步
+                self.checksum_errors += 1
+                self.bytes_discarded += 1
+                pos += 1
+                continue
+
+            payload = bytes(buf[pos + HEADER_SIZE:checksum_pos])
+            pos = frame_end
+            if decompress is not None:
+                payload = decompress(payload)
+                if payload is None:
+                    self.decompress_errors += 1
+                    continue
+            if tagged:
+                append((tag, command_id, payload))
+            else:
+                append((command_id, payload))
+
+        # 已消费部分超过一半时才压缩缓冲区，摊销复制开销
+        if pos == end:
+            buf.clear()
+            pos = 0
+        elif pos > (end >> 1):
+            del buf[:pos]
+            pos = 0
+        self._pos = pos
+        self.frames_decoded += len(frames)
+        return frames
+
 
 class ProtocolHandler:
-    """协议处理器，用于管理多个协议"""
+    """
+    协议处理器，用于管理多个协议
+
+    启用分发模式后，数据包按首字节查256项分发表识别所属协议，
+    同一链路可以同时承载多个已注册的协议：
+    DISPATCH_HEADER 按各协议不同的帧包头识别，
+    DISPATCH_PREFIX 按帧前附加的1字节协议ID识别。
+    """
     
-    def __init__(self):
-        """初始化协议处理器"""
+    def __init__(self, dispatch: Optional[str] = None):
+        """
+        初始化协议处理器
+
+        参数:
+            dispatch: 分发模式，None表示由调用方指定协议ID（默认协议兜底），
+                      可选 DISPATCH_HEADER 或 DISPATCH_PREFIX
+        """
+        if dispatch not in (None, DISPATCH_HEADER, DISPATCH_PREFIX):
+            raise ValueError(f"无效的分发模式: {dispatch}")
         self.protocols = {}  # 协议字典
         self.default_protocol = None  # 默认协议
+        self.dispatch = dispatch
+        self._dispatch_table = [None] * 256  # 首字节 -> (协议ID, 协议对象)
+        self.unroutable = 0  # 无法识别所属协议的数据包数
+        self.lanes = None  # 优先级调度器，None表示按到达顺序直接处理
     
     def register_protocol(self, protocol_id: int, protocol: Protocol, default: bool = False) -> None:
         """
         注册协议
         
         参数:
-            protocol_id: 协议ID
-            protocol: 协议对象
+            protocol_id: 协议ID，前缀分发模式下须为0-255
+            protocol: 协议对象，包头分发模式下各协议的包头须互不相同
             default: 是否设为默认协议
+
+        异常:
+            ValueError: 协议在分发表中与已注册协议冲突
         """
+        if self.dispatch is not None:
+            self._add_route(protocol_id, protocol)
         self.protocols[protocol_id] = protocol
         logger.info(f"已注册协议: {protocol.name} (ID: {protocol_id})")
         
         if default or self.default_protocol is None:
             self.default_protocol = protocol_id
             logger.info(f"已设置默认协议: {protocol.name} (ID: {protocol_id})")
+
+    def _add_route(self, protocol_id: int, protocol: Protocol) -> None:
+        """在分发表中登记协议"""
+        if self.dispatch == DISPATCH_HEADER:
+            keys = (protocol.header, protocol.compressed_header)
+        else:
+            if not 0 <= protocol_id <= 0xFF:
+                raise ValueError(f"前缀分发模式下协议ID须为0-255: {protocol_id}")
+            keys = (protocol_id,)
+
+        table = self._dispatch_table
+        for key in keys:
+            entry = table[key]
+            if entry is not None and entry[0] != protocol_id:
+                raise ValueError(f"首字节 0x{key:02X} 已分配给协议: {entry[1].name} (ID: {entry[0]})")
+
+        # 重新注册同一协议ID时先清除旧的表项
+        for key, entry in enumerate(table):
+            if entry is not None and entry[0] == protocol_id:
+                table[key] = None
+        for key in keys:
+            table[key] = (protocol_id, protocol)
+
+    def route(self, packet: Union[bytes, bytearray]) -> Optional[Tuple[int, Protocol]]:
+        """
+        按首字节查分发表识别数据包所属协议
+
+        参数:
+            packet: 接收到的数据包（前缀分发模式下包含协议ID前缀）
+
+        返回:
+            Optional[Tuple[int, Protocol]]: (协议ID, 协议对象)，无法识别时返回None
+        """
+        entry = self._dispatch_table[packet[0]] if packet else None
+        if entry is None:
+            self.unroutable += 1
+        return entry
     
     def get_protocol(self, protocol_id: Optional[int] = None) -> Optional[Protocol]:
         """
@@ -184,6 +1195,66 @@ class ProtocolHandler:
         
         return protocol
     
+    def start_capture(self, writer: CaptureWriter) -> None:
+        """
+        为所有已注册协议开始抓包，记录的通道号为协议ID
+
+        参数:
+            writer: 抓包写入器
+        """
+        for protocol_id, protocol in self.protocols.items():
+            protocol.start_capture(writer, protocol_id & 0xFF)
+
+    def stop_capture(self) -> None:
+        """停止所有协议的抓包"""
+        for protocol in self.protocols.values():
+            protocol.stop_capture()
+
+    def enable_metrics(self) -> Dict[int, ProtocolMetrics]:
+        """
+        为所有已注册协议启用指标统计
+
+        返回:
+            Dict[int, ProtocolMetrics]: 协议ID -> 协议指标
+        """
+        return {protocol_id: protocol.enable_metrics() for protocol_id, protocol in self.protocols.items()}
+
+    def metrics_snapshot(self) -> Dict:
+        """
+        获取所有已启用指标的协议的快照
+
+        返回:
+            Dict: 无法路由的数据包数和按协议ID组织的协议指标快照
+        """
+        return {
+            "unroutable": self.unroutable,
+            "protocols": {
+                protocol_id: protocol.metrics.snapshot()
+                for protocol_id, protocol in self.protocols.items()
+                if protocol.metrics is not None
+            },
+            "lanes": self.lanes.snapshot() if self.lanes is not None else {},
+        }
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        """
+        将所有已启用指标的协议导出为Prometheus文本格式
+
+        参数:
+            prefix: 指标名前缀
+
+        返回:
+            str: Prometheus文本格式的指标
+        """
+        text = format_prometheus(
+            (protocol.metrics for protocol in self.protocols.values() if protocol.metrics is not None), prefix)
+        text += (f"# HELP {prefix}_unroutable_total 无法识别所属协议的数据包数\n"
+                 f"# TYPE {prefix}_unroutable_total counter\n"
+                 f"{prefix}_unroutable_total {self.unroutable}\n")
+        if self.lanes is not None:
+            text += self.lanes.to_prometheus(prefix)
+        return text
+    
     def encode_packet(self, command_id: int, data: bytes = b"", protocol_id: Optional[int] = None) -> Optional[bytes]:
         """
         编码数据包
@@ -194,12 +1265,73 @@ class ProtocolHandler:
             protocol_id: 协议ID，如果为None则使用默认协议
             
         返回:
-            Optional[bytes]: 编码后的数据包，如果协议未找到则返回None
+            Optional[bytes]: 编码后的数据包（前缀分发模式下带协议ID前缀），如果协议未找到则返回None
+        """
+        protocol = self.get_protocol(protocol_id)
+        if protocol:
+            packet = protocol.encode_packet(command_id, data)
+            if self.dispatch == DISPATCH_PREFIX:
+                if protocol_id is None:
+                    protocol_id = self.default_protocol
+                packet = _PREFIX_BYTES[protocol_id] + packet
+            return packet
+        return None
+    
+    def encode_many(self, frames: Iterable[Tuple[int, bytes]], out: Optional[bytearray] = None,
+                    protocol_id: Optional[int] = None) -> Optional[bytearray]:
+        """
+        批量编码数据包，各帧不带协议ID前缀
+
+        参数:
+            frames: (命令ID, 数据负载)序列
+            out: 输出缓冲区，可选
+            protocol_id: 协议ID，如果为None则使用默认协议
+
+        返回:
+            Optional[bytearray]: 拼接后的编码数据，如果协议未找到则返回None
         """
         protocol = self.get_protocol(protocol_id)
         if protocol:
-            return protocol.encode_packet(command_id, data)
+            return protocol.encode_many(frames, out)
         return None
+
+    def decode_many(self, buffer: Union[bytes, bytearray, memoryview], protocol_id: Optional[int] = None) -> List[Tuple[int, bytes]]:
+        """
+        批量解码同一协议、不带协议ID前缀的多个数据包
+
+        参数:
+            buffer: 包含多个完整数据包的缓冲区
+            protocol_id: 协议ID，如果为None则使用默认协议
+
+        返回:
+            List[Tuple[int, bytes]]: 校验通过的(命令ID, 数据负载)列表
+        """
+        protocol = self.get_protocol(protocol_id)
+        if protocol:
+            return protocol.decode_many(buffer)
+        return []
+
+    def demux_packet(self, packet: Union[bytes, bytearray]) -> Tuple[Optional[int], Optional[int], Optional[bytes]]:
+        """
+        按分发表识别协议并解码数据包
+
+        参数:
+            packet: 接收到的数据包（前缀分发模式下包含协议ID前缀）
+
+        返回:
+            Tuple[Optional[int], Optional[int], Optional[bytes]]: (协议ID, 命令ID, 数据负载)，
+            无法识别或解析失败则返回(None, None, None)
+        """
+        entry = self.route(packet)
+        if entry is None:
+            return None, None, None
+        protocol_id, protocol = entry
+        if self.dispatch == DISPATCH_PREFIX:
+            packet = packet[1:]
+        command_id, data = protocol.decode_packet(packet)
+        if command_id is None:
+            return None, None, None
+        return protocol_id, command_id, data
     
     def decode_packet(self, packet: bytes, protocol_id: Optional[int] = None) -> Tuple[Optional[int], Optional[bytes]]:
         """
@@ -207,11 +1339,13 @@ class ProtocolHandler:
         
         参数:
             packet: 接收到的数据包
-            protocol_id: 协议ID，如果为None则使用默认协议
+            protocol_id: 协议ID，如果为None则按分发表识别，未启用分发模式时使用默认协议
             
         返回:
             Tuple[Optional[int], Optional[bytes]]: (命令ID, 数据负载)，解析失败则返回(None, None)
         """
+        if protocol_id is None and self.dispatch is not None:
+            return self.demux_packet(packet)[1:]
         protocol = self.get_protocol(protocol_id)
         if protocol:
             return protocol.decode_packet(packet)
@@ -223,12 +1357,146 @@ class ProtocolHandler:
         
         参数:
             packet: 接收到的数据包
-            protocol_id: 协议ID，如果为None则使用默认协议
+            protocol_id: 协议ID，如果为None则按分发表识别，未启用分发模式时使用默认协议
             
         返回:
             Optional[bytes]: 响应数据包，如果不需要响应则返回None
         """
+        if protocol_id is None and self.dispatch is not None:
+            entry = self.route(packet)
+            if entry is None:
+                return None
+            if self.dispatch == DISPATCH_PREFIX:
+                response = entry[1].handle_packet(packet[1:])
+                return _PREFIX_BYTES[entry[0]] + response if response is not None else None
+            return entry[1].handle_packet(packet)
         protocol = self.get_protocol(protocol_id)
         if protocol:
             return protocol.handle_packet(packet)
         return None
+
+    async def handle_packet_async(self, packet: bytes, protocol_id: Optional[int] = None) -> Optional[bytes]:
+        """
+        在事件循环中异步处理接收到的数据包
+
+        参数:
+            packet: 接收到的数据包
+            protocol_id: 协议ID，如果为None则按分发表识别，未启用分发模式时使用默认协议
+
+        返回:
+            Optional[bytes]: 响应数据包，如果不需要响应则返回None
+        """
+        if protocol_id is None and self.dispatch is not None:
+            entry = self.route(packet)
+            if entry is None:
+                return None
+            if self.dispatch == DISPATCH_PREFIX:
+                response = await entry[1].handle_packet_async(packet[1:])
+                return _PREFIX_BYTES[entry[0]] + response if response is not None else None
+            return await entry[1].handle_packet_async(packet)
+        protocol = self.get_protocol(protocol_id)
+        if protocol:
+            return await protocol.handle_packet_async(packet)
+        return None
+
+    def enable_priority_lanes(self, weights: Optional[Dict[int, int]] = None, max_queue: int = DEFAULT_MAX_QUEUE,
+                              workers: int = 1) -> PriorityScheduler:
+        """
+        启用优先级通道
+
+        之后经 submit_packet 提交的数据包按命令优先级进入各自的队列，按权重调度处理，
+        控制类命令不再排在积压的批量数据命令之后。直接调用 handle_packet_async 不受影响。
+
+        参数:
+            weights: 优先级 -> 权重，默认为 control:8 / normal:4 / bulk:1
+            max_queue: 每个通道的最大排队数，超出时丢弃新数据包
+            workers: 并发处理数据包的工作协程数，为1时同一时刻只处理一个数据包
+
+        返回:
+            PriorityScheduler: 优先级调度器，可用于查看队列深度和等待时间
+
+        异常:
+            RuntimeError: 已启用优先级通道；更换设置前先 await disable_priority_lanes()，
+                          以停止原调度器的工作协程并取消其排队的数据包
+        """
+        if self.lanes is not None:
+            raise RuntimeError("优先级通道已启用，请先调用 disable_priority_lanes")
+        self.lanes = PriorityScheduler(self._process_lane_item, weights, max_queue, workers)
+        return self.lanes
+
+    async def disable_priority_lanes(self) -> None:
+        """停用优先级通道，仍在排队的数据包被取消"""
+        lanes, self.lanes = self.lanes, None
+        if lanes is not None:
+            await lanes.stop()
+
+    @staticmethod
+    async def _process_lane_item(item: Tuple[Protocol, bytes]) -> Optional[bytes]:
+        """优先级调度器的处理函数"""
+        protocol, packet = item
+        return await protocol.handle_packet_async(packet)
+
+    async def submit_packet(self, packet: bytes, protocol_id: Optional[int] = None) -> Optional[bytes]:
+        """
+        按命令优先级排队处理数据包，未启用优先级通道时等同于 handle_packet_async
+
+        优先级由帧中的命令ID字节查 Protocol.priorities 得到，入队前不做完整解码；
+        无效的数据包在出队处理时照常被丢弃并计入解码错误。
+
+        参数:
+            packet: 接收到的数据包
+            protocol_id: 协议ID，如果为None则按分发表识别，未启用分发模式时使用默认协议
+
+        返回:
+            Optional[bytes]: 响应数据包，如果不需要响应或队列已满被丢弃则返回None
+        """
+        lanes = self.lanes
+        if lanes is None:
+            return await self.handle_packet_async(packet, protocol_id)
+        prefix = None
+        if protocol_id is None and self.dispatch is not None:
+            entry = self.route(packet)
+            if entry is None:
+                return None
+            protocol = entry[1]
+            if self.dispatch == DISPATCH_PREFIX:
+                prefix = _PREFIX_BYTES[entry[0]]
+                packet = packet[1:]
+        else:
+            protocol = self.get_protocol(protocol_id)
+            if protocol is None:
+                return None
+        priority = protocol.priorities.get(packet[1], PRIORITY_NORMAL) if len(packet) > 1 else PRIORITY_NORMAL
+        response = await lanes.submit((protocol, packet), priority)
+        if prefix is not None and response is not None:
+            return prefix + response
+        return response
+
+    def create_stream_decoder(self, max_data_length: int = STREAM_MAX_DATA_LENGTH) -> StreamDecoder:
+        """
+        创建可同时解码所有已注册协议的流式解码器
+
+        包头分发模式下返回的解码器按包头区分协议，feed 返回 (协议ID, 命令ID, 数据负载)；
+        未启用分发模式时返回默认协议的解码器。
+
+        参数:
+            max_data_length: 允许的最大数据长度，超过则视为损坏帧
+
+        返回:
+            StreamDecoder: 流式解码器
+
+        异常:
+            ValueError: 前缀分发模式不支持字节流解码，每次写入须为一个完整数据包
+        """
+        if self.dispatch is None:
+            protocol = self.get_protocol()
+            if protocol is None:
+                raise ValueError("未设置默认协议")
+            return protocol.create_stream_decoder(max_data_length)
+        if self.dispatch == DISPATCH_PREFIX:
+            raise ValueError("前缀分发模式不支持字节流解码")
+
+        decoder = StreamDecoder(max_data_length, header=None)
+        for protocol_id, protocol in self.protocols.items():
+            decoder.add_format(protocol.header, protocol.checksum, protocol._decompress, tag=protocol_id)
+        return decoder
@@ -0,0 +1,96 @@
+"""
+限流模块 - 令牌桶
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    令牌桶限流器
+
+    令牌按固定速率补充，最多积累 burst 个；每次操作消耗令牌，令牌不足时拒绝。
+    补充在 consume 时按经过的时间一次性计算，不需要定时任务。
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "_clock", "_updated", "allowed", "throttled")
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化令牌桶
+
+        参数:
+            rate: 每秒补充的令牌数
+            burst: 令牌上限（允许的突发量），None表示等于 rate（至少为1）
+            clock: 单调时钟函数
+        """
+        if rate <= 0:
+            raise ValueError(f"无效的速率: {rate}")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst  # 初始为满
+        self._clock = clock
+        self._updated = clock()
+        self.allowed = 0  # 放行次数
+        self.throttled = 0  # 被限流次数
+
+    def _refill(self) -> None:
+        """按经过的时间补充令牌"""
+        now = self._clock()
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self._updated = now
+
+    def consume(self, amount: float = 1) -> bool:
+        """
+        尝试消耗令牌
+
+        参数:
+            amount: 消耗的令牌数
+
+        返回:
+            bool: 令牌足够时消耗并返回True，否则返回False
+        """
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            self.allowed += 1
+            return True
+        self.throttled += 1
+        return False
+
+    def delay(self, amount: float = 1) -> float:
+        """
+        距离令牌足够还需等待的时间
+
+        参数:
+            amount: 需要的令牌数
+
+        返回:
+            float: 秒数，令牌已足够时为0
+        """
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取限流统计
+
+        返回:
+            Dict: 统计信息
+        """
+        self._refill()
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": self.tokens,
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+        }
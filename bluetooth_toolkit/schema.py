@@ -0,0 +1,341 @@
+"""
+数据负载模式模块 - 按声明的字段布局编解码命令数据负载
+
+模式在创建时编译为缓存的 struct.Struct：相邻的定长字段（标量、定长数组、定长字节串）
+合并为一次 unpack_from，变长字段（带长度前缀的数组、字符串、字节串）按前缀长度读取，
+解码直接在原缓冲区上进行，结果为紧凑的 namedtuple 记录。
+"""
+
+import logging
+import struct
+from collections import OrderedDict, namedtuple
+from functools import partial
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# 字段类型名 -> struct格式字符
+FIELD_TYPES: Dict[str, str] = {
+    "u8": "B", "i8": "b",
+    "u16": "H", "i16": "h",
+    "u32": "I", "i32": "i",
+    "u64": "Q", "i64": "q",
+    "f32": "f", "f64": "d",
+    "bool": "?",
+}
+
+
+def _type_code(type_name: str) -> str:
+    """获取字段类型的struct格式字符"""
+    try:
+        return FIELD_TYPES[type_name]
+    except KeyError:
+        raise ValueError(f"未知的字段类型: {type_name}，可选: {', '.join(FIELD_TYPES)}") from None
+
+
+class Array:
+    """数组字段：定长（指定count）或带元素个数前缀的变长数组，解码为元组"""
+
+    def __init__(self, item_type: str, count: Optional[int] = None, prefix: str = "u16"):
+        """
+        初始化数组字段
+
+        参数:
+            item_type: 元素类型，如 "u16"、"f32"
+            count: 元素个数，None表示变长数组，元素个数由前缀给出
+            prefix: 变长数组的元素个数前缀类型
+        """
+        self.code = _type_code(item_type)
+        self.count = count
+        self.prefix = _type_code(prefix)
+
+
+class String:
+    """带字节长度前缀的字符串字段"""
+
+    def __init__(self, prefix: str = "u8", encoding: str = "utf-8"):
+        """
+        初始化字符串字段
+
+        参数:
+            prefix: 字节长度前缀类型
+            encoding: 字符编码
+        """
+        self.prefix = _type_code(prefix)
+        self.encoding = encoding
+
+
+class Bytes:
+    """字节串字段：定长（指定length）或带长度前缀的变长字节串"""
+
+    def __init__(self, length: Optional[int] = None, prefix: str = "u8"):
+        """
+        初始化字节串字段
+
+        参数:
+            length: 字节数，None表示变长，长度由前缀给出
+            prefix: 变长字节串的长度前缀类型
+        """
+        self.length = length
+        self.prefix = _type_code(prefix)
+
+
+FieldType = Union[str, Array, String, Bytes]
+
+MAX_ARRAY_STRUCTS = 64  # 每个模式缓存的变长数组Struct数，个数来自对端的长度前缀，必须有上限
+
+# 编译后的解码步骤类型
+_STEP_FIXED = 0  # 一组定长字段，一次 unpack_from
+_STEP_ARRAY = 1  # 变长数组
+_STEP_STRING = 2  # 变长字符串
+_STEP_BYTES = 3  # 变长字节串
+
+
+class Schema:
+    """
+    数据负载模式
+
+    字段按声明顺序排列，多字节数值默认使用大端序（与数据包头部一致）。
+    """
+
+    def __init__(self, name: str, fields: Sequence[Tuple[str, FieldType]], byte_order: str = "!",
+                 record_type: Optional[type] = None):
+        """
+        初始化并编译数据负载模式
+
+        参数:
+            name: 模式名称，同时作为记录类型名
+            fields: (字段名, 字段类型) 列表，字段类型为类型名字符串或 Array/String/Bytes
+            byte_order: struct字节序前缀，默认为网络字节序"!"
+            record_type: 解码结果的记录类型，默认按字段名生成 namedtuple；
+                         处理函数在进程池中执行时须传入模块级定义的 namedtuple 以便pickle
+        """
+        if not fields:
+            raise ValueError("模式至少需要一个字段")
+        self.name = name
+        self.fields = list(fields)
+        self.field_names = tuple(field_name for field_name, _ in self.fields)
+        self.byte_order = byte_order
+        self.record_type = record_type or namedtuple(name, self.field_names)
+        if issubclass(self.record_type, tuple):
+            # namedtuple 直接由 tuple.__new__ 构造，省去 _make 的长度检查（长度由模式保证）
+            self._make = partial(tuple.__new__, self.record_type)
+        else:
+            # 其他记录类型（如带 __slots__ 的类）按字段顺序传入构造函数
+            self._make = lambda values, record_type=self.record_type: record_type(*values)
+        # 变长数组按(元素格式, 个数)缓存，超过 MAX_ARRAY_STRUCTS 时淘汰最久未用的
+        self._structs: "OrderedDict[Tuple[str, int], struct.Struct]" = OrderedDict()
+        self._steps = self._compile()
+
+        # 全部为定长标量字段时解码只需一次 unpack_from
+        fixed = len(self._steps) == 1 and self._steps[0][0] == _STEP_FIXED
+        self._simple = fixed and self._steps[0][2] is None
+        self.size = self._steps[0][1].size if fixed else None  # 定长模式的字节数，变长为None
+        self.min_size = sum(step[1].size for step in self._steps)  # 变长字段均为空时的字节数
+        self._unpack_from = self._steps[0][1].unpack_from
+
+    def _compile(self) -> List[tuple]:
+        """将字段列表编译为解码步骤"""
+        steps = []
+        fmt = []  # 当前定长字段组的格式
+        plan = []  # 当前定长字段组中各字段占用的值个数，标量为0，数组为元素个数
+        grouped = False  # 当前组是否含数组（需要重组为元组）
+
+        def flush():
+            nonlocal fmt, plan, grouped
+            if fmt:
+                steps.append((_STEP_FIXED, struct.Struct(self.byte_order + "".join(fmt)),
+                              tuple(plan) if grouped else None, len(plan)))
+            fmt, plan, grouped = [], [], False
+
+        for field_name, field in self.fields:
+            if isinstance(field, str):
+                fmt.append(_type_code(field))
+                plan.append(0)
+            elif isinstance(field, Array) and field.count is not None:
+                fmt.append(f"{field.count}{field.code}")
+                plan.append(field.count)
+                grouped = True
+            elif isinstance(field, Bytes) and field.length is not None:
+                fmt.append(f"{field.length}s")
+                plan.append(0)
+            else:
+                flush()
+                prefix = struct.Struct(self.byte_order + field.prefix)
+                if isinstance(field, Array):
+                    steps.append((_STEP_ARRAY, prefix, field.code))
+                elif isinstance(field, String):
+                    steps.append((_STEP_STRING, prefix, field.encoding))
+                elif isinstance(field, Bytes):
+                    steps.append((_STEP_BYTES, prefix, None))
+                else:
+                    raise ValueError(f"无效的字段类型: {field_name}")
+        flush()
+        return steps
+
+    def _array_struct(self, code: str, count: int) -> struct.Struct:
+        """获取缓存的变长数组Struct"""
+        key = (code, count)
+        structs = self._structs
+        st = structs.get(key)
+        if st is None:
+            st = structs[key] = struct.Struct(f"{self.byte_order}{count}{code}")
+            if len(structs) > MAX_ARRAY_STRUCTS:
+                structs.popitem(last=False)
+        else:
+            structs.move_to_end(key)
+        return st
+
+    def decode(self, data: BytesLike, offset: int = 0) -> Any:
+        """
+        解码数据负载为记录
+
+        参数:
+            data: 数据负载缓冲区
+            offset: 起始偏移
+
+        返回:
+            记录对象（默认为 namedtuple）
+
+        异常:
+            ValueError: 数据长度与模式不符
+        """
+        if self._simple:
+            if len(data) - offset != self.size:
+                raise ValueError(f"{self.name} 数据长度应为 {self.size}，实际为 {len(data) - offset}")
+            return self._make(self._unpack_from(data, offset))
+
+        record, offset = self.decode_from(data, offset)
+        if offset != len(data):
+            raise ValueError(f"{self.name} 数据末尾有 {len(data) - offset} 字节多余数据")
+        return record
+
+    def decode_from(self, data: BytesLike, offset: int = 0) -> Tuple[Any, int]:
+        """
+        从缓冲区指定偏移解码一条记录，允许其后还有其他数据
+
+        参数:
+            data: 缓冲区
+            offset: 起始偏移
+
+        返回:
+            Tuple[Any, int]: (记录对象, 记录结束后的偏移)
+
+        异常:
+            ValueError: 数据不足
+        """
+        values = []
+        view = None
+        length = len(data)
+        try:
+            for step in self._steps:
+                kind = step[0]
+                if kind == _STEP_FIXED:
+                    st, plan = step[1], step[2]
+                    unpacked = st.unpack_from(data, offset)
+                    offset += st.size
+                    if plan is None:
+                        values.extend(unpacked)
+                    else:
+                        i = 0
+                        for count in plan:
+                            if count:
+                                values.append(unpacked[i:i + count])
+                                i += count
+                            else:
+                                values.append(unpacked[i])
+                                i += 1
+                    continue
+
+                count = step[1].unpack_from(data, offset)[0]
+                offset += step[1].size
+                if kind == _STEP_ARRAY:
+                    st = self._array_struct(step[2], count)
+                    values.append(st.unpack_from(data, offset))
+                    offset += st.size
+                    continue
+
+                end = offset + count
+                if end > length:
+                    raise struct.error(f"需要 {end} 字节")
+                if view is None:
+                    view = memoryview(data)
+                if kind == _STEP_STRING:
+                    values.append(str(view[offset:end], step[2]))
+                else:
+                    values.append(view[offset:end].tobytes())
+                offset = end
+        except struct.error as e:
+            raise ValueError(f"{self.name} 数据长度不足: {e}") from None
+        except UnicodeDecodeError as e:
+            raise ValueError(f"{self.name} 字符串解码失败: {e}") from None
+        return self._make(values), offset
+
+    def encode(self, record: Union[Sequence, Mapping, None] = None, **kwargs) -> bytes:
+        """
+        将记录编码为数据负载
+
+        参数:
+            record: 按字段顺序排列的序列（如解码得到的记录）、以字段名为键的映射或按属性访问的记录对象
+            **kwargs: 未传入record时按字段名指定各字段值
+
+        返回:
+            bytes: 编码后的数据负载
+
+        异常:
+            ValueError: 字段缺失或值超出类型范围
+        """
+        if record is None:
+            record = kwargs
+        try:
+            if isinstance(record, Mapping):
+                record = [record[field_name] for field_name in self.field_names]
+            elif not isinstance(record, (tuple, list)):
+                # 带 __slots__ 等按属性访问的记录对象
+                record = [getattr(record, field_name) for field_name in self.field_names]
+            if len(record) != len(self.field_names):
+                raise ValueError(f"{self.name} 需要 {len(self.field_names)} 个字段，实际为 {len(record)}")
+            if self._simple:
+                return self._steps[0][1].pack(*record)
+
+            parts = []
+            index = 0
+            for step in self._steps:
+                kind = step[0]
+                if kind == _STEP_FIXED:
+                    count = step[3]
+                    if step[2] is None:
+                        parts.append(step[1].pack(*record[index:index + count]))
+                    else:
+                        flat = []
+                        for size, value in zip(step[2], record[index:index + count]):
+                            if size:
+                                if len(value) != size:
+                                    raise ValueError(f"{self.name} 定长数组应有 {size} 个元素")
+                                flat.extend(value)
+                            else:
+                                flat.append(value)
+                        parts.append(step[1].pack(*flat))
+                    index += count
+                    continue
+
+                value = record[index]
+                index += 1
+                if kind == _STEP_ARRAY:
+                    parts.append(step[1].pack(len(value)))
+                    parts.append(self._array_struct(step[2], len(value)).pack(*value))
+                else:
+                    if kind == _STEP_STRING:
+                        value = value.encode(step[2])
+                    parts.append(step[1].pack(len(value)))
+                    parts.append(bytes(value))
+        except (KeyError, AttributeError) as e:
+            raise ValueError(f"{self.name} 缺少字段: {e}") from None
+        except struct.error as e:
+            raise ValueError(f"{self.name} 编码失败: {e}") from None
+        return b"".join(parts)
+
+    def __repr__(self) -> str:
+        return f"<Schema {self.name} {', '.join(self.field_names)}>"
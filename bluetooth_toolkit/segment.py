@@ -0,0 +1,227 @@
+"""
+分段模块 - 按ATT MTU切分和重组超过单次写入长度的数据包
+"""
+
+import logging
+from typing import Dict, Hashable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ATT_HEADER_SIZE = 3  # ATT写入/通知的操作码(1) + 句柄(2)
+DEFAULT_MTU = 23  # BLE默认ATT MTU
+SEGMENT_HEADER_SIZE = 1  # 分段头: [首段(1位)] [末段(1位)] [序号(6位)]
+
+SEGMENT_FIRST = 0x80  # 消息首段标志
+SEGMENT_LAST = 0x40  # 消息末段标志
+SEGMENT_SEQ_MASK = 0x3F  # 分段序号掩码，按分段循环递增
+
+MAX_MESSAGE_SIZE = 0xFFFF + 8  # 最大数据包: 16位数据长度 + 包头和最长校验和
+
+_HEADER_BYTES = [bytes((i,)) for i in range(256)]  # 预生成的单字节分段头
+
+
+class Segmenter:
+    """
+    分段器，将编码后的数据包切分为不超过MTU的分段
+
+    每个分段前加1字节分段头，标记首段、末段和循环序号，
+    接收端据此重组并检测丢失或乱序的分段。
+    """
+
+    def __init__(self, mtu: int = DEFAULT_MTU):
+        """
+        初始化分段器
+
+        参数:
+            mtu: 协商后的ATT MTU，默认为23
+        """
+        self.mtu = mtu
+        self._seq = 0
+
+    @property
+    def mtu(self) -> int:
+        """协商后的ATT MTU"""
+        return self._mtu
+
+    @mtu.setter
+    def mtu(self, mtu: int) -> None:
+        if mtu - ATT_HEADER_SIZE <= SEGMENT_HEADER_SIZE:
+            raise ValueError(f"MTU过小: {mtu}")
+        self._mtu = mtu
+        self.chunk_size = mtu - ATT_HEADER_SIZE - SEGMENT_HEADER_SIZE  # 每个分段的有效负载
+
+    def segment(self, message: Union[bytes, bytearray, memoryview]) -> List[bytes]:
+        """
+        将一条消息切分为分段
+
+        参数:
+            message: 待发送的消息，通常为编码后的数据包
+
+        返回:
+            List[bytes]: 按发送顺序排列的分段，每段长度不超过 MTU - 3
+        """
+        view = memoryview(message)
+        length = len(view)
+        chunk_size = self.chunk_size
+        seq = self._seq
+        segments = []
+        append = segments.append
+
+        offset = 0
+        flags = SEGMENT_FIRST
+        while True:
+            end = offset + chunk_size
+            if end >= length:
+                append(_HEADER_BYTES[flags | SEGMENT_LAST | seq] + view[offset:length])
+                seq = (seq + 1) & SEGMENT_SEQ_MASK
+                break
+            append(_HEADER_BYTES[flags | seq] + view[offset:end])
+            seq = (seq + 1) & SEGMENT_SEQ_MASK
+            offset = end
+            flags = 0
+
+        self._seq = seq
+        return segments
+
+    def segment_count(self, length: int) -> int:
+        """
+        计算指定长度的消息需要的分段数
+
+        参数:
+            length: 消息长度
+
+        返回:
+            int: 分段数
+        """
+        return max(1, -(-length // self.chunk_size))
+
+
+class _PeerState:
+    """单个对端的重组状态"""
+
+    __slots__ = ("buffer", "expected_seq", "in_progress")
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = None  # 期望的下一个分段序号，None表示尚未收到分段
+        self.in_progress = False  # 是否正在重组一条消息
+
+
+class Reassembler:
+    """
+    重组器，将分段还原为完整消息
+
+    按对端分别维护重组缓冲区，单个对端缓冲的数据不超过 max_message_size，
+    超出、丢段或乱序时丢弃当前未完成的消息并从下一个首段重新开始。
+    """
+
+    def __init__(self, max_message_size: int = MAX_MESSAGE_SIZE, max_peers: int = 16):
+        """
+        初始化重组器
+
+        参数:
+            max_message_size: 每个对端允许重组的最大消息长度
+            max_peers: 同时维护重组状态的最大对端数，超出时淘汰最早的对端
+        """
+        self.max_message_size = max_message_size
+        self.max_peers = max_peers
+        self._peers: Dict[Hashable, _PeerState] = {}
+        self.messages = 0  # 重组完成的消息数
+        self.dropped = 0  # 被丢弃的未完成消息数
+        self.sequence_errors = 0  # 序号不连续次数
+        self.overflows = 0  # 超过最大消息长度次数
+
+    def feed(self, segment: Union[bytes, bytearray, memoryview], peer: Hashable = None) -> Optional[bytes]:
+        """
+        输入一个分段
+
+        参数:
+            segment: 接收到的分段
+            peer: 对端标识，例如客户端地址
+
+        返回:
+            Optional[bytes]: 分段完成一条消息时返回该消息，否则返回None
+        """
+        if not segment:
+            return None
+
+        state = self._peers.get(peer)
+        if state is None:
+            state = self._add_peer(peer)
+
+        header = segment[0]
+        seq = header & SEGMENT_SEQ_MASK
+        expected_seq = state.expected_seq
+        state.expected_seq = (seq + 1) & SEGMENT_SEQ_MASK
+
+        if header & SEGMENT_FIRST:
+            if state.in_progress:
+                self._drop(state)
+            if header & SEGMENT_LAST:
+                # 单段消息直接返回，不经过缓冲区
+                self.messages += 1
+                return bytes(segment[1:])
+            state.in_progress = True
+        elif not state.in_progress:
+            # 未收到首段的续段（所属消息已被丢弃），无法重组
+            return None
+        elif seq != expected_seq:
+            self.sequence_errors += 1
+            logger.warning(f"分段序号不连续: 对端 {peer}，预期 {expected_seq}，实际 {seq}")
+            self._drop(state)
+            return None
+
+        buffer = state.buffer
+        if len(buffer) + len(segment) - SEGMENT_HEADER_SIZE > self.max_message_size:
+            self.overflows += 1
+            logger.warning(f"重组消息超过最大长度 {self.max_message_size}: 对端 {peer}")
+            self._drop(state)
+            return None
+        buffer += memoryview(segment)[SEGMENT_HEADER_SIZE:]
+
+        if header & SEGMENT_LAST:
+            message = bytes(buffer)
+            buffer.clear()
+            state.in_progress = False
+            self.messages += 1
+            return message
+        return None
+
+    def pending(self, peer: Hashable = None) -> int:
+        """
+        获取对端尚未完成重组的字节数
+
+        参数:
+            peer: 对端标识
+
+        返回:
+            int: 缓冲的字节数
+        """
+        state = self._peers.get(peer)
+        return len(state.buffer) if state else 0
+
+    def remove_peer(self, peer: Hashable) -> None:
+        """
+        移除对端的重组状态，通常在对端断开连接时调用
+
+        参数:
+            peer: 对端标识
+        """
+        state = self._peers.pop(peer, None)
+        if state is not None and state.in_progress:
+            self.dropped += 1
+
+    def _add_peer(self, peer: Hashable) -> _PeerState:
+        """创建对端状态，超过上限时淘汰最早加入的对端"""
+        if len(self._peers) >= self.max_peers:
+            oldest = next(iter(self._peers))
+            logger.warning(f"重组对端数超过上限 {self.max_peers}，淘汰对端: {oldest}")
+            self.remove_peer(oldest)
+        state = self._peers[peer] = _PeerState()
+        return state
+
+    def _drop(self, state: _PeerState) -> None:
+        """丢弃对端未完成的消息"""
+        state.buffer.clear()
+        state.in_progress = False
+        self.dropped += 1
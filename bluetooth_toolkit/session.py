@@ -0,0 +1,273 @@
+"""
+会话模块 - 基于序号的流水线请求/响应
+
+请求和响应的数据负载前加2字节序号: [序号(2字节，大端)] [数据]，
+响应回显请求的序号，客户端据此将乱序到达的响应匹配到各自的请求，
+同一命令可以同时有多个请求在途。
+"""
+
+import asyncio
+import inspect
+import logging
+import struct
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from .protocol import MAX_DATA_LENGTH, Protocol
+
+logger = logging.getLogger(__name__)
+
+SEQ_SIZE = 2  # 序号字节数
+SEQ_MODULO = 1 << 16  # 序号循环范围
+DEFAULT_WINDOW = 32  # 默认最大在途请求数
+DEFAULT_TIMEOUT = 5.0  # 默认请求超时（秒）
+
+_SEQ_STRUCT = struct.Struct("!H")
+
+
+class SessionClosedError(Exception):
+    """会话已关闭，在途请求被取消"""
+
+
+class Session:
+    """
+    请求端会话
+
+    为每个请求分配序号并返回等待响应的协程，多个请求可同时在途，
+    在途请求数达到窗口上限时新请求排队等待。接收到的数据通过
+    feed/feed_packet/feed_frame 输入，按序号唤醒对应请求。
+    """
+
+    def __init__(self, protocol: Protocol, send: Callable[[bytes], Any],
+                 window: int = DEFAULT_WINDOW, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        """
+        初始化会话
+
+        参数:
+            protocol: 编解码使用的协议对象
+            send: 发送编码后数据包的函数，可以是普通函数或返回可等待对象的函数
+            window: 最大在途请求数，不超过序号空间
+            timeout: 默认请求超时（秒），None表示不超时
+        """
+        if not 0 < window < SEQ_MODULO:
+            raise ValueError(f"无效的窗口大小: {window}")
+        self.protocol = protocol
+        self.send = send
+        self.window = window
+        self.timeout = timeout
+        self._next_seq = 0
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}  # 序号 -> (命令ID, 等待响应的Future)
+        self._window_semaphore: Optional[asyncio.Semaphore] = None  # 首次请求时在事件循环中创建
+        self._decoder = protocol.create_stream_decoder(MAX_DATA_LENGTH)  # 响应长度不定，损坏帧靠向后查找重新同步
+        self.closed = False
+
+        # 统计计数
+        self.requests = 0  # 发出的请求数
+        self.responses = 0  # 匹配到请求的响应数
+        self.timeouts = 0  # 超时的请求数
+        self.late_responses = 0  # 无匹配在途请求的响应数（超时后到达或重复）
+        self.mismatched = 0  # 序号匹配但命令ID不一致的响应数
+
+    @property
+    def in_flight(self) -> int:
+        """当前在途请求数"""
+        return len(self._pending)
+
+    async def request(self, command_id: int, data: bytes = b"", timeout: Optional[float] = None) -> bytes:
+        """
+        发送请求并等待响应
+
+        参数:
+            command_id: 命令ID
+            data: 数据负载
+            timeout: 本次请求的超时（秒），None表示使用会话默认值
+
+        返回:
+            bytes: 响应数据负载（不含序号）
+
+        异常:
+            asyncio.TimeoutError: 超时未收到响应
+            SessionClosedError: 会话已关闭
+        """
+        if self.closed:
+            raise SessionClosedError("会话已关闭")
+        if self._window_semaphore is None:
+            self._window_semaphore = asyncio.Semaphore(self.window)
+        if timeout is None:
+            timeout = self.timeout
+
+        async with self._window_semaphore:
+            if self.closed:
+                raise SessionClosedError("会话已关闭")
+            seq = self._allocate_seq()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[seq] = (command_id, future)
+            try:
+                result = self.send(self.protocol.encode_packet(command_id, _SEQ_STRUCT.pack(seq) + data))
+                if inspect.isawaitable(result):
+                    await result
+                self.requests += 1
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"请求超时: 命令 {command_id}，序号 {seq}")
+                raise
+            finally:
+                self._pending.pop(seq, None)
+
+    def _allocate_seq(self) -> int:
+        """分配下一个未被在途请求占用的序号"""
+        seq = self._next_seq
+        while seq in self._pending:
+            seq = (seq + 1) % SEQ_MODULO
+        self._next_seq = (seq + 1) % SEQ_MODULO
+        return seq
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """
+        输入接收到的原始字节流，可为任意分片
+
+        参数:
+            data: 新接收的数据
+
+        返回:
+            int: 本次匹配到请求的响应数
+        """
+        matched = 0
+        for command_id, payload in self._decoder.feed(data):
+            if self.feed_frame(command_id, payload):
+                matched += 1
+        return matched
+
+    def feed_packet(self, packet: bytes) -> bool:
+        """
+        输入一个完整的响应数据包
+
+        参数:
+            packet: 接收到的数据包
+
+        返回:
+            bool: 是否匹配到在途请求
+        """
+        command_id, payload = self.protocol.decode_packet(packet)
+        if command_id is None:
+            return False
+        return self.feed_frame(command_id, payload)
+
+    def feed_frame(self, command_id: int, payload: bytes) -> bool:
+        """
+        输入一个已解码的响应帧
+
+        参数:
+            command_id: 命令ID
+            payload: 数据负载（含序号）
+
+        返回:
+            bool: 是否匹配到在途请求
+        """
+        if len(payload) < SEQ_SIZE:
+            logger.warning(f"响应缺少序号: 命令 {command_id}")
+            return False
+        seq = _SEQ_STRUCT.unpack_from(payload)[0]
+        entry = self._pending.get(seq)
+        if entry is None or entry[1].done():
+            self.late_responses += 1
+            return False
+        if entry[0] != command_id:
+            self.mismatched += 1
+            logger.warning(f"响应命令不匹配: 序号 {seq}，预期 {entry[0]}，实际 {command_id}")
+            return False
+        entry[1].set_result(payload[SEQ_SIZE:])
+        self.responses += 1
+        return True
+
+    def close(self) -> None:
+        """关闭会话，取消所有在途请求"""
+        self.closed = True
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(SessionClosedError("会话已关闭"))
+        self._pending.clear()
+        self._decoder.reset()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取会话统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "in_flight": self.in_flight,
+            "timeouts": self.timeouts,
+            "late_responses": self.late_responses,
+            "mismatched": self.mismatched,
+        }
+
+
+class SessionResponder:
+    """
+    响应端会话
+
+    剥离请求中的序号后调用协议的命令处理函数，并将序号回显到响应中。
+    每个请求可在独立任务中处理，处理较快的请求可先于之前的请求响应。
+    """
+
+    def __init__(self, protocol: Protocol):
+        """
+        初始化响应端
+
+        参数:
+            protocol: 注册了命令处理函数的协议对象
+        """
+        self.protocol = protocol
+
+    def _split(self, packet: bytes) -> Tuple[Optional[int], Optional[bytes], bytes]:
+        """解码请求并拆分出(命令ID, 序号字节, 数据)"""
+        command_id, payload = self.protocol.decode_packet(packet)
+        if command_id is None:
+            return None, None, b""
+        if len(payload) < SEQ_SIZE:
+            logger.warning(f"请求缺少序号: 命令 {command_id}")
+            return None, None, b""
+        return command_id, payload[:SEQ_SIZE], payload[SEQ_SIZE:]
+
+    def _encode_response(self, command_id: int, seq: bytes, response_data: Optional[bytes]) -> Optional[bytes]:
+        """编码带序号的响应"""
+        if response_data is None:
+            return None
+        if len(response_data) + SEQ_SIZE > MAX_DATA_LENGTH:
+            logger.error(f"响应数据过长: 命令 {command_id}")
+            return None
+        return self.protocol.encode_packet(command_id, seq + response_data)
+
+    def handle_packet(self, packet: bytes) -> Optional[bytes]:
+        """
+        处理带序号的请求数据包
+
+        参数:
+            packet: 接收到的请求数据包
+
+        返回:
+            Optional[bytes]: 带相同序号的响应数据包，如果不需要响应则返回None
+        """
+        command_id, seq, data = self._split(packet)
+        if command_id is None:
+            return None
+        return self._encode_response(command_id, seq, self.protocol.invoke(command_id, data))
+
+    async def handle_packet_async(self, packet: bytes) -> Optional[bytes]:
+        """
+        在事件循环中异步处理带序号的请求数据包
+
+        参数:
+            packet: 接收到的请求数据包
+
+        返回:
+            Optional[bytes]: 带相同序号的响应数据包，如果不需要响应则返回None
+        """
+        command_id, seq, data = self._split(packet)
+        if command_id is None:
+            return None
+        return self._encode_response(command_id, seq, await self.protocol.invoke_async(command_id, data))
@@ -0,0 +1,694 @@
+"""
+批量传输模块 - 文件/固件在一条链路上的高吞吐传输，带信用流控、内存映射落盘、断点续传和完整性校验
+
+传输层使用协议的保留命令ID，数据负载格式为:
+    开始:     [传输号(1字节)] [文件长度(4字节)] [CRC32(4字节)] [数据块大小(2字节)] [文件名(UTF-8)]
+    接受:     [传输号(1字节)] [状态(1字节)] [续传偏移(4字节)] [初始信用(2字节)]
+    数据:     [传输号(1字节)] [偏移(4字节)] [数据块]
+    信用:     [传输号(1字节)] [新增信用(2字节)] [已连续接收(4字节)]
+    提交:     [传输号(1字节)]
+    结果:     [传输号(1字节)] [状态(1字节)] [已连续接收(4字节)] [接收端CRC32(4字节)]
+    中止:     [传输号(1字节)] [状态(1字节)]
+多字节字段均为大端序。数据块不逐块确认（适合 write-without-response）：每个数据块消耗一个信用，
+接收端把数据块直接写入内存映射的输出文件的对应偏移，累计写入半个窗口后归还信用并附带已连续接收的
+字节数。提交时接收端计算整个文件的CRC32与开始时声明的值比较，一致才把临时文件改名为目标文件。
+数据块丢失（如写入被拒绝）时信用不会归还，发送端等待信用超时后提前提交，接收端回复未收全和已连续
+接收的字节数并恢复整个窗口，发送端从该偏移重发。
+
+接收端定期把已连续接收的字节数记录在状态文件中；同名、同长度、同CRC32的传输再次开始时从该偏移续传。
+"""
+
+import asyncio
+import inspect
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Callable, Dict, Optional, Union
+
+from .protocol import MAX_DATA_LENGTH, Protocol
+
+logger = logging.getLogger(__name__)
+
+# 传输层保留的命令ID
+CMD_TRANSFER_INIT = 0xE0
+CMD_TRANSFER_ACCEPT = 0xE1
+CMD_TRANSFER_DATA = 0xE2
+CMD_TRANSFER_CREDIT = 0xE3
+CMD_TRANSFER_COMMIT = 0xE4
+CMD_TRANSFER_RESULT = 0xE5
+CMD_TRANSFER_ABORT = 0xE6
+TRANSFER_COMMANDS = frozenset(range(CMD_TRANSFER_INIT, CMD_TRANSFER_ABORT + 1))
+
+# 接受/结果/中止中的状态
+STATUS_OK = 0
+STATUS_REJECTED = 1  # 文件名无效、过大或同时进行的传输过多
+STATUS_INCOMPLETE = 2  # 提交时数据未收全，发送端应从已连续接收的偏移重发
+STATUS_CHECKSUM = 3  # CRC32 不一致
+STATUS_ERROR = 4  # 写文件出错
+STATUS_ABORTED = 5  # 被对端中止
+STATUS_NAMES = {
+    STATUS_OK: "ok",
+    STATUS_REJECTED: "rejected",
+    STATUS_INCOMPLETE: "incomplete",
+    STATUS_CHECKSUM: "checksum",
+    STATUS_ERROR: "error",
+    STATUS_ABORTED: "aborted",
+}
+
+DEFAULT_WINDOW = 32  # 默认接收窗口（数据块数）
+MAX_WINDOW = 0xFFFF  # 接受帧中的初始信用为16位
+DEFAULT_CHUNK_SIZE = 232  # 默认数据块长度：ATT MTU 247 减 3 字节头、帧头尾和数据头
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # 默认允许的最大文件长度
+DEFAULT_MAX_TRANSFERS = 4  # 默认每个接收端同时进行的传输数
+DEFAULT_CHECKPOINT = 256 * 1024  # 默认每接收多少字节记录一次续传偏移
+DEFAULT_TIMEOUT = 10.0  # 默认等待对端响应的超时（秒）
+DEFAULT_STALL_TIMEOUT = 1.0  # 默认等待信用的超时（秒），超时后提交以查询接收进度
+DEFAULT_RETRIES = 3  # 默认连续没有进展的重发次数
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".state"
+
+_INIT_STRUCT = struct.Struct("!BIIH")  # 传输号 + 文件长度 + CRC32 + 数据块大小
+_ACCEPT_STRUCT = struct.Struct("!BBIH")  # 传输号 + 状态 + 续传偏移 + 初始信用
+_DATA_STRUCT = struct.Struct("!BI")  # 传输号 + 偏移
+_CREDIT_STRUCT = struct.Struct("!BHI")  # 传输号 + 新增信用 + 已连续接收
+_RESULT_STRUCT = struct.Struct("!BBII")  # 传输号 + 状态 + 已连续接收 + 接收端CRC32
+_ABORT_STRUCT = struct.Struct("!BB")  # 传输号 + 状态
+_STATE_STRUCT = struct.Struct("!4sIII")  # 魔数 + 文件长度 + CRC32 + 已连续接收
+_STATE_MAGIC = b"BTXS"
+
+
+class TransferError(Exception):
+    """传输失败，status 为 STATUS_* 之一"""
+
+    def __init__(self, message: str, status: int = STATUS_ERROR):
+        super().__init__(message)
+        self.status = status
+
+
+class _Incoming:
+    """接收端的一个进行中的传输"""
+
+    def __init__(self, transfer_id: int, name: str, path: str, size: int, crc32: int):
+        self.id = transfer_id
+        self.name = name
+        self.path = path  # 目标文件路径
+        self.size = size
+        self.crc32 = crc32
+        self.received = 0  # 从文件开头起连续收到的字节数
+        self.ahead: Dict[int, int] = {}  # 超前到达的数据块：偏移 -> 结束偏移
+        self.granted = 0  # 已授予对端、尚未收到数据块的信用
+        self.consumed = 0  # 已写入但尚未归还信用的数据块数
+        self.checkpointed = 0  # 状态文件中记录的续传偏移
+        self.file = None
+        self.mm: Optional[mmap.mmap] = None
+        self.committing = False
+
+    def open(self) -> None:
+        """打开（必要时创建）临时文件并映射到内存"""
+        self.file = open(self.path + PART_SUFFIX, "a+b")
+        if os.fstat(self.file.fileno()).st_size != self.size:
+            self.file.truncate(self.size)
+        if self.size:
+            self.mm = mmap.mmap(self.file.fileno(), self.size)
+
+    def close(self) -> None:
+        """解除映射并关闭临时文件"""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def save_state(self, received: int) -> None:
+        """把数据刷到磁盘后记录续传偏移（在线程池中执行）"""
+        if self.mm is not None:
+            self.mm.flush()
+        state_path = self.path + PART_SUFFIX + STATE_SUFFIX
+        with open(state_path + ".tmp", "wb") as f:
+            f.write(_STATE_STRUCT.pack(_STATE_MAGIC, self.size, self.crc32, received))
+        os.replace(state_path + ".tmp", state_path)
+
+    def load_state(self) -> int:
+        """读取续传偏移，状态文件不存在或与本次传输不符时返回0"""
+        try:
+            with open(self.path + PART_SUFFIX + STATE_SUFFIX, "rb") as f:
+                magic, size, crc32, received = _STATE_STRUCT.unpack(f.read(_STATE_STRUCT.size))
+        except (OSError, struct.error):
+            return 0
+        if magic != _STATE_MAGIC or size != self.size or crc32 != self.crc32 or received > size:
+            return 0
+        return received
+
+    def remove_state(self) -> None:
+        """删除状态文件"""
+        try:
+            os.unlink(self.path + PART_SUFFIX + STATE_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+
+class TransferReceiver:
+    """
+    批量传输接收端
+
+    handle_frame 处理对端发来的传输层帧，响应和信用通过 send 发出。数据块在事件循环中
+    直接复制到内存映射的临时文件；刷盘、记录续传偏移和提交时的CRC32计算在线程池中执行。
+    """
+
+    def __init__(self, protocol: Protocol, send: Callable[[bytes], Any], directory: Union[str, os.PathLike],
+                 window: int = DEFAULT_WINDOW, max_size: int = DEFAULT_MAX_SIZE,
+                 max_transfers: int = DEFAULT_MAX_TRANSFERS, checkpoint: int = DEFAULT_CHECKPOINT):
+        """
+        初始化接收端
+
+        参数:
+            protocol: 用于编码响应帧的协议
+            send: 发送一个已编码数据包的函数，可以是普通函数或协程函数
+            directory: 接收文件的保存目录
+            window: 每个传输的接收窗口（数据块数），应小于服务器接收缓冲的消息数
+            max_size: 允许的最大文件长度（字节）
+            max_transfers: 同时进行的传输数
+            checkpoint: 每连续接收多少字节记录一次续传偏移
+
+        异常:
+            ValueError: 接收窗口不在 1 到 MAX_WINDOW 之间
+        """
+        if not 0 < window <= MAX_WINDOW:
+            raise ValueError(f"无效的接收窗口: {window}")
+        self.protocol = protocol
+        self.send = send
+        self.directory = os.fspath(directory)
+        self.window = window
+        self.credit_threshold = max(window // 2, 1)
+        self.max_size = max_size
+        self.max_transfers = max_transfers
+        self.checkpoint = checkpoint
+        self._transfers: Dict[int, _Incoming] = {}
+        self._pending_saves: Dict[int, asyncio.Future] = {}  # 传输号 -> 进行中的状态保存
+        self._pending_commits: Dict[int, asyncio.Future] = {}  # 传输号 -> 进行中的CRC32校验
+
+        # 统计计数
+        self.started = 0  # 开始的传输数
+        self.resumed = 0  # 从续传偏移开始的传输数
+        self.completed = 0  # 校验通过的传输数
+        self.failed = 0  # 校验失败、出错或被中止的传输数
+        self.bytes_received = 0  # 写入的数据字节数（含重发）
+        self.chunks_received = 0  # 收到的数据块数
+        self.duplicates = 0  # 重发的已收到数据块数
+        self.overflows = 0  # 超出信用的数据块数
+        self.unknown_transfer = 0  # 传输号未知的帧数
+
+    async def _send(self, command_id: int, payload: bytes) -> None:
+        """编码并发出一个传输层帧"""
+        result = self.send(self.protocol.encode_packet(command_id, payload))
+        if inspect.isawaitable(result):
+            await result
+
+    async def handle_frame(self, command_id: int, payload: bytes) -> bool:
+        """
+        处理一个已解码的帧
+
+        参数:
+            command_id: 命令ID
+            payload: 数据负载
+
+        返回:
+            bool: 是否为传输层帧，其他命令返回False由调用方继续处理
+        """
+        if command_id not in TRANSFER_COMMANDS:
+            return False
+        if not payload:
+            return True
+        if command_id == CMD_TRANSFER_DATA:
+            await self._on_data(payload)
+        elif command_id == CMD_TRANSFER_INIT:
+            await self._on_init(payload)
+        elif command_id == CMD_TRANSFER_COMMIT:
+            await self._on_commit(payload[0])
+        elif command_id == CMD_TRANSFER_ABORT:
+            transfer = self._transfers.get(payload[0])
+            if transfer is not None:
+                logger.info(f"对端中止传输: {transfer.name} ({transfer.id})")
+                await self._finish(transfer, STATUS_ABORTED)
+        else:
+            self.unknown_transfer += 1
+        return True
+
+    async def _on_init(self, payload: bytes) -> None:
+        """处理开始帧：打开临时文件，按状态文件确定续传偏移"""
+        if len(payload) < _INIT_STRUCT.size:
+            return
+        transfer_id, size, crc32, chunk_size = _INIT_STRUCT.unpack_from(payload)
+        name = bytes(payload[_INIT_STRUCT.size:]).decode("utf-8", errors="replace")
+        old = self._transfers.get(transfer_id)
+        if old is not None:
+            if old.name == name and old.size == size and old.crc32 == crc32:
+                if not old.committing:  # 发送端没有收到接受帧而重发
+                    old.granted = self.window
+                    await self._send(CMD_TRANSFER_ACCEPT,
+                                     _ACCEPT_STRUCT.pack(transfer_id, STATUS_OK, old.received, self.window))
+                return
+            await self._finish(old, STATUS_ABORTED)
+        if (not _valid_name(name) or size > self.max_size
+                or len(self._transfers) >= self.max_transfers):
+            logger.warning(f"拒绝传输: {name!r} ({size} 字节)")
+            await self._send(CMD_TRANSFER_ACCEPT, _ACCEPT_STRUCT.pack(transfer_id, STATUS_REJECTED, 0, 0))
+            return
+
+        transfer = _Incoming(transfer_id, name, os.path.join(self.directory, name), size, crc32)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            transfer.open()
+        except (OSError, ValueError) as e:
+            transfer.close()
+            logger.error(f"打开接收文件失败: {transfer.path}: {e}")
+            await self._send(CMD_TRANSFER_ACCEPT, _ACCEPT_STRUCT.pack(transfer_id, STATUS_ERROR, 0, 0))
+            return
+        transfer.received = transfer.checkpointed = transfer.load_state()
+        transfer.granted = self.window
+        self._transfers[transfer_id] = transfer
+        self.started += 1
+        if transfer.received:
+            self.resumed += 1
+            logger.info(f"续传: {name} 从 {transfer.received}/{size} 字节开始")
+        else:
+            logger.info(f"开始接收: {name} ({size} 字节, 数据块 {chunk_size} 字节)")
+        await self._send(CMD_TRANSFER_ACCEPT,
+                         _ACCEPT_STRUCT.pack(transfer_id, STATUS_OK, transfer.received, self.window))
+
+    async def _on_data(self, payload: bytes) -> None:
+        """处理数据帧：写入映射内存，推进连续接收偏移，累计半个窗口后归还信用"""
+        transfer = self._transfers.get(payload[0])
+        if transfer is None or transfer.committing or len(payload) < _DATA_STRUCT.size:
+            self.unknown_transfer += 1
+            return
+        if transfer.granted <= 0:
+            self.overflows += 1
+            return
+        transfer.granted -= 1
+        offset = _DATA_STRUCT.unpack_from(payload)[1]
+        length = len(payload) - _DATA_STRUCT.size
+        end = offset + length
+        if end > transfer.size:
+            self.overflows += 1
+            logger.warning(f"传输 {transfer.name} 的数据块超出文件长度: {offset}+{length}")
+        else:
+            if length:
+                transfer.mm[offset:end] = memoryview(payload)[_DATA_STRUCT.size:]
+            self.chunks_received += 1
+            self.bytes_received += length
+            if offset == transfer.received:
+                transfer.received = end
+                ahead = transfer.ahead
+                while transfer.received in ahead:
+                    transfer.received = ahead.pop(transfer.received)
+            elif offset > transfer.received:
+                transfer.ahead[offset] = max(end, transfer.ahead.get(offset, 0))
+            else:
+                self.duplicates += 1
+
+        transfer.consumed += 1
+        if transfer.consumed >= self.credit_threshold:
+            credits, transfer.consumed = transfer.consumed, 0
+            transfer.granted += credits
+            await self._send(CMD_TRANSFER_CREDIT, _CREDIT_STRUCT.pack(transfer.id, credits, transfer.received))
+        if transfer.received - transfer.checkpointed >= self.checkpoint:
+            self._save_state(transfer)
+
+    def _save_state(self, transfer: _Incoming) -> None:
+        """在线程池中记录续传偏移，同一传输同时只有一个保存在进行"""
+        pending = self._pending_saves.get(transfer.id)
+        if pending is not None and not pending.done():
+            return
+        received = transfer.received
+        transfer.checkpointed = received
+        loop = asyncio.get_running_loop()
+        self._pending_saves[transfer.id] = loop.run_in_executor(None, transfer.save_state, received)
+
+    async def _wait_save(self, transfer: _Incoming) -> None:
+        """等待进行中的状态保存完成"""
+        pending = self._pending_saves.pop(transfer.id, None)
+        if pending is not None:
+            try:
+                await pending
+            except OSError as e:
+                logger.warning(f"记录续传偏移失败: {transfer.path}: {e}")
+
+    async def _wait_commit(self, transfer: _Incoming) -> None:
+        """
+        等待进行中的CRC32校验完成
+
+        线程池中的校验无法取消，而校验期间映射内存被导出，关闭会抛出 BufferError，
+        因此结束或关闭传输前先等待校验结束；校验的结果由 _on_commit 处理。
+        """
+        pending = self._pending_commits.get(transfer.id)
+        if pending is not None:
+            await asyncio.wait([pending])
+
+    async def _on_commit(self, transfer_id: int) -> None:
+        """处理提交帧：数据收全后在线程池中校验CRC32，通过后改名为目标文件"""
+        transfer = self._transfers.get(transfer_id)
+        if transfer is None:
+            self.unknown_transfer += 1
+            await self._send(CMD_TRANSFER_RESULT, _RESULT_STRUCT.pack(transfer_id, STATUS_REJECTED, 0, 0))
+            return
+        if transfer.committing:  # 发送端没有及时收到结果而重发，校验完成后只回复一次
+            return
+        if transfer.received < transfer.size:
+            # 数据未收全：归还全部信用，发送端从连续接收偏移重发
+            transfer.ahead.clear()
+            transfer.consumed = 0
+            transfer.granted = self.window
+            await self._send(CMD_TRANSFER_RESULT,
+                             _RESULT_STRUCT.pack(transfer_id, STATUS_INCOMPLETE, transfer.received, 0))
+            return
+
+        transfer.committing = True
+        await self._wait_save(transfer)
+        loop = asyncio.get_running_loop()
+        pending = self._pending_commits[transfer_id] = loop.run_in_executor(None, _flush_and_crc32, transfer.mm)
+        try:
+            crc32 = await pending
+        except (OSError, ValueError) as e:
+            crc32 = None
+            error = e
+        finally:
+            if self._pending_commits.get(transfer_id) is pending:
+                del self._pending_commits[transfer_id]
+        if self._transfers.get(transfer_id) is not transfer:
+            return  # 校验期间传输被中止、替换或接收端已关闭，已由对应的路径结束
+        if crc32 is None:
+            logger.error(f"校验接收文件失败: {transfer.path}: {error}")
+            await self._finish(transfer, STATUS_ERROR)
+            return
+        if crc32 != transfer.crc32:
+            logger.warning(f"传输 {transfer.name} 的CRC32不一致: 0x{crc32:08X} != 0x{transfer.crc32:08X}")
+            await self._finish(transfer, STATUS_CHECKSUM, crc32)
+            return
+        transfer.close()
+        try:
+            os.replace(transfer.path + PART_SUFFIX, transfer.path)
+        except OSError as e:
+            logger.error(f"保存接收文件失败: {transfer.path}: {e}")
+            await self._finish(transfer, STATUS_ERROR, crc32)
+            return
+        transfer.remove_state()
+        logger.info(f"接收完成: {transfer.path} ({transfer.size} 字节)")
+        await self._finish(transfer, STATUS_OK, crc32)
+
+    async def _finish(self, transfer: _Incoming, status: int, crc32: int = 0) -> None:
+        """结束传输并通知对端；失败时保留临时文件，CRC32不一致时丢弃已接收的数据"""
+        self._transfers.pop(transfer.id, None)
+        await self._wait_commit(transfer)
+        await self._wait_save(transfer)
+        if status == STATUS_OK:
+            self.completed += 1
+        else:
+            self.failed += 1
+            if status == STATUS_CHECKSUM:
+                transfer.remove_state()
+            elif transfer.mm is not None:
+                try:
+                    transfer.save_state(transfer.received)
+                except OSError:
+                    pass
+        transfer.close()
+        if status != STATUS_ABORTED:
+            await self._send(CMD_TRANSFER_RESULT, _RESULT_STRUCT.pack(transfer.id, status, transfer.received, crc32))
+
+    async def close(self) -> None:
+        """
+        关闭所有进行中的传输，记录续传偏移以便之后继续
+
+        先等待进行中的CRC32校验和状态保存完成再解除映射；单个传输的清理失败只记录日志，不抛出异常。
+        """
+        transfers = list(self._transfers.values())
+        self._transfers.clear()
+        for transfer in transfers:
+            try:
+                await self._wait_commit(transfer)
+                await self._wait_save(transfer)
+                if transfer.mm is not None:
+                    transfer.save_state(transfer.received)
+            except Exception as e:
+                logger.warning(f"记录续传偏移失败: {transfer.path}: {e}")
+            try:
+                transfer.close()
+            except Exception as e:
+                logger.warning(f"关闭接收文件失败: {transfer.path}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取接收端统计
+
+        返回:
+            Dict: 统计信息和进行中的传输进度
+        """
+        return {
+            "started": self.started,
+            "resumed": self.resumed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "bytes_received": self.bytes_received,
+            "chunks_received": self.chunks_received,
+            "duplicates": self.duplicates,
+            "overflows": self.overflows,
+            "unknown_transfer": self.unknown_transfer,
+            "active": {
+                transfer.name: {"received": transfer.received, "size": transfer.size}
+                for transfer in self._transfers.values()
+            },
+        }
+
+
+def _valid_name(name: str) -> bool:
+    """文件名是否可以直接放在接收目录下：非空，不是 . 或 ..，不含路径分隔符和NUL"""
+    return bool(name) and name not in (".", "..") and not any(c in name for c in ("/", "\\", "\x00"))
+
+
+def _flush_and_crc32(mm: Optional[mmap.mmap]) -> int:
+    """把映射内存刷到磁盘并计算CRC32"""
+    if mm is None:
+        return zlib.crc32(b"")
+    mm.flush()
+    return zlib.crc32(mm)
+
+
+class TransferSender:
+    """
+    批量传输发送端
+
+    feed_frame 处理对端发来的传输层帧；send 发送一个文件并在接收端校验通过后返回。
+    发送端只在信用耗尽时等待，不等待逐块确认。
+    """
+
+    def __init__(self, protocol: Protocol, send: Callable[[bytes], Any], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT, stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES):
+        """
+        初始化发送端
+
+        参数:
+            protocol: 用于编码数据包的协议，需与接收端一致
+            send: 发送一个已编码数据包的函数，可以是普通函数或协程函数
+            chunk_size: 数据块长度（字节），加上帧头尾和5字节数据头后应不超过单次写入长度
+            timeout: 等待接受或结果的超时（秒）
+            stall_timeout: 等待信用的超时（秒），超时视为数据块丢失，提前提交以查询接收进度
+            retries: 接收进度连续没有推进时的最大重发次数
+        """
+        if not 0 < chunk_size <= MAX_DATA_LENGTH - _DATA_STRUCT.size:
+            raise ValueError(f"无效的数据块长度: {chunk_size}")
+        self.protocol = protocol
+        self.send_packet = send
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self._next_id = 0
+        self._replies: Dict[int, asyncio.Future] = {}  # 传输号 -> 等待接受/结果的Future
+        self._credits: Dict[int, int] = {}  # 传输号 -> 可用信用
+        self._acked: Dict[int, int] = {}  # 传输号 -> 接收端已连续接收的字节数
+        self._credit_event: Optional[asyncio.Event] = None
+
+        # 统计计数
+        self.bytes_sent = 0  # 发出的数据字节数（含重发）
+        self.chunks_sent = 0  # 发出的数据块数
+        self.credit_stalls = 0  # 信用耗尽而等待的次数
+        self.resent = 0  # 重发的字节数
+
+    def feed_frame(self, command_id: int, payload: bytes) -> bool:
+        """
+        输入一个已解码的帧
+
+        参数:
+            command_id: 命令ID
+            payload: 数据负载
+
+        返回:
+            bool: 是否为传输层帧，其他命令返回False由调用方继续处理
+        """
+        if command_id not in TRANSFER_COMMANDS:
+            return False
+        if not payload:
+            return True
+        transfer_id = payload[0]
+        if command_id == CMD_TRANSFER_CREDIT and len(payload) >= _CREDIT_STRUCT.size:
+            _, credits, received = _CREDIT_STRUCT.unpack_from(payload)
+            if transfer_id in self._credits:
+                self._credits[transfer_id] += credits
+                self._acked[transfer_id] = received
+                if self._credit_event is not None:
+                    self._credit_event.set()
+        elif command_id in (CMD_TRANSFER_ACCEPT, CMD_TRANSFER_RESULT, CMD_TRANSFER_ABORT):
+            future = self._replies.get(transfer_id)
+            if future is not None and not future.done():
+                future.set_result((command_id, bytes(payload)))
+        return True
+
+    async def _transmit(self, command_id: int, payload: Union[bytes, bytearray]) -> None:
+        """编码并发出一个数据包"""
+        result = self.send_packet(self.protocol.encode_packet(command_id, payload))
+        if inspect.isawaitable(result):
+            await result
+
+    async def _request(self, transfer_id: int, command_id: int, payload: bytes) -> bytes:
+        """发出开始/提交帧并等待对端的接受/结果帧，每 stall_timeout 秒没有回复时重发，直到 timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        future = self._replies[transfer_id] = loop.create_future()
+        try:
+            while True:
+                await self._transmit(command_id, payload)
+                try:
+                    reply_command, reply = await asyncio.wait_for(
+                        asyncio.shield(future), min(self.stall_timeout, max(deadline - loop.time(), 0)))
+                    break
+                except asyncio.TimeoutError:
+                    if loop.time() >= deadline:
+                        raise TransferError(f"等待接收端响应超时: 传输 {transfer_id}") from None
+        finally:
+            self._replies.pop(transfer_id, None)
+        if reply_command == CMD_TRANSFER_ABORT:
+            raise TransferError(f"接收端中止传输 {transfer_id}", STATUS_ABORTED)
+        return reply
+
+    async def _send_range(self, transfer_id: int, view: memoryview, offset: int) -> int:
+        """从 offset 开始按信用发出数据块，等待信用超时时提前返回，返回已发出到的偏移"""
+        chunk_size = self.chunk_size
+        header = _DATA_STRUCT.pack
+        size = len(view)
+        while offset < size:
+            while self._credits[transfer_id] <= 0:
+                self.credit_stalls += 1
+                self._credit_event.clear()
+                try:
+                    await asyncio.wait_for(self._credit_event.wait(), self.stall_timeout)
+                except asyncio.TimeoutError:
+                    logger.debug(f"传输 {transfer_id} 等待信用超时，提交以查询接收进度")
+                    return offset
+            self._credits[transfer_id] -= 1
+            end = min(offset + chunk_size, size)
+            await self._transmit(CMD_TRANSFER_DATA, header(transfer_id, offset) + view[offset:end])
+            self.chunks_sent += 1
+            self.bytes_sent += end - offset
+            offset = end
+        return offset
+
+    async def send(self, data: Union[bytes, bytearray, memoryview, mmap.mmap], name: str) -> Dict[str, int]:
+        """
+        发送一个文件
+
+        参数:
+            data: 文件内容
+            name: 接收端保存的文件名，含路径分隔符或NUL时接收端拒绝传输
+
+        返回:
+            Dict: 文件长度、续传起点、重发字节数和CRC32
+
+        异常:
+            TransferError: 被拒绝、超时、中止或校验失败
+        """
+        view = memoryview(data).cast("B")
+        try:
+            return await self._send_view(view, name)
+        finally:
+            # 异常的回溯会引用这里的视图，不释放时 send_file 关闭映射会抛出 BufferError 而掩盖原异常
+            view.release()
+
+    async def _send_view(self, view: memoryview, name: str) -> Dict[str, int]:
+        """按字节视图发送一个文件，见 send"""
+        size = len(view)
+        crc32 = zlib.crc32(view)
+        transfer_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFF
+        if self._credit_event is None:
+            self._credit_event = asyncio.Event()
+
+        init = _INIT_STRUCT.pack(transfer_id, size, crc32, self.chunk_size) + name.encode("utf-8")
+        reply = await self._request(transfer_id, CMD_TRANSFER_INIT, init)
+        _, status, offset, credits = _ACCEPT_STRUCT.unpack_from(reply)
+        if status != STATUS_OK:
+            raise TransferError(f"接收端拒绝传输 {name}: {STATUS_NAMES.get(status, status)}", status)
+        start = offset
+        self._credits[transfer_id] = credits
+        self._acked[transfer_id] = offset
+        resent = 0
+        attempts = 0  # 接收进度连续没有推进的次数
+        try:
+            while True:
+                offset = await self._send_range(transfer_id, view, offset)
+                reply = await self._request(transfer_id, CMD_TRANSFER_COMMIT, bytes((transfer_id,)))
+                _, status, received, _ = _RESULT_STRUCT.unpack_from(reply)
+                if status == STATUS_OK:
+                    break
+                attempts = attempts + 1 if received <= self._acked[transfer_id] else 0
+                if status != STATUS_INCOMPLETE or attempts > self.retries:
+                    raise TransferError(f"传输 {name} 失败: {STATUS_NAMES.get(status, status)}", status)
+                logger.info(f"传输 {name} 数据未收全，从 {received} 字节重发")
+                resent += offset - received
+                self.resent += offset - received
+                offset = self._acked[transfer_id] = received
+                self._credits[transfer_id] = credits  # 接收端在未收全时恢复整个窗口
+        finally:
+            self._credits.pop(transfer_id, None)
+            self._acked.pop(transfer_id, None)
+        return {"size": size, "resumed_from": start, "resent": resent, "crc32": crc32}
+
+    async def send_file(self, path: Union[str, os.PathLike], name: Optional[str] = None) -> Dict[str, int]:
+        """
+        发送一个磁盘文件，内容通过内存映射读取
+
+        参数:
+            path: 文件路径
+            name: 接收端保存的文件名，默认为路径的基本名
+
+        返回:
+            Dict: 见 send
+        """
+        name = name or os.path.basename(os.fspath(path))
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return await self.send(b"", name)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    return await self.send(view, name)
+                finally:
+                    view.release()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取发送端统计
+
+        返回:
+            Dict: 统计信息
+        """
+        return {
+            "bytes_sent": self.bytes_sent,
+            "chunks_sent": self.chunks_sent,
+            "credit_stalls": self.credit_stalls,
+            "resent": self.resent,
+        }